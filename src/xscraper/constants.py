@@ -21,6 +21,9 @@ mode_reverse_map: dict[ModeName, Mode] = {
     "Tower Control": "Lf",
 }
 
+# Page Constants
+pages = (1, 2, 3, 4, 5)
+
 # Season Constants
 current_season_path = ("xRanking", "currentSeason", "id")
 
@@ -1,21 +1,36 @@
 import datetime as dt
 import logging
-import time
+import os
+import sys
 
+import psycopg2
 import sentry_sdk
 from dotenv import load_dotenv
 from psycopg2.extensions import connection as Connection
 from splatnet3_scraper.query import QueryHandler
 
 import xscraper.variables as xv
+from xscraper.job.scheduler import RECHECK, RETRY, CycleScheduler
 from xscraper.job.utils import load_scrapers, setup_logger
-from xscraper.scraper.db import (
-    ensure_players_table_exists,
-    ensure_schedule_table_exists,
-    ensure_schema_exists,
-    get_db_connection,
+from xscraper.scraper.accounts import AccountPool
+from xscraper.scraper.archive import (
+    ResponseArchive,
+    enable_capture,
+    list_segments,
 )
+from xscraper.scraper.db import ensure_player_partitions
+from xscraper.scraper.export import ParquetExporter
+from xscraper.scraper.fingerprint import refresh_tracker
+from xscraper.scraper.interning import cache_stats
 from xscraper.scraper.main import scrape
+from xscraper.scraper.metrics import metrics, serve_metrics
+from xscraper.scraper.migrate import migrate
+from xscraper.scraper.pool import close_pool, get_pool
+from xscraper.scraper.ratelimit import RateLimitedQueryHandler
+from xscraper.scraper.replay import replay_segments
+from xscraper.scraper.rotations import rotation_calendar
+from xscraper.scraper.snapshot import latest_snapshots
+from xscraper.scraper.spool import PlayerSpool, disable_spool, enable_spool
 
 logger = logging.getLogger(__name__)
 
@@ -24,54 +39,99 @@ def job(conn: Connection | None = None) -> None:
     """The main job function that runs the scraping job.
 
     Args:
-        conn (Connection | None): The database connection to use. If None, a new
-            connection will be created. Defaults to None.
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool. Defaults to None.
     """
     logger.info("Starting the scraping job")
     load_dotenv()
+    archive_path = os.getenv("ARCHIVE_PATH")
+    if archive_path:
+        enable_capture(ResponseArchive(archive_path))
+    spool_path = os.getenv("SPOOL_PATH")
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        serve_metrics(int(metrics_port))
+    metrics_path = os.getenv("METRICS_PATH")
+    if conn is None:
+        logger.info("Opening the database connection pool")
+        get_pool().fill()
+    logger.info("Checking the database schema version")
+    if conn is None:
+        with get_pool().connection() as migrate_conn:
+            migrate(migrate_conn)
+    else:
+        migrate(conn)
+    logger.info("Warming the latest snapshot cache")
+    try:
+        if conn is None:
+            with get_pool().connection() as warm_conn:
+                latest_snapshots.warm(warm_conn)
+        else:
+            latest_snapshots.warm(conn)
+    except psycopg2.Error as e:
+        # Not fatal, every mode is loaded again on its first cycle
+        logger.warning("Failed to warm the latest snapshot cache: %s", e)
+        latest_snapshots.clear()
+    logger.info("Seeding the rotation calendar")
+    try:
+        if conn is None:
+            with get_pool().connection() as calendar_conn:
+                rotation_calendar.warm(calendar_conn)
+        else:
+            rotation_calendar.warm(conn)
+    except psycopg2.Error as e:
+        # Not fatal, the previous rotation is read again when it is needed
+        logger.warning("Failed to seed the rotation calendar: %s", e)
+    if spool_path:
+        # Started after the migrations, so pending segments are flushed into
+        # the current schema
+        enable_spool(PlayerSpool(spool_path))
     logger.info("Loading the scrapers")
     scrapers = load_scrapers()
     num_scrapers = len(scrapers)
     logger.info("Loaded %d scrapers", num_scrapers)
+    if xv.RATE_LIMIT_ENABLED:
+        logger.info("Wrapping the scrapers with rate limiters")
+        scrapers = [RateLimitedQueryHandler(scraper) for scraper in scrapers]
+
+    account_pool = None
+    if xv.SHARD_ACROSS_ACCOUNTS:
+        logger.info("Sharding every scrape cycle across all scrapers")
+        account_pool = AccountPool(scrapers)
 
-    def get_next_scraper(idx: int) -> QueryHandler:
+    def get_next_scraper(
+        idx: int,
+    ) -> QueryHandler | RateLimitedQueryHandler | AccountPool:
+        if account_pool is not None:
+            return account_pool
         logger.info("Loading scraper %d", idx % num_scrapers)
         return scrapers[idx % num_scrapers]
 
-    scrape_cadence = xv.SCRAPE_CADENCE.total_seconds() / 60
-    scrape_offset = xv.SCRAPE_OFFSET_MINUTES.total_seconds() / 60
+    scheduler = CycleScheduler()
     idx = 0
     failed_count = 0
+    rechecks_left = 0
     last_100_failures = [0] * xv.FAILURE_TRACKER_SIZE
     failure_threshold = int(
         xv.FAILURE_TRACKER_SIZE * xv.FAILURE_THRESHOLD_FLOAT
     )
     while True:
-        now = dt.datetime.now()
-        cadence_condition = now.minute % scrape_cadence == scrape_offset
-        if not cadence_condition and failed_count == 0:
-            logger.info("Cadence not met, sleeping for 60 seconds")
-            time.sleep(60 - now.second)
-            continue
-        elif not cadence_condition and failed_count < 2:
+        learned_offset = refresh_tracker.learned_offset(xv.SCRAPE_CADENCE)
+        if learned_offset is not None:
+            scheduler.offset = learned_offset
+        fire = scheduler.wait_next()
+        if fire.kind == RECHECK:
+            logger.info("Leaderboards were unchanged, checking again")
+            rechecks_left -= 1
+        elif fire.kind == RETRY:
             logger.info("Previous scrape failed, attempting again")
             sentry_sdk.capture_message(
                 "Previous scrape failed, attempting again. ",
                 level="warning",
             )
-        elif not cadence_condition and failed_count >= 2:
-            logger.error(
-                "Previous scrape failed too many times, sleeping for 60 seconds"
-            )
-            failed_count = 0
-            sentry_sdk.capture_message(
-                "Scrape failed too many times, skipping this scrape cycle. ",
-                level="error",
-            )
-            time.sleep(60)
-            continue
         else:
             logger.info("Cadence met, scraping")
+            failed_count = 0
 
         scraper = get_next_scraper(idx)
         idx += 1
@@ -79,7 +139,15 @@ def job(conn: Connection | None = None) -> None:
             idx = 0
         try:
             logger.info("Scraping with scraper %s", scraper)
-            scrape(scraper, conn)
+            with metrics.time("cycle"):
+                rows = scrape(scraper, conn)
+            metrics.inc("cycles")
+            if rows == 0 and fire.is_slot and xv.FINGERPRINT_ENABLED:
+                rechecks_left = xv.FINGERPRINT_MAX_RECHECKS
+            elif rows > 0:
+                rechecks_left = 0
+            if rechecks_left > 0:
+                scheduler.schedule_followup(RECHECK)
             failed_count = 0
             last_100_failures.pop(0)
             last_100_failures.append(0)
@@ -87,6 +155,7 @@ def job(conn: Connection | None = None) -> None:
             sentry_sdk.capture_message("Scraping successful. ", level="info")
         except Exception as e:
             logger.error("Scraping failed: %s", e)
+            metrics.inc("failed_cycles")
             failed_count += 1
             last_100_failures.pop(0)
             last_100_failures.append(1)
@@ -98,18 +167,44 @@ def job(conn: Connection | None = None) -> None:
                     "information."
                 )
                 raise RuntimeError("Failure rate too high")
+            if failed_count < 2:
+                scheduler.schedule_followup(RETRY)
+            else:
+                logger.error(
+                    "Scrape failed too many times, waiting for the next slot"
+                )
+                failed_count = 0
+                sentry_sdk.capture_message(
+                    "Scrape failed too many times, skipping this scrape "
+                    "cycle. ",
+                    level="error",
+                )
 
-        # Sleep until the next minute. It's done minute-by-minute to avoid
-        # any issues from extremely long delays.
-        time.sleep(60 - dt.datetime.now().second)
+        for i, limited in enumerate(scrapers):
+            if isinstance(limited, RateLimitedQueryHandler):
+                logger.info("Scraper %d counters: %s", i, limited.counters)
+        if metrics_path:
+            try:
+                metrics.write_textfile(metrics_path)
+            except OSError as e:
+                logger.error(
+                    "Failed to write metrics to %s: %s", metrics_path, e
+                )
+        for name, stats in cache_stats().items():
+            logger.info(
+                "Cache %s hit rate %.3f (%d entries)",
+                name,
+                stats["hit_rate"],
+                stats["size"],
+            )
 
 
 def job_with_logging(conn: Connection | None = None) -> None:
     """The main job function that runs the scraping job with logging.
 
     Args:
-        conn (Connection | None): The database connection to use. If None, a new
-            connection will be created. Defaults to None.
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool. Defaults to None.
     """
     setup_logger(
         xv.LOG_FILE_PATH,
@@ -123,6 +218,8 @@ def job_with_logging(conn: Connection | None = None) -> None:
         sentry_sdk.capture_exception(e)
         raise e
     finally:
+        disable_spool()
+        close_pool()
         logging.shutdown()
 
 
@@ -130,17 +227,70 @@ def setup_db(conn: Connection | None = None) -> None:
     """Sets up the database for the scraping job.
 
     Args:
-        conn (Connection | None): The database connection to use. If None, a new
-            connection will be created. Defaults to None.
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool. Defaults to None.
     """
     logger.info("Setting up the database")
     load_dotenv()
     if conn is None:
-        logger.debug("No database connection provided, creating a new one")
-        conn = get_db_connection()
-    ensure_schema_exists(conn)
-    ensure_players_table_exists(conn)
-    ensure_schedule_table_exists(conn)
+        logger.debug("No database connection provided, using the pool")
+        with get_pool().connection() as conn:
+            return setup_db(conn)
+    migrate(conn)
+    ensure_player_partitions(conn, dt.datetime.now(dt.timezone.utc))
+
+
+def replay(conn: Connection | None = None) -> None:
+    """Replays archived responses into the database.
+
+    The segments to replay are taken from the command line arguments. If none
+    are given, every segment in the directory set by the ``ARCHIVE_PATH``
+    environment variable is replayed.
+
+    Args:
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool. Defaults to None.
+
+    Raises:
+        ValueError: If no segments are given and ``ARCHIVE_PATH`` is not set.
+    """
+    load_dotenv()
+    paths = sys.argv[1:]
+    if not paths:
+        archive_path = os.getenv("ARCHIVE_PATH")
+        if not archive_path:
+            raise ValueError("No segments given and ARCHIVE_PATH is not set")
+        paths = list_segments(archive_path)
+    if conn is None:
+        logger.debug("No database connection provided, using the pool")
+        with get_pool().connection() as conn:
+            return replay(conn)
+    logger.info("Replaying %d archive segments", len(paths))
+    counts = replay_segments(paths, conn)
+    logger.info("Replay finished: %s", counts)
+
+
+def export(conn: Connection | None = None) -> None:
+    """Exports the cycles ingested since the last export to the Parquet
+    dataset in the directory set by the ``EXPORT_PATH`` environment variable.
+
+    Args:
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool. Defaults to None.
+
+    Raises:
+        ValueError: If ``EXPORT_PATH`` is not set.
+    """
+    load_dotenv()
+    export_path = os.getenv("EXPORT_PATH")
+    if not export_path:
+        raise ValueError("EXPORT_PATH is not set")
+    if conn is None:
+        logger.debug("No database connection provided, using the pool")
+        with get_pool().connection() as conn:
+            return export(conn)
+    rows = ParquetExporter(export_path).export(conn)
+    logger.info("Export finished: %d rows", rows)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+import datetime as dt
+import logging
+import math
+import time
+from typing import Callable, NamedTuple
+
+import xscraper.variables as xv
+from xscraper.scraper.metrics import metrics
+from xscraper.scraper.utils import round_down_nearest_rotation
+
+logger = logging.getLogger(__name__)
+
+ROTATION_LENGTH = dt.timedelta(hours=2)
+
+# The kinds of fire. Slots are the fires on the cadence, follow-ups are the
+# one-off fires scheduled by the job after a cycle.
+CADENCE = "cadence"
+CATCH_UP = "catch_up"
+RETRY = "retry"
+RECHECK = "recheck"
+
+
+def _utc_now() -> dt.datetime:
+    return dt.datetime.now(dt.timezone.utc)
+
+
+class Fire(NamedTuple):
+    scheduled: dt.datetime
+    kind: str
+    lateness: dt.timedelta
+
+    @property
+    def is_slot(self) -> bool:
+        """Whether the fire is a slot of the cadence, on time or caught up."""
+        return self.kind in (CADENCE, CATCH_UP)
+
+
+class CycleScheduler:
+    """Computes when the next scrape cycle is due and sleeps until then.
+
+    Slots are anchored on the rotation boundaries, at the offset into each
+    rotation and every cadence after it, so they line up with the upstream
+    refreshes whatever time the job was started. The wait is a single sleep
+    on the monotonic clock, which wall clock adjustments cannot stretch, and
+    the lateness of every fire is recorded.
+
+    A slot that passed more than ``misfire_grace`` ago, because the previous
+    cycle overran, is a missed slot and is counted. With the "catch_up"
+    policy the latest missed slot fires at once, however many were missed.
+    With the "skip" policy the missed slots are dropped and the next slot is
+    waited for. A follow-up, a retry or a recheck, fires on its own time
+    unless a slot comes first, which then replaces it.
+    """
+
+    def __init__(
+        self,
+        cadence: dt.timedelta | None = None,
+        offset: dt.timedelta | None = None,
+        misfire_policy: str | None = None,
+        misfire_grace: dt.timedelta | None = None,
+        followup_delay: dt.timedelta | None = None,
+        clock: Callable[[], dt.datetime] = _utc_now,
+        monotonic: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Initializes the scheduler. Any argument left as None falls back to
+        the corresponding ``SCRAPE_*`` or ``SCHEDULER_*`` variable.
+
+        Args:
+            cadence (dt.timedelta | None): The time between two slots.
+                Defaults to None.
+            offset (dt.timedelta | None): The time between a rotation
+                boundary and the first slot of the rotation. Defaults to None.
+            misfire_policy (str | None): Either "catch_up" or "skip". Defaults
+                to None.
+            misfire_grace (dt.timedelta | None): How late a slot may still
+                fire as on time. Defaults to None.
+            followup_delay (dt.timedelta | None): The time between the end of
+                a cycle and its retry or recheck. Defaults to None.
+            clock (Callable[[], dt.datetime]): Gets the current UTC time.
+                Defaults to the system clock.
+            monotonic (Callable[[], float]): Gets the monotonic time, in
+                seconds. Defaults to ``time.monotonic``.
+            sleep (Callable[[float], None]): Sleeps for the given number of
+                seconds. Defaults to ``time.sleep``.
+
+        Raises:
+            ValueError: If the misfire policy is not supported.
+        """
+        self.cadence = cadence or xv.SCRAPE_CADENCE
+        self.offset = offset if offset is not None else xv.SCRAPE_OFFSET_MINUTES
+        self.misfire_policy = misfire_policy or xv.SCHEDULER_MISFIRE_POLICY
+        if self.misfire_policy not in (CATCH_UP, "skip"):
+            raise ValueError(
+                f"Unsupported misfire policy {self.misfire_policy}"
+            )
+        self.misfire_grace = (
+            misfire_grace
+            if misfire_grace is not None
+            else xv.SCHEDULER_MISFIRE_GRACE
+        )
+        self.followup_delay = followup_delay or xv.SCHEDULER_FOLLOWUP_DELAY
+        self.clock = clock
+        self.monotonic = monotonic
+        self.sleep = sleep
+        self.last_slot: dt.datetime | None = None
+        self.followup: tuple[dt.datetime, str] | None = None
+
+    def next_slot(
+        self, timestamp: dt.datetime, inclusive: bool = False
+    ) -> dt.datetime:
+        """Finds the first slot after the given time.
+
+        Args:
+            timestamp (dt.datetime): The time, in UTC.
+            inclusive (bool): Whether a slot at exactly the given time counts.
+                Defaults to False.
+
+        Returns:
+            dt.datetime: The slot.
+        """
+        offset = self.offset % self.cadence
+        # The first slot of the rotation the time falls in
+        anchor = round_down_nearest_rotation(timestamp - offset) + offset
+        steps = (timestamp - anchor) / self.cadence
+        steps = math.ceil(steps) if inclusive else math.floor(steps) + 1
+        return min(anchor + steps * self.cadence, anchor + ROTATION_LENGTH)
+
+    def next_fire(self) -> tuple[dt.datetime, str]:
+        """Works out the next fire, counting the slots that were missed.
+
+        Returns:
+            tuple[dt.datetime, str]: The time of the fire and its kind.
+        """
+        now = self.clock()
+        cutoff = now - self.misfire_grace
+        if self.last_slot is None:
+            slot = self.next_slot(cutoff, inclusive=True)
+            missed: list[dt.datetime] = []
+        else:
+            slot = self.next_slot(self.last_slot)
+            missed = []
+            while slot < cutoff:
+                missed.append(slot)
+                slot = self.next_slot(slot)
+        if missed:
+            metrics.inc("scheduler_missed_slots", len(missed))
+            logger.warning(
+                "Missed %d slots since %s, policy is %s",
+                len(missed),
+                missed[0],
+                self.misfire_policy,
+            )
+            if self.misfire_policy == CATCH_UP and slot > now:
+                return missed[-1], CATCH_UP
+
+        if self.followup is not None and self.followup[0] < slot:
+            return self.followup
+        return slot, CADENCE
+
+    def wait(self, fire_time: dt.datetime) -> dt.timedelta:
+        """Sleeps until the given time.
+
+        Args:
+            fire_time (dt.datetime): The time to wake up at, in UTC.
+
+        Returns:
+            dt.timedelta: How late the wake up was.
+        """
+        delay = (fire_time - self.clock()).total_seconds()
+        if delay > 0:
+            deadline = self.monotonic() + delay
+            remaining = delay
+            while remaining > 0:
+                self.sleep(remaining)
+                remaining = deadline - self.monotonic()
+        return max(self.clock() - fire_time, dt.timedelta(0))
+
+    def wait_next(self) -> Fire:
+        """Sleeps until the next fire.
+
+        Returns:
+            Fire: The fire, with its lateness.
+        """
+        scheduled, kind = self.next_fire()
+        metrics.set_gauge("next_fire_timestamp_seconds", scheduled.timestamp())
+        logger.info("Next %s fire at %s", kind, scheduled)
+        lateness = self.wait(scheduled)
+        if kind in (CADENCE, CATCH_UP):
+            self.last_slot = scheduled
+        self.followup = None
+
+        seconds = lateness.total_seconds()
+        metrics.observe("fire_lateness", seconds)
+        metrics.set_gauge("fire_lateness_seconds", seconds)
+        logger.info("Firing %s for %s, %.3fs late", kind, scheduled, seconds)
+        return Fire(scheduled, kind, lateness)
+
+    def schedule_followup(self, kind: str) -> None:
+        """Schedules a retry or a recheck ``followup_delay`` from now.
+
+        Args:
+            kind (str): Either "retry" or "recheck".
+        """
+        self.followup = (self.clock() + self.followup_delay, kind)
@@ -0,0 +1,178 @@
+import argparse
+import logging
+import math
+import time
+from typing import Sequence, TypedDict
+
+from splatnet3_scraper.query import QueryHandler
+
+from xscraper import constants as xc
+from xscraper.loadtest.fake import FakeQueryHandler, lognormal_latency
+from xscraper.scraper.accounts import AccountPool
+from xscraper.scraper.cache import season_cache
+from xscraper.scraper.ratelimit import RateLimitedQueryHandler
+from xscraper.scraper.scrape import scrape_all_players_in_mode
+from xscraper.types import Mode
+
+logger = logging.getLogger(__name__)
+
+
+class LoadTestReport(TypedDict):
+    cycles: int
+    requests: int
+    throttled: int
+    errors: int
+    rows: int
+    failed_cycles: int
+    wall_seconds: float
+    requests_per_second: float
+    rows_per_second: float
+    cycle_seconds_mean: float
+    cycle_seconds_max: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Calculates a percentile using the nearest-rank method.
+
+    Args:
+        values (Sequence[float]): The values.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0.0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_load_test(
+    scraper: QueryHandler | RateLimitedQueryHandler | AccountPool,
+    fakes: Sequence[FakeQueryHandler],
+    cycles: int = 5,
+    modes: Sequence[Mode] = ("Ar",),
+    max_workers: int | None = None,
+) -> LoadTestReport:
+    """Runs scrape cycles against fake handlers and reports the throughput and
+    latency observed.
+
+    Args:
+        scraper (QueryHandler | RateLimitedQueryHandler | AccountPool): The
+            scraper to crawl with, built on top of the fake handlers.
+        fakes (Sequence[FakeQueryHandler]): The fake handlers behind the
+            scraper, used to collect the request statistics.
+        cycles (int): The number of cycles to run. Defaults to 5.
+        modes (Sequence[Mode]): The modes to scrape in each cycle. Two modes
+            mimic the overlap window after a rotation. Defaults to ("Ar",).
+        max_workers (int | None): The maximum number of requests in flight. If
+            None, the limit of the scraper is used. Defaults to None.
+
+    Returns:
+        LoadTestReport: The load test report.
+    """
+    for fake in fakes:
+        fake.reset_stats()
+    season_cache.invalidate()
+
+    cycle_seconds = []
+    rows = 0
+    failed_cycles = 0
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        cycle_start = time.perf_counter()
+        try:
+            for mode in modes:
+                rows += len(
+                    scrape_all_players_in_mode(
+                        scraper, mode, max_workers=max_workers
+                    )
+                )
+        except Exception as e:
+            logger.error("Cycle %d failed: %s", cycle, e)
+            failed_cycles += 1
+        cycle_seconds.append(time.perf_counter() - cycle_start)
+    wall_seconds = time.perf_counter() - start
+
+    latencies = [latency for fake in fakes for latency in fake.latencies]
+    requests = sum(fake.counts.get("requests", 0) for fake in fakes)
+    return LoadTestReport(
+        cycles=cycles,
+        requests=requests,
+        throttled=sum(fake.counts.get("throttled", 0) for fake in fakes),
+        errors=sum(fake.counts.get("errors", 0) for fake in fakes),
+        rows=rows,
+        failed_cycles=failed_cycles,
+        wall_seconds=wall_seconds,
+        requests_per_second=requests / wall_seconds if wall_seconds else 0.0,
+        rows_per_second=rows / wall_seconds if wall_seconds else 0.0,
+        cycle_seconds_mean=sum(cycle_seconds) / len(cycle_seconds),
+        cycle_seconds_max=max(cycle_seconds),
+        latency_p50=percentile(latencies, 50),
+        latency_p95=percentile(latencies, 95),
+        latency_p99=percentile(latencies, 99),
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Command line entry point for the load test driver.
+
+    Args:
+        argv (Sequence[str] | None): The command line arguments. If None, the
+            arguments are read from ``sys.argv``. Defaults to None.
+    """
+    parser = argparse.ArgumentParser(
+        description="Load test the scrape path against a fake SplatNet."
+    )
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["Ar"], choices=xc.modes)
+    parser.add_argument("--accounts", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, default=None)
+    parser.add_argument("--latency-median", type=float, default=0.3)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--no-rate-limit",
+        action="store_true",
+        help="Do not wrap the fake accounts with rate limiters.",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    fakes = [
+        FakeQueryHandler(
+            latency=lognormal_latency(args.latency_median, args.latency_sigma),
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            seed=None if args.seed is None else args.seed + i,
+        )
+        for i in range(args.accounts)
+    ]
+    accounts = (
+        fakes
+        if args.no_rate_limit
+        else [RateLimitedQueryHandler(fake) for fake in fakes]
+    )
+    scraper = accounts[0] if len(accounts) == 1 else AccountPool(accounts)
+    report = run_load_test(
+        scraper,
+        fakes,
+        cycles=args.cycles,
+        modes=args.modes,
+        max_workers=args.max_workers,
+    )
+    for key, value in report.items():
+        if isinstance(value, float):
+            print(f"{key:>20}: {value:.3f}")
+        else:
+            print(f"{key:>20}: {value}")
+
+
+if __name__ == "__main__":
+    main()
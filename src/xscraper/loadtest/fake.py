@@ -0,0 +1,382 @@
+import base64
+import datetime as dt
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from typing import Callable
+
+import pytz
+import requests
+from splatnet3_scraper.query import QueryResponse
+
+from xscraper import constants as xc
+from xscraper.scraper.utils import round_down_nearest_rotation
+from xscraper.types import Mode, Region
+
+logger = logging.getLogger(__name__)
+
+LatencyModel = Callable[[random.Random], float]
+
+region_letters: dict[Region, str] = {
+    "ATLANTIC": "A",
+    "PACIFIC": "P",
+}
+
+stages = (
+    (1, "Scorch Gorge"),
+    (2, "Eeltail Alley"),
+    (3, "Hagglefish Market"),
+    (4, "Undertow Spillway"),
+    (6, "Mincemeat Metalworks"),
+    (10, "MakoMart"),
+    (11, "Wahoo World"),
+    (12, "Flounder Heights"),
+)
+
+
+def constant_latency(seconds: float) -> LatencyModel:
+    """Builds a latency model that always returns the same latency.
+
+    Args:
+        seconds (float): The latency in seconds.
+
+    Returns:
+        LatencyModel: The latency model.
+    """
+    return lambda rng: seconds
+
+
+def lognormal_latency(median: float, sigma: float = 0.5) -> LatencyModel:
+    """Builds a log-normal latency model, which has the long right tail that
+    real API latencies tend to have.
+
+    Args:
+        median (float): The median latency in seconds.
+        sigma (float): The standard deviation of the underlying normal
+            distribution. Larger values give a heavier tail. Defaults to 0.5.
+
+    Returns:
+        LatencyModel: The latency model.
+    """
+    mu = math.log(median) if median > 0 else 0.0
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+def encode_id(string: str) -> str:
+    """Base64 encodes an ID the same way SplatNet does.
+
+    Args:
+        string (str): The ID to encode.
+
+    Returns:
+        str: The encoded ID.
+    """
+    return base64.b64encode(string.encode("utf-8")).decode("utf-8")
+
+
+class FakeHTTPError(requests.HTTPError):
+    """An HTTP error raised by the fake handler, carrying a response with the
+    injected status code so it is classified like a real one.
+    """
+
+    def __init__(self, status_code: int) -> None:
+        """Initializes the error.
+
+        Args:
+            status_code (int): The status code of the failed response.
+        """
+        response = requests.Response()
+        response.status_code = status_code
+        super().__init__(
+            f"SplatNet responded with status {status_code}", response=response
+        )
+
+
+class FakeQueryHandler:
+    """A drop-in stand-in for ``QueryHandler`` that answers the queries the
+    scraper sends with realistic payloads, without any network access.
+
+    ``XRankingQuery`` returns a season ID per region, ``StageScheduleQuery``
+    returns two-hour rotations starting at the current rotation, and the
+    ``DetailTabViewXRanking%sRefetchQuery`` queries return pages of players
+    split into cursor-linked chunks. Latency is drawn from a configurable
+    model, and server errors and 429 responses can be injected at given rates.
+    """
+
+    def __init__(
+        self,
+        latency: LatencyModel | None = None,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        page_size: int = 100,
+        chunk_size: int = 25,
+        season_number: int = 5,
+        x_power_drift: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        """Initializes the fake handler.
+
+        Args:
+            latency (LatencyModel | None): The model the latency of each request
+                is drawn from. If None, requests are answered instantly.
+                Defaults to None.
+            error_rate (float): The fraction of requests that fail with a 500.
+                Defaults to 0.0.
+            throttle_rate (float): The fraction of requests that fail with a
+                429. Defaults to 0.0.
+            page_size (int): The number of players per page. Defaults to 100.
+            chunk_size (int): The number of players per cursor-linked chunk of
+                a page. Defaults to 25.
+            season_number (int): The number used in the season IDs. Defaults
+                to 5.
+            x_power_drift (float): The fraction of players whose x_power changes
+                between two pulls of the same page. Defaults to 0.0.
+            seed (int | None): The seed for the random number generator.
+                Defaults to None.
+        """
+        self.latency = latency or constant_latency(0.0)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size
+        self.chunk_size = chunk_size
+        self.season_number = season_number
+        self.x_power_drift = x_power_drift
+        self.latencies: list[float] = []
+        self.counts: dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._pulls: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def season_id(self, region: Region) -> str:
+        """Gets the season ID the fake reports for a region.
+
+        Args:
+            region (Region): The region.
+
+        Returns:
+            str: The encoded season ID.
+        """
+        return encode_id(
+            f"XRankingSeason-{region_letters[region]}:{self.season_number}"
+        )
+
+    def reset_stats(self) -> None:
+        """Clears the recorded latencies and request counts."""
+        with self._lock:
+            self.latencies = []
+            self.counts = {}
+
+    def _count(self, key: str) -> None:
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def query(
+        self, query_name: str, variables: dict | None = None
+    ) -> QueryResponse:
+        """Answers a query after a simulated delay.
+
+        Args:
+            query_name (str): The name of the query.
+            variables (dict | None): The variables of the query. If None, the
+                query has no variables. Defaults to None.
+
+        Raises:
+            FakeHTTPError: If an error or a 429 is injected.
+            ValueError: If the query is not one the fake knows about.
+
+        Returns:
+            QueryResponse: The response to the query.
+        """
+        if variables is None:
+            variables = {}
+        with self._lock:
+            latency = self.latency(self._rng)
+            roll = self._rng.random()
+        time.sleep(latency)
+        with self._lock:
+            self.latencies.append(latency)
+            self._count("requests")
+            if roll < self.throttle_rate:
+                self._count("throttled")
+                raise FakeHTTPError(429)
+            if roll < self.throttle_rate + self.error_rate:
+                self._count("errors")
+                raise FakeHTTPError(500)
+
+        if query_name == xc.query:
+            return self.season_response(variables["region"])
+        if query_name == xc.schedule_query:
+            return self.schedule_response()
+        for mode in xc.modes:
+            if query_name == xc.detailed_x_query % mode:
+                return self.detailed_response(variables)
+        raise ValueError(f"Unknown query {query_name}")
+
+    def season_response(self, region: Region) -> QueryResponse:
+        """Builds the ``XRankingQuery`` response for a region.
+
+        Args:
+            region (Region): The region.
+
+        Returns:
+            QueryResponse: The response.
+        """
+        return QueryResponse(
+            {
+                "xRanking": {
+                    "currentSeason": {
+                        "id": self.season_id(region),
+                        "name": f"Season {self.season_number}",
+                    }
+                }
+            }
+        )
+
+    def schedule_response(self, rotations: int = 12) -> QueryResponse:
+        """Builds the ``StageScheduleQuery`` response, starting at the current
+        rotation.
+
+        Args:
+            rotations (int): The number of rotations to list. Defaults to 12.
+
+        Returns:
+            QueryResponse: The response.
+        """
+        start = round_down_nearest_rotation(
+            dt.datetime.now(pytz.timezone("UTC"))
+        )
+        nodes = []
+        for i in range(rotations):
+            rotation_start = start + dt.timedelta(hours=2 * i)
+            index = rotation_start.hour // 2 + rotation_start.toordinal()
+            mode = xc.modes[index % len(xc.modes)]
+            stage_1 = stages[index % len(stages)]
+            stage_2 = stages[(index + 3) % len(stages)]
+            nodes.append(
+                {
+                    "startTime": rotation_start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "endTime": (
+                        rotation_start + dt.timedelta(hours=2)
+                    ).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "xMatchSetting": {
+                        "vsRule": {"name": xc.mode_map[mode], "rule": mode},
+                        "vsStages": [
+                            {"vsStageId": stage_1[0], "name": stage_1[1]},
+                            {"vsStageId": stage_2[0], "name": stage_2[1]},
+                        ],
+                    },
+                }
+            )
+        return QueryResponse({"xSchedules": {"nodes": nodes}})
+
+    def player_node(
+        self, region: Region, mode: Mode, rank: int, pull: int
+    ) -> dict:
+        """Builds a single player node.
+
+        Args:
+            region (Region): The region of the leaderboard.
+            mode (Mode): The mode of the leaderboard.
+            rank (int): The rank of the player.
+            pull (int): How many times this page has been pulled before, used
+                to drift the x_power of some players.
+
+        Returns:
+            dict: The player node.
+        """
+        digest = hashlib.sha1(f"{region}:{rank}".encode("utf-8")).hexdigest()
+        player_hash = int(digest[:8], 16)
+        x_power = round(4000 - rank * 1.5, 1)
+        if pull and (player_hash % 1000) < self.x_power_drift * 1000:
+            x_power = round(x_power + (pull % 7) * 0.3, 1)
+        badges = [
+            (
+                {"id": encode_id(f"Badge-{(player_hash >> i) % 5000000}")}
+                if (player_hash >> i) % 3
+                else None
+            )
+            for i in (0, 4, 8)
+        ]
+        return {
+            "id": encode_id(
+                f"XRankingPlayer-{region_letters[region].lower()}"
+                f":{self.season_number}:{mode}:u-{digest[:20]}"
+            ),
+            "name": f"Player{player_hash % 10000}",
+            "nameId": f"{player_hash % 10000:04d}",
+            "rank": rank,
+            "xPower": x_power,
+            "byname": "Fresh Fake Splatter",
+            "weapon": {
+                "id": encode_id(f"Weapon-{(player_hash % 40) * 10}"),
+                "name": "Splattershot",
+            },
+            "nameplate": {
+                "badges": badges,
+                "background": {
+                    "id": encode_id(
+                        f"NameplateBackground-{player_hash % 1200}"
+                    ),
+                    "textColor": {
+                        "r": (player_hash % 256) / 255,
+                        "g": ((player_hash >> 8) % 256) / 255,
+                        "b": ((player_hash >> 16) % 256) / 255,
+                        "a": 1.0,
+                    },
+                },
+            },
+        }
+
+    def detailed_response(self, variables: dict) -> QueryResponse:
+        """Builds a chunk of a leaderboard page.
+
+        Args:
+            variables (dict): The variables of the detailed query.
+
+        Returns:
+            QueryResponse: The response. The node is None if the season ID is
+                not one the fake knows about.
+        """
+        season_id = variables["id"]
+        mode = variables["mode"]
+        page = variables["page"]
+        cursor = variables.get("cursor")
+        regions = [
+            region
+            for region in xc.regions
+            if self.season_id(region) == season_id
+        ]
+        if not regions:
+            return QueryResponse({"node": None})
+        region = regions[0]
+
+        chunk = int(cursor) if cursor else 0
+        chunks = self.page_size // self.chunk_size
+        with self._lock:
+            key = (region, mode, page, chunk)
+            pull = self._pulls.get(key, 0)
+            self._pulls[key] = pull + 1
+
+        first_rank = (page - 1) * self.page_size + chunk * self.chunk_size + 1
+        edges = [
+            {"node": self.player_node(region, mode, rank, pull)}
+            for rank in range(first_rank, first_rank + self.chunk_size)
+        ]
+        has_next_page = chunk + 1 < chunks
+        return QueryResponse(
+            {
+                "node": {
+                    "__typename": "XRankingSeason",
+                    "id": season_id,
+                    f"xRanking{mode}": {
+                        "edges": edges,
+                        "pageInfo": {
+                            "endCursor": str(chunk + 1),
+                            "hasNextPage": has_next_page,
+                        },
+                    },
+                }
+            }
+        )
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Hashable, NamedTuple
+
+import xscraper.variables as xv
+from xscraper import constants as xc
+from xscraper.scraper.metrics import metrics
+from xscraper.sql.query import (
+    SELECT_CUTOFFS_QUERY,
+    SELECT_LATEST_CYCLE_QUERY,
+    SELECT_LEADERBOARD_QUERY,
+    SELECT_PLAYER_HISTORY_QUERY,
+    SELECT_WEAPON_USAGE_QUERY,
+)
+from xscraper.types import Mode, Region
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LeaderboardEntry(NamedTuple):
+    player_id: str
+    name: str
+    name_id: str
+    rank: int
+    x_power: float
+    weapon_id: int
+    nameplate_id: int | None
+    byname: str | None
+    text_color: str | None
+    badge_left_id: int | None
+    badge_center_id: int | None
+    badge_right_id: int | None
+    timestamp: dt.datetime
+    mode: str
+    region: bool
+    rotation_start: dt.datetime | None
+    season_number: int | None
+    updated: bool
+
+
+class Cutoff(NamedTuple):
+    rank: int
+    x_power: float
+
+
+class HistoryPoint(NamedTuple):
+    timestamp: dt.datetime
+    mode: str
+    region: bool
+    rank: int
+    x_power: float
+    weapon_id: int
+
+
+class WeaponUsage(NamedTuple):
+    rotation_start: dt.datetime | None
+    weapon_id: int
+    players: int
+
+
+class QueryCache:
+    """Caches the results of the read queries until a new cycle is ingested,
+    so dashboards polling between two cycles never reach the database.
+
+    Each result is stored along with the generation it was read in, the
+    timestamp of the latest ingested cycle. The generation is read from the
+    database at most once per check interval. When it moves, every cached
+    result is dropped at once.
+    """
+
+    def __init__(
+        self,
+        check_interval: dt.timedelta | None = None,
+        max_entries: int | None = None,
+    ) -> None:
+        """Initializes an empty cache.
+
+        Args:
+            check_interval (dt.timedelta | None): How long a generation is
+                trusted before it is read again. If None,
+                ``QUERY_CACHE_CHECK_INTERVAL`` is used. Defaults to None.
+            max_entries (int | None): The number of results to keep. When it
+                is exceeded the cache is emptied. If None,
+                ``QUERY_CACHE_MAX_ENTRIES`` is used. Defaults to None.
+        """
+        self.check_interval = (
+            check_interval
+            if check_interval is not None
+            else xv.QUERY_CACHE_CHECK_INTERVAL
+        ).total_seconds()
+        self.max_entries = max_entries or xv.QUERY_CACHE_MAX_ENTRIES
+        self.results: dict[Hashable, Any] = {}
+        self.generation: dt.datetime | None = None
+        self.checked_at: float | None = None
+        self._lock = threading.Lock()
+
+    def refresh(self, conn: Connection) -> None:
+        """Reads the generation from the database if the check interval has
+        passed, and drops every result if it moved.
+
+        Args:
+            conn (Connection): The database connection to use.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self.checked_at is not None
+                and now - self.checked_at < self.check_interval
+            ):
+                return
+        with conn.cursor() as cursor:
+            cursor.execute(SELECT_LATEST_CYCLE_QUERY)
+            generation = cursor.fetchone()[0]
+        with self._lock:
+            self.checked_at = now
+            if generation != self.generation:
+                logger.debug(
+                    "New cycle %s, dropping cached results", generation
+                )
+                self.generation = generation
+                self.results = {}
+
+    def get(
+        self, conn: Connection, key: Hashable, load: Callable[[], Any]
+    ) -> Any:
+        """Gets a cached result, loading it if it is missing or stale.
+
+        Args:
+            conn (Connection): The database connection to use.
+            key (Hashable): The query and its arguments.
+            load (Callable[[], Any]): Reads the result from the database.
+
+        Returns:
+            Any: The result.
+        """
+        self.refresh(conn)
+        with self._lock:
+            result = self.results.get(key, _MISSING)
+        if result is not _MISSING:
+            metrics.inc("query_cache_hits")
+            return result
+        metrics.inc("query_cache_misses")
+        result = load()
+        with self._lock:
+            if len(self.results) >= self.max_entries:
+                self.results = {}
+            self.results[key] = result
+        return result
+
+    def clear(self) -> None:
+        """Empties the cache and forgets the generation."""
+        with self._lock:
+            self.results = {}
+            self.generation = None
+            self.checked_at = None
+
+
+query_cache = QueryCache()
+
+
+def _fetch(conn: Connection, query: str, params: tuple) -> list[tuple]:
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def _as_of(timestamp: dt.datetime | None) -> dt.datetime:
+    return timestamp or dt.datetime.now(dt.timezone.utc)
+
+
+def top_players(
+    conn: Connection,
+    mode: Mode,
+    region: Region,
+    limit: int = 100,
+    timestamp: dt.datetime | None = None,
+) -> tuple[LeaderboardEntry, ...]:
+    """Gets the top of the leaderboard of a mode and region.
+
+    Args:
+        conn (Connection): The database connection to use.
+        mode (Mode): The mode.
+        region (Region): The region.
+        limit (int): The lowest rank to include. Defaults to 100.
+        timestamp (dt.datetime | None): The point in time to read the
+            leaderboard at. If None, the latest leaderboard is read. Defaults
+            to None.
+
+    Returns:
+        tuple[LeaderboardEntry, ...]: The players, in rank order.
+    """
+    params = (
+        xc.mode_map[mode],
+        xc.region_map_bool[region],
+        _as_of(timestamp),
+        limit,
+    )
+
+    def load() -> tuple[LeaderboardEntry, ...]:
+        rows = _fetch(conn, SELECT_LEADERBOARD_QUERY, params)
+        return tuple(LeaderboardEntry(*row) for row in rows)
+
+    if timestamp is None:
+        return query_cache.get(conn, ("top_players", *params[:2], limit), load)
+    return query_cache.get(conn, ("top_players", *params), load)
+
+
+def cutoffs(
+    conn: Connection,
+    mode: Mode,
+    region: Region,
+    ranks: tuple[int, ...] = (10, 100, 500),
+    timestamp: dt.datetime | None = None,
+) -> tuple[Cutoff, ...]:
+    """Gets the x_power needed to reach each of the given ranks.
+
+    Args:
+        conn (Connection): The database connection to use.
+        mode (Mode): The mode.
+        region (Region): The region.
+        ranks (tuple[int, ...]): The ranks. Defaults to (10, 100, 500).
+        timestamp (dt.datetime | None): The point in time to read the
+            leaderboard at. If None, the latest leaderboard is read. Defaults
+            to None.
+
+    Returns:
+        tuple[Cutoff, ...]: The lowest x_power at or above each rank, in rank
+            order.
+    """
+    ranks = tuple(sorted(set(ranks)))
+    params = (
+        xc.mode_map[mode],
+        xc.region_map_bool[region],
+        _as_of(timestamp),
+        list(ranks),
+    )
+
+    def load() -> tuple[Cutoff, ...]:
+        rows = _fetch(conn, SELECT_CUTOFFS_QUERY, params)
+        return tuple(Cutoff(*row) for row in rows)
+
+    key = ("cutoffs", *params[:2], ranks)
+    if timestamp is not None:
+        key += (timestamp,)
+    return query_cache.get(conn, key, load)
+
+
+def player_history(
+    conn: Connection,
+    player_id: str,
+    since: dt.datetime,
+    until: dt.datetime | None = None,
+    mode: Mode | None = None,
+) -> tuple[HistoryPoint, ...]:
+    """Gets the x_power history of a player.
+
+    Args:
+        conn (Connection): The database connection to use.
+        player_id (str): The ID of the player.
+        since (dt.datetime): The start of the time range.
+        until (dt.datetime | None): The end of the time range, excluded. If
+            None, the history runs up to now. Defaults to None.
+        mode (Mode | None): The mode to restrict the history to. If None,
+            every mode is included. Defaults to None.
+
+    Returns:
+        tuple[HistoryPoint, ...]: The stored rows of the player, oldest
+            first. With changes-only storage there is one row for each change
+            rather than one for each cycle.
+    """
+    mode_name = xc.mode_map[mode] if mode is not None else None
+    params = (player_id, since, _as_of(until), mode_name, mode_name)
+
+    def load() -> tuple[HistoryPoint, ...]:
+        rows = _fetch(conn, SELECT_PLAYER_HISTORY_QUERY, params)
+        return tuple(HistoryPoint(*row) for row in rows)
+
+    return query_cache.get(
+        conn, ("player_history", player_id, since, until, mode), load
+    )
+
+
+def weapon_usage(
+    conn: Connection,
+    mode: Mode,
+    region: Region,
+    since: dt.datetime,
+    until: dt.datetime | None = None,
+) -> tuple[WeaponUsage, ...]:
+    """Gets how many players on the leaderboard used each weapon, for each
+    rotation in a time range. Every player of every leaderboard is counted,
+    with the weapon of their latest stored row, so the counts are the same
+    whether rows were stored in full or as changes only.
+
+    Args:
+        conn (Connection): The database connection to use.
+        mode (Mode): The mode.
+        region (Region): The region.
+        since (dt.datetime): The start of the time range.
+        until (dt.datetime | None): The end of the time range, excluded. If
+            None, the range runs up to now. Defaults to None.
+
+    Returns:
+        tuple[WeaponUsage, ...]: The number of distinct players per weapon,
+            by rotation, most used first.
+    """
+    params = (
+        xc.mode_map[mode],
+        xc.region_map_bool[region],
+        since,
+        _as_of(until),
+    )
+
+    def load() -> tuple[WeaponUsage, ...]:
+        rows = _fetch(conn, SELECT_WEAPON_USAGE_QUERY, params)
+        return tuple(WeaponUsage(*row) for row in rows)
+
+    return query_cache.get(
+        conn, ("weapon_usage", mode, region, since, until), load
+    )
@@ -14,6 +14,7 @@ from sqlalchemy.dialects import postgresql as sql
 from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
 
+from xscraper.scraper.interning import intern_string
 from xscraper.sql import Player as PlayerTable
 from xscraper.sql import Schedule as ScheduleTable
 from xscraper.types import Mode, ModeName, Player, Region, RegionName, Schedule
@@ -243,12 +244,16 @@ class XRankScraper:
             name_id=data["nameId"],
             rank=data["rank"],
             x_power=data["xPower"],
-            weapon=data["weapon", "name"],
-            weapon_id=data["weapon", "id"],
-            weapon_sub=data["weapon", "subWeapon", "name"],
-            weapon_sub_id=data["weapon", "subWeapon", "id"],
-            weapon_special=data["weapon", "specialWeapon", "name"],
-            weapon_special_id=data["weapon", "specialWeapon", "id"],
+            weapon=intern_string(data["weapon", "name"]),
+            weapon_id=intern_string(data["weapon", "id"]),
+            weapon_sub=intern_string(data["weapon", "subWeapon", "name"]),
+            weapon_sub_id=intern_string(data["weapon", "subWeapon", "id"]),
+            weapon_special=intern_string(
+                data["weapon", "specialWeapon", "name"]
+            ),
+            weapon_special_id=intern_string(
+                data["weapon", "specialWeapon", "id"]
+            ),
         )
 
     def parse_players_in_mode(
@@ -0,0 +1,169 @@
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import ContextManager, Iterator
+
+from splatnet3_scraper.query import QueryHandler, QueryResponse
+
+import xscraper.variables as xv
+from xscraper.scraper.ratelimit import RateLimitedQueryHandler
+
+logger = logging.getLogger(__name__)
+
+
+class AccountPool:
+    """Spreads queries over several accounts at once.
+
+    Every account keeps its own ``QueryHandler``, and therefore its own tokens
+    and session, and has its own limit on the number of requests in flight. If
+    the account is a ``RateLimitedQueryHandler``, its adaptive concurrency limit
+    is used instead of the fixed one. A checkout hands out the account with the
+    most free slots, blocking until one is available. The pool can be used
+    anywhere a ``QueryHandler`` is expected, in which case every query is a
+    separate checkout.
+    """
+
+    def __init__(
+        self,
+        scrapers: list[QueryHandler | RateLimitedQueryHandler],
+        max_workers_per_account: int | None = None,
+    ) -> None:
+        """Initializes the pool.
+
+        Args:
+            scrapers (list[QueryHandler | RateLimitedQueryHandler]): The query
+                handlers, one per account.
+            max_workers_per_account (int | None): The maximum number of
+                requests in flight per account. If None,
+                ``ACCOUNT_MAX_WORKERS`` is used. Defaults to None.
+
+        Raises:
+            ValueError: If no scrapers are given.
+        """
+        if not scrapers:
+            raise ValueError("At least one scraper is required")
+        if max_workers_per_account is None:
+            max_workers_per_account = xv.ACCOUNT_MAX_WORKERS
+        self.scrapers = scrapers
+        self.max_workers_per_account = max_workers_per_account
+        self._in_flight = [0] * len(scrapers)
+        self._condition = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.scrapers)
+
+    def __repr__(self) -> str:
+        return f"AccountPool({len(self.scrapers)} accounts)"
+
+    @property
+    def max_workers(self) -> int:
+        """The most requests the pool can ever allow in flight."""
+        return sum(
+            (
+                scraper.concurrency.maximum
+                if isinstance(scraper, RateLimitedQueryHandler)
+                else self.max_workers_per_account
+            )
+            for scraper in self.scrapers
+        )
+
+    @property
+    def counters(self) -> list[dict[str, float]]:
+        """The counters of every rate limited account, in account order."""
+        return [
+            scraper.counters
+            for scraper in self.scrapers
+            if isinstance(scraper, RateLimitedQueryHandler)
+        ]
+
+    def _limit(self, idx: int) -> int:
+        scraper = self.scrapers[idx]
+        if isinstance(scraper, RateLimitedQueryHandler):
+            return scraper.concurrency_limit
+        return self.max_workers_per_account
+
+    def _free_slots(self, idx: int) -> int:
+        return self._limit(idx) - self._in_flight[idx]
+
+    @contextmanager
+    def checkout(self) -> Iterator[QueryHandler | RateLimitedQueryHandler]:
+        """Checks out the account with the most free slots for the duration of
+        the context, blocking until an account has a free slot.
+
+        Yields:
+            QueryHandler | RateLimitedQueryHandler: The query handler of the
+                checked out account.
+        """
+        with self._condition:
+            while True:
+                idx = max(range(len(self.scrapers)), key=self._free_slots)
+                if self._free_slots(idx) > 0:
+                    break
+                self._condition.wait()
+            self._in_flight[idx] += 1
+        logger.debug("Checked out account %d", idx)
+        try:
+            yield self.scrapers[idx]
+        finally:
+            with self._condition:
+                self._in_flight[idx] -= 1
+                self._condition.notify()
+
+    def query(
+        self, query_name: str, variables: dict | None = None
+    ) -> QueryResponse:
+        """Runs a single query on the account with the most free slots.
+
+        Args:
+            query_name (str): The name of the query to run.
+            variables (dict | None): The variables to use in the query. If
+                None, the query is run without variables. Defaults to None.
+
+        Returns:
+            QueryResponse: The response from the query.
+        """
+        if variables is None:
+            variables = {}
+        with self.checkout() as scraper:
+            return scraper.query(query_name, variables=variables)
+
+
+def checkout(
+    scraper: QueryHandler | AccountPool,
+) -> ContextManager[QueryHandler]:
+    """Checks out a single account from the given scraper, so that a chain of
+    dependent queries stays on one account.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper to check out from. A
+            plain ``QueryHandler`` is handed back as is.
+
+    Returns:
+        ContextManager[QueryHandler]: A context manager yielding the query
+            handler to use.
+    """
+    if isinstance(scraper, AccountPool):
+        return scraper.checkout()
+    return nullcontext(scraper)
+
+
+def max_workers_for(
+    scraper: QueryHandler | AccountPool, max_workers: int | None = None
+) -> int:
+    """Resolves the number of workers to crawl with for the given scraper.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper to crawl with.
+        max_workers (int | None): An explicit number of workers. If None, the
+            pool's total limit is used for an ``AccountPool`` and
+            ``CRAWL_MAX_WORKERS`` for a single ``QueryHandler``. Defaults to
+            None.
+
+    Returns:
+        int: The number of workers to crawl with.
+    """
+    if max_workers is not None:
+        return max_workers
+    if isinstance(scraper, AccountPool):
+        return scraper.max_workers
+    return xv.CRAWL_MAX_WORKERS
@@ -0,0 +1,341 @@
+import datetime as dt
+import gzip
+import io
+import json
+import logging
+import pathlib
+import threading
+from typing import IO, Any, Iterable, Iterator
+
+import pytz
+from splatnet3_scraper.query import QueryResponse
+
+import xscraper.variables as xv
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "responses-"
+SEGMENT_SUFFIXES = {
+    "gzip": ".jsonl.gz",
+    "zstd": ".jsonl.zst",
+}
+
+
+def loads(line: str) -> Any:
+    """Decodes a JSON line, with orjson if it is installed.
+
+    Args:
+        line (str): The JSON line.
+
+    Raises:
+        json.JSONDecodeError: If the line is not valid JSON.
+
+    Returns:
+        Any: The decoded value.
+    """
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def dumps(value: Any) -> str:
+    """Encodes a value as compact JSON, with orjson if it is installed.
+
+    Args:
+        value (Any): The value to encode.
+
+    Returns:
+        str: The JSON string.
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"))
+
+
+def open_segment(path: str | pathlib.Path, mode: str = "rt") -> IO[str]:
+    """Opens a compressed JSONL segment as a text stream, picking the codec
+    from the file extension.
+
+    Args:
+        path (str | pathlib.Path): The path to the segment.
+        mode (str): Either "rt" to read or "at" to append. Defaults to "rt".
+
+    Raises:
+        RuntimeError: If the segment is zstd compressed but the zstandard
+            package is not installed.
+
+    Returns:
+        IO[str]: The text stream.
+    """
+    path = pathlib.Path(path)
+    if path.name.endswith(SEGMENT_SUFFIXES["zstd"]):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to open %s" % path)
+        binary_mode = mode.replace("t", "b")
+        return io.TextIOWrapper(
+            zstandard.open(path, binary_mode), encoding="utf-8"
+        )
+    return gzip.open(path, mode, encoding="utf-8")
+
+
+def list_segments(directory: str | pathlib.Path) -> list[pathlib.Path]:
+    """Lists the segments in an archive directory, oldest first.
+
+    Args:
+        directory (str | pathlib.Path): The archive directory.
+
+    Returns:
+        list[pathlib.Path]: The paths to the segments.
+    """
+    paths = [
+        path
+        for suffix in SEGMENT_SUFFIXES.values()
+        for path in pathlib.Path(directory).glob(f"{SEGMENT_PREFIX}*{suffix}")
+    ]
+    return sorted(paths, key=lambda path: path.name)
+
+
+def read_segments(
+    paths: Iterable[str | pathlib.Path],
+) -> Iterator[dict[str, Any]]:
+    """Reads the records from the given segments, in order.
+
+    A truncated last line, as left behind by a crash, is skipped with a
+    warning.
+
+    Args:
+        paths (Iterable[str | pathlib.Path]): The paths to the segments.
+
+    Yields:
+        dict[str, Any]: The archived records.
+    """
+    for path in paths:
+        logger.info("Reading archive segment %s", path)
+        with open_segment(path) as f:
+            try:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(
+                            "Skipping a truncated record in %s", path
+                        )
+            except EOFError:
+                logger.warning("Segment %s ends early", path)
+
+
+class ResponseArchive:
+    """Appends raw query responses to rotating compressed JSONL segments.
+
+    Each record holds the query name, its variables, the time the response was
+    captured, the cycle timestamp the response belongs to, the region of the
+    leaderboard if the query is for one, whether the response was only pulled
+    to probe the leaderboard and the raw response data. A segment is closed
+    and a new one started once it holds more than ``max_segment_bytes`` of
+    uncompressed JSON or is older than ``max_segment_age``.
+    """
+
+    def __init__(
+        self,
+        directory: str | pathlib.Path,
+        compression: str | None = None,
+        max_segment_bytes: int | None = None,
+        max_segment_age: dt.timedelta | None = None,
+    ) -> None:
+        """Initializes the archive. Any argument left as None falls back to the
+        corresponding ``ARCHIVE_*`` variable.
+
+        Args:
+            directory (str | pathlib.Path): The directory to write segments to.
+            compression (str | None): Either "zstd" or "gzip". If zstd is
+                requested but zstandard is not installed, gzip is used instead.
+                Defaults to None.
+            max_segment_bytes (int | None): The uncompressed size at which a
+                segment is rotated. Defaults to None.
+            max_segment_age (dt.timedelta | None): The age at which a segment
+                is rotated. Defaults to None.
+
+        Raises:
+            ValueError: If the compression is not supported.
+        """
+        compression = compression or xv.ARCHIVE_COMPRESSION
+        if compression not in SEGMENT_SUFFIXES:
+            raise ValueError(f"Unsupported compression {compression}")
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, falling back to gzip")
+            compression = "gzip"
+
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compression = compression
+        self.max_segment_bytes = (
+            max_segment_bytes or xv.ARCHIVE_SEGMENT_MAX_BYTES
+        )
+        self.max_segment_age = max_segment_age or xv.ARCHIVE_SEGMENT_MAX_AGE
+        self.cycle: dt.datetime | None = None
+        self._segment: IO[str] | None = None
+        self._segment_path: pathlib.Path | None = None
+        self._segment_bytes = 0
+        self._segment_opened: dt.datetime | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _now() -> dt.datetime:
+        return dt.datetime.now(pytz.timezone("UTC"))
+
+    @property
+    def segment_path(self) -> pathlib.Path | None:
+        """The path to the segment currently being written, if any."""
+        return self._segment_path
+
+    def _open_segment(self) -> None:
+        now = self._now()
+        name = (
+            SEGMENT_PREFIX
+            + now.strftime("%Y%m%dT%H%M%S%f")
+            + SEGMENT_SUFFIXES[self.compression]
+        )
+        self._segment_path = self.directory / name
+        logger.info("Opening archive segment %s", self._segment_path)
+        self._segment = open_segment(self._segment_path, "at")
+        self._segment_bytes = 0
+        self._segment_opened = now
+
+    def _close_segment(self) -> None:
+        if self._segment is None:
+            return
+        logger.info("Closing archive segment %s", self._segment_path)
+        self._segment.close()
+        self._segment = None
+        self._segment_path = None
+
+    def _should_rotate(self) -> bool:
+        if self._segment is None:
+            return False
+        return (
+            self._segment_bytes >= self.max_segment_bytes
+            or self._now() - self._segment_opened >= self.max_segment_age
+        )
+
+    def record(
+        self,
+        query_name: str,
+        variables: dict,
+        response: QueryResponse,
+        region: str | None = None,
+        probe: bool = False,
+    ) -> None:
+        """Appends a response to the current segment.
+
+        Args:
+            query_name (str): The name of the query that was run.
+            variables (dict): The variables the query was run with.
+            response (QueryResponse): The response to archive.
+            region (str | None): The region of the leaderboard the response
+                is for, if any. Defaults to None.
+            probe (bool): Whether the response was only pulled to probe the
+                leaderboard for changes, and is not part of the players
+                stored for the cycle. Defaults to False.
+        """
+        line = dumps(
+            {
+                "query": query_name,
+                "variables": variables,
+                "timestamp": self._now().isoformat(),
+                "cycle": self.cycle.isoformat() if self.cycle else None,
+                "region": region,
+                "probe": probe,
+                "data": response.data,
+            }
+        )
+        with self._lock:
+            if self._should_rotate():
+                self._close_segment()
+            if self._segment is None:
+                self._open_segment()
+            self._segment.write(line + "\n")
+            self._segment_bytes += len(line) + 1
+
+    def flush(self) -> None:
+        """Flushes the current segment to disk."""
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+
+    def close(self) -> None:
+        """Closes the current segment."""
+        with self._lock:
+            self._close_segment()
+
+
+_active_archive: ResponseArchive | None = None
+
+
+def enable_capture(archive: ResponseArchive) -> None:
+    """Starts archiving every response captured by the scrape functions.
+
+    Args:
+        archive (ResponseArchive): The archive to write to.
+    """
+    global _active_archive
+    logger.info("Capturing raw responses to %s", archive.directory)
+    _active_archive = archive
+
+
+def disable_capture() -> None:
+    """Stops archiving responses and closes the active archive."""
+    global _active_archive
+    if _active_archive is not None:
+        _active_archive.close()
+    _active_archive = None
+
+
+def begin_capture_cycle(timestamp: dt.datetime) -> None:
+    """Marks the start of a scrape cycle, so the responses captured from now on
+    are tagged with its timestamp.
+
+    Args:
+        timestamp (dt.datetime): The timestamp of the cycle.
+    """
+    if _active_archive is not None:
+        _active_archive.flush()
+        _active_archive.cycle = timestamp
+
+
+def capture(
+    query_name: str,
+    variables: dict,
+    response: QueryResponse,
+    region: str | None = None,
+    probe: bool = False,
+) -> None:
+    """Archives a response if capturing is enabled.
+
+    Args:
+        query_name (str): The name of the query that was run.
+        variables (dict): The variables the query was run with.
+        response (QueryResponse): The response to archive.
+        region (str | None): The region of the leaderboard the response is
+            for, if any. Defaults to None.
+        probe (bool): Whether the response was only pulled to probe the
+            leaderboard for changes. Defaults to False.
+    """
+    if _active_archive is None:
+        return
+    try:
+        _active_archive.record(query_name, variables, response, region, probe)
+    except Exception as e:
+        # Archiving is best effort and must never fail a scrape
+        logger.error("Failed to archive %s response: %s", query_name, e)
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import datetime as dt
+from array import array
+from itertools import repeat
+from typing import Any, Iterable, Iterator, Sequence
+
+import pyarrow as pa
+
+from xscraper import constants as xc
+from xscraper.types import Mode, ModeName, Player, Region
+
+# The per-row columns of a batch, in the order the parser produces them
+PLAYER_COLUMNS = (
+    "id",
+    "name",
+    "name_id",
+    "rank",
+    "x_power",
+    "weapon_id",
+    "nameplate_id",
+    "byname",
+    "text_color",
+    "badge_left_id",
+    "badge_center_id",
+    "badge_right_id",
+)
+
+# Numeric columns that can never be null are kept in typed arrays
+_TYPED_COLUMNS = {
+    "rank": "l",
+    "x_power": "d",
+    "weapon_id": "l",
+    "nameplate_id": "l",
+}
+
+ARROW_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("name", pa.string()),
+        ("name_id", pa.string()),
+        ("rank", pa.int32()),
+        ("x_power", pa.float64()),
+        ("weapon_id", pa.int32()),
+        ("nameplate_id", pa.int32()),
+        ("byname", pa.string()),
+        ("text_color", pa.string()),
+        ("badge_left_id", pa.int32()),
+        ("badge_center_id", pa.int32()),
+        ("badge_right_id", pa.int32()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("mode", pa.string()),
+        ("region", pa.bool_()),
+        ("rotation_start", pa.timestamp("us", tz="UTC")),
+        ("season_number", pa.int16()),
+        ("updated", pa.bool_()),
+    ]
+)
+
+
+class PlayerBatch:
+    """A columnar batch of players from a single region and mode.
+
+    The per-row fields are stored one column per field, the numeric ones in
+    typed arrays, instead of one dict per player. The fields that are the
+    same for every player of a scrape, such as the timestamp, region, mode and
+    season, are stored once on the batch. Rows are only materialized when they
+    are written to the database, or as a pyarrow Table with ``to_arrow``.
+    """
+
+    def __init__(self, mode: Mode | None = None) -> None:
+        """Initializes an empty batch.
+
+        Args:
+            mode (Mode | None): The mode the players were scraped from.
+                Defaults to None.
+        """
+        self.columns: dict[str, Any] = {
+            name: array(_TYPED_COLUMNS[name]) if name in _TYPED_COLUMNS else []
+            for name in PLAYER_COLUMNS
+        }
+        self._appenders = tuple(
+            self.columns[name].append for name in PLAYER_COLUMNS
+        )
+        self.updated: list[bool] | None = None
+        self.timestamp: dt.datetime | None = None
+        self.region: Region | None = None
+        self.mode: Mode | None = mode
+        self.rotation_start: dt.datetime | None = None
+        self.season_number: int | None = None
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+    def append_row(self, row: Sequence[Any]) -> None:
+        """Appends a parsed player row.
+
+        Args:
+            row (Sequence[Any]): The values of the row, in the order of
+                ``PLAYER_COLUMNS``.
+        """
+        for append, value in zip(self._appenders, row):
+            append(value)
+
+    def enrich(
+        self,
+        timestamp: dt.datetime,
+        region: Region,
+        rotation_start: dt.datetime,
+        season_number: int,
+        latest_x_power: dict[str, float],
+    ) -> None:
+        """Sets the cycle level fields once for the whole batch and computes
+        the ``updated`` column.
+
+        Args:
+            timestamp (dt.datetime): The timestamp of the cycle.
+            region (Region): The region the players were scraped from.
+            rotation_start (dt.datetime): The start of the current rotation.
+            season_number (int): The current season number.
+            latest_x_power (dict[str, float]): The x_power of each player in the
+                latest stored snapshot of the mode, used to compute
+                ``updated``.
+        """
+        self.timestamp = timestamp
+        self.region = region
+        self.rotation_start = rotation_start
+        self.season_number = season_number
+        get = latest_x_power.get
+        self.updated = [
+            get(player_id) != x_power
+            for player_id, x_power in zip(
+                self.columns["id"], self.columns["x_power"]
+            )
+        ]
+
+    @property
+    def mode_name(self) -> ModeName:
+        """The name of the mode, as stored in the database."""
+        return xc.mode_map[self.mode]
+
+    @property
+    def region_bool(self) -> bool:
+        """The region, as stored in the database."""
+        return xc.region_map_bool[self.region]
+
+    def x_powers(self) -> dict[str, float]:
+        """Maps the ID of each player in the batch to their x_power.
+
+        Returns:
+            dict[str, float]: The x_power of each player.
+        """
+        return dict(zip(self.columns["id"], self.columns["x_power"]))
+
+    def rows(self) -> Iterator[tuple]:
+        """Iterates over the rows of an enriched batch in the order of
+        ``PLAYER_KEYS``, as taken by ``write_player_rows``.
+
+        Returns:
+            Iterator[tuple]: The values of each row.
+        """
+        c = self.columns
+        return zip(
+            c["id"],
+            c["name"],
+            c["name_id"],
+            c["rank"],
+            c["x_power"],
+            c["weapon_id"],
+            c["nameplate_id"],
+            c["byname"],
+            c["text_color"],
+            c["badge_left_id"],
+            c["badge_center_id"],
+            c["badge_right_id"],
+            repeat(self.timestamp),
+            repeat(self.mode_name),
+            repeat(self.region_bool),
+            repeat(self.rotation_start),
+            repeat(self.season_number),
+            self.updated,
+        )
+
+    def to_players(self) -> list[Player]:
+        """Converts the batch back to a list of Player objects. Before the
+        batch is enriched, ``mode`` holds the mode as given to the parser and
+        the cycle level fields are left out.
+
+        Returns:
+            list[Player]: The players in the batch.
+        """
+        scalars: dict[str, Any] = {}
+        if self.timestamp is None:
+            scalars["mode"] = self.mode
+        else:
+            scalars["mode"] = self.mode_name
+            scalars["timestamp"] = self.timestamp
+            scalars["region"] = self.region_bool
+            scalars["rotation_start"] = self.rotation_start
+            scalars["season_number"] = self.season_number
+        players = []
+        for i, values in enumerate(
+            zip(*(self.columns[name] for name in PLAYER_COLUMNS))
+        ):
+            player: Player = dict(zip(PLAYER_COLUMNS, values))
+            player.update(scalars)
+            if self.updated is not None:
+                player["updated"] = self.updated[i]
+            players.append(player)
+        return players
+
+    def to_arrow(self) -> pa.Table:
+        """Converts an enriched batch to a pyarrow Table, with the batch level
+        fields expanded to full columns.
+
+        Returns:
+            pa.Table: The players in the batch.
+        """
+        n = len(self)
+        timestamp_type = ARROW_SCHEMA.field("timestamp").type
+        arrays = [
+            pa.array(self.columns[name], type=ARROW_SCHEMA.field(name).type)
+            for name in PLAYER_COLUMNS
+        ]
+        arrays += [
+            pa.array([self.timestamp] * n, type=timestamp_type),
+            pa.array([self.mode_name] * n, type=pa.string()),
+            pa.array([self.region_bool] * n, type=pa.bool_()),
+            pa.array([self.rotation_start] * n, type=timestamp_type),
+            pa.array([self.season_number] * n, type=pa.int16()),
+            pa.array(self.updated, type=pa.bool_()),
+        ]
+        return pa.Table.from_arrays(arrays, schema=ARROW_SCHEMA)
+
+
+def batches_to_arrow(batches: Iterable[PlayerBatch]) -> pa.Table:
+    """Concatenates enriched batches into a single pyarrow Table.
+
+    Args:
+        batches (Iterable[PlayerBatch]): The batches.
+
+    Returns:
+        pa.Table: The players in every batch.
+    """
+    tables = [batch.to_arrow() for batch in batches]
+    if not tables:
+        return ARROW_SCHEMA.empty_table()
+    return pa.concat_tables(tables)
@@ -0,0 +1,138 @@
+import datetime as dt
+import logging
+import threading
+from typing import Callable, NamedTuple
+
+import pytz
+
+import xscraper.variables as xv
+from xscraper.scraper.utils import calculate_season_number
+from xscraper.types import Region
+
+logger = logging.getLogger(__name__)
+
+
+class SeasonEntry(NamedTuple):
+    season_id: str
+    season_number: int
+    expires_at: dt.datetime
+
+
+class SeasonCache:
+    """Caches the current season ID for each region.
+
+    An entry expires after the configured TTL, or as soon as the season number
+    calculated from the current time no longer matches the season number the
+    entry was fetched in, whichever comes first. Lookups for the same region are
+    serialized so that concurrent misses only send a single query upstream.
+    """
+
+    def __init__(self, ttl: dt.timedelta | None = None) -> None:
+        """Initializes the cache.
+
+        Args:
+            ttl (dt.timedelta | None): How long an entry stays valid. If None,
+                ``SEASON_CACHE_TTL`` is used. Defaults to None.
+        """
+        self.ttl = ttl if ttl is not None else xv.SEASON_CACHE_TTL
+        self._entries: dict[Region, SeasonEntry] = {}
+        self._locks: dict[Region, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _now() -> dt.datetime:
+        return dt.datetime.now(pytz.timezone("UTC"))
+
+    def _region_lock(self, region: Region) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(region, threading.Lock())
+
+    def get(self, region: Region) -> str | None:
+        """Gets the cached season ID for the given region.
+
+        Args:
+            region (Region): The region to get the season ID for.
+
+        Returns:
+            str | None: The cached season ID, or None if there is no valid
+                entry for the region.
+        """
+        now = self._now()
+        entry = self._entries.get(region)
+        if entry is None:
+            return None
+        if (
+            now >= entry.expires_at
+            or calculate_season_number(now) != entry.season_number
+        ):
+            logger.info("Season cache entry for %s expired", region)
+            self._entries.pop(region, None)
+            return None
+        return entry.season_id
+
+    def set(self, region: Region, season_id: str) -> None:
+        """Stores the season ID for the given region.
+
+        Args:
+            region (Region): The region the season ID belongs to.
+            season_id (str): The season ID.
+        """
+        now = self._now()
+        self._entries[region] = SeasonEntry(
+            season_id=season_id,
+            season_number=calculate_season_number(now),
+            expires_at=now + self.ttl,
+        )
+
+    def get_or_fetch(
+        self, region: Region, fetch: Callable[[Region], str]
+    ) -> str:
+        """Gets the cached season ID for the given region, fetching and
+        caching it if there is no valid entry.
+
+        Args:
+            region (Region): The region to get the season ID for.
+            fetch (Callable[[Region], str]): The function used to fetch the
+                season ID on a miss.
+
+        Returns:
+            str: The season ID for the region.
+        """
+        with self._region_lock(region):
+            season_id = self.get(region)
+            if season_id is not None:
+                logger.debug("Season cache hit for %s", region)
+                return season_id
+            logger.debug("Season cache miss for %s", region)
+            season_id = fetch(region)
+            self.set(region, season_id)
+            return season_id
+
+    def invalidate(
+        self, region: Region | None = None, season_id: str | None = None
+    ) -> None:
+        """Invalidates cached season IDs.
+
+        Args:
+            region (Region | None): The region to invalidate. If None, every
+                region is invalidated. Defaults to None.
+            season_id (str | None): If given, the entry is only invalidated if
+                it still holds this season ID, so that an entry that has
+                already been refreshed is left alone. Defaults to None.
+        """
+        if region is None:
+            logger.info("Invalidating the season cache for all regions")
+            self._entries.clear()
+            return
+
+        with self._region_lock(region):
+            entry = self._entries.get(region)
+            if entry is None:
+                return
+            if season_id is not None and entry.season_id != season_id:
+                return
+            logger.info("Invalidating the season cache for %s", region)
+            self._entries.pop(region, None)
+
+
+season_cache = SeasonCache()
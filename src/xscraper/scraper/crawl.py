@@ -0,0 +1,43 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, TypeVar
+
+import xscraper.variables as xv
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def run_concurrently(
+    tasks: Iterable[Callable[[], T]],
+    max_workers: int | None = None,
+) -> list[T]:
+    """Runs the given tasks on a bounded thread pool and returns their results
+    in the same order as the tasks were given.
+
+    The scraping work is almost entirely network bound, so threads are enough
+    to overlap the round trips. If any task raises, the exception is propagated
+    to the caller once the remaining tasks have finished.
+
+    Args:
+        tasks (Iterable[Callable[[], T]]): The zero-argument callables to run.
+        max_workers (int | None): The maximum number of tasks to run at the
+            same time. If None, ``CRAWL_MAX_WORKERS`` is used. Defaults to None.
+
+    Returns:
+        list[T]: The results of the tasks, in the order the tasks were given.
+    """
+    tasks = list(tasks)
+    if max_workers is None:
+        max_workers = xv.CRAWL_MAX_WORKERS
+    max_workers = max(1, min(max_workers, len(tasks)))
+    if max_workers == 1:
+        return [task() for task in tasks]
+
+    logger.debug("Running %d tasks with %d workers", len(tasks), max_workers)
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="xscraper-crawl"
+    ) as executor:
+        futures = [executor.submit(task) for task in tasks]
+        return [future.result() for future in futures]
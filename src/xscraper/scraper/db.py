@@ -1,36 +1,82 @@
 from __future__ import annotations
 
+import datetime as dt
+import io
 import logging
 import os
-from typing import TYPE_CHECKING
+from itertools import chain
+from operator import itemgetter
+from typing import TYPE_CHECKING, Any, Iterable, Sequence
 
 import psycopg2
 from psycopg2.extras import execute_values
 
-from xscraper.sql.ensure import (
-    CREATE_MODE_ENUM_QUERY,
-    ENSURE_PLAYER_INDEX_QUERIES,
-    ENSURE_PLAYER_TABLE_QUERY,
-    ENSURE_SCHEDULE_TABLE_QUERY,
-    ENSURE_SCHEMA_QUERY,
-    ENSURE_TRGM_EXTENSION_QUERY,
+import xscraper.variables as xv
+from xscraper.scraper.metrics import metrics
+from xscraper.scraper.profiles import player_profiles
+from xscraper.sql.ensure import ENSURE_PLAYER_PARTITIONS_QUERY
+from xscraper.sql.insert import (
+    COPY_PLAYER_STAGING_QUERY,
+    COPY_SCHEDULE_STAGING_QUERY,
+    COUNT_UNCHANGED_PLAYER_STAGING_QUERY,
+    CREATE_PLAYER_STAGING_QUERY,
+    CREATE_SCHEDULE_STAGING_QUERY,
+    INSERT_PLAYER_QUERY,
+    INSERT_SCHEDULE_QUERY,
+    MERGE_CHANGED_PLAYER_STAGING_QUERY,
+    MERGE_LEADERBOARD_SNAPSHOT_STAGING_QUERY,
+    MERGE_PLAYER_STAGING_QUERY,
+    MERGE_PLAYERS_LATEST_STAGING_QUERY,
+    MERGE_SCHEDULE_STAGING_QUERY,
+    TRUNCATE_PLAYER_STAGING_QUERY,
+    TRUNCATE_SCHEDULE_STAGING_QUERY,
+    UPSERT_LEADERBOARD_SNAPSHOT_QUERY,
+    UPSERT_PLAYERS_LATEST_QUERY,
 )
-from xscraper.sql.functions import FUNCTION_SPLASHTAG_QUERY
-from xscraper.sql.insert import INSERT_PLAYER_QUERY, INSERT_SCHEDULE_QUERY
 from xscraper.sql.select import (
     SELECT_CURRENT_SCHEDULE_QUERY,
     SELECT_LATEST_PLAYER_QUERY,
+    SELECT_LATEST_TIMESTAMP_FOR_MODE_QUERY,
     SELECT_MAX_TIMESTAMP_AND_MODE_QUERY,
+    SELECT_PLAYERS_AS_OF_QUERY,
     SELECT_PREVIOUS_SCHEDULE_QUERY,
 )
-from xscraper.sql.triggers import TRIGGER_SPLASHTAG_QUERY
 from xscraper.types import Player, Schedule
 
 if TYPE_CHECKING:
     from psycopg2.extensions import connection as Connection
+    from psycopg2.extensions import cursor as Cursor
+
+    from xscraper.scraper.batch import PlayerBatch
 
 logger = logging.getLogger(__name__)
 
+# The keys of a Player, in the order of the rows passed to write_player_rows
+PLAYER_KEYS = (
+    "id",
+    "name",
+    "name_id",
+    "rank",
+    "x_power",
+    "weapon_id",
+    "nameplate_id",
+    "byname",
+    "text_color",
+    "badge_left_id",
+    "badge_center_id",
+    "badge_right_id",
+    "timestamp",
+    "mode",
+    "region",
+    "rotation_start",
+    "season_number",
+    "updated",
+)
+
+_copy_escapes = str.maketrans(
+    {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+)
+
 
 def get_db_credentials() -> dict[str, str]:
     """Get the database credentials from the environment variables.
@@ -69,41 +115,391 @@ def get_db_connection(**kwargs) -> Connection:
     return psycopg2.connect(**get_db_credentials(), **kwargs)
 
 
-def insert_players(conn: Connection, players: list[Player]) -> None:
-    """Insert the given players into the database.
+# The range of timestamps known to have a players partition
+_player_partitions: tuple[dt.datetime, dt.datetime] | None = None
+
+
+def ensure_player_partitions(conn: Connection, timestamp: dt.datetime) -> None:
+    """Ensure that the players table has partitions from the month of the
+    given timestamp through ``PLAYER_PARTITIONS_AHEAD`` months after it, so
+    inserts never hit a missing partition. The covered range is remembered,
+    so the database is only asked again when the timestamp leaves it, about
+    once a month.
+
+    Args:
+        conn (Connection): The database connection to use. It must not be in
+            the middle of a transaction, since the partitions are committed
+            straight away.
+        timestamp (dt.datetime): The timestamp of the rows about to be
+            inserted.
+    """
+    global _player_partitions
+    end = timestamp + dt.timedelta(days=31 * xv.PLAYER_PARTITIONS_AHEAD)
+    if _player_partitions is not None:
+        covered_start, covered_end = _player_partitions
+        if covered_start <= timestamp and end < covered_end:
+            return
+        timestamp = min(timestamp, covered_start)
+        end = max(end, covered_end)
+
+    logger.info("Ensuring the players partitions up to %s", end)
+    with conn.cursor() as cursor:
+        cursor.execute(ENSURE_PLAYER_PARTITIONS_QUERY, (timestamp, end))
+        covered_end = cursor.fetchone()[0]
+    conn.commit()
+    metrics.inc("partition_checks")
+    _player_partitions = (timestamp, covered_end)
+
+
+def record_insert(rows: int, inserted: int) -> None:
+    """Records how many of the rows sent in an insert were written, and how
+    many were dropped by ``ON CONFLICT DO NOTHING``.
+
+    Args:
+        rows (int): The number of rows sent.
+        inserted (int): The number of rows written, as reported by the cursor.
+            The whole insert must run as a single statement for this to cover
+            every row.
+    """
+    metrics.inc("rows", rows)
+    if inserted >= 0:
+        metrics.inc("rows_inserted", inserted)
+        metrics.inc("conflicts", rows - inserted)
+
+
+def format_copy_value(value: Any) -> str:
+    """Formats a value as a field of the ``COPY`` text format.
+
+    Args:
+        value (Any): The value to format.
+
+    Returns:
+        str: The formatted field.
+    """
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, str):
+        return value.translate(_copy_escapes)
+    if isinstance(value, dt.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class CopyStream(io.TextIOBase):
+    """A read-only text stream that encodes rows in the ``COPY`` text format
+    as they are read, so that ``copy_expert`` can stream them to the server
+    without the whole payload being built in memory first.
+    """
+
+    def __init__(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Initializes the stream.
+
+        Args:
+            rows (Iterable[Sequence[Any]]): The rows to encode.
+        """
+        self._lines = (
+            "\t".join(map(format_copy_value, row)) + "\n" for row in rows
+        )
+        self._buffer = ""
+        self.rows = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int | None = -1) -> str:
+        """Reads up to ``size`` characters of encoded rows.
+
+        Args:
+            size (int | None): The maximum number of characters to read. If
+                negative or None, every remaining row is read. Defaults to -1.
+
+        Returns:
+            str: The encoded rows, or an empty string once every row was read.
+        """
+        if size is None or size < 0:
+            size = -1
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self.rows += 1
+            chunks.append(line)
+            length += len(line)
+        data = "".join(chunks)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_merge(
+    cursor: Cursor,
+    create_query: str,
+    truncate_query: str,
+    copy_query: str,
+    merge_query: str,
+    rows: Iterable[Sequence[Any]],
+) -> tuple[int, int]:
+    """Streams rows into a staging table with ``COPY`` and merges them into
+    their table with a single set based statement.
+
+    Args:
+        cursor (Cursor): The cursor to use.
+        create_query (str): The query that creates the staging table.
+        truncate_query (str): The query that empties the staging table.
+        copy_query (str): The ``COPY ... FROM STDIN`` query for the staging
+            table.
+        merge_query (str): The query that moves the staged rows into their
+            table.
+        rows (Iterable[Sequence[Any]]): The rows to ingest.
+
+    Returns:
+        tuple[int, int]: The number of rows sent and the number of rows the
+            merge wrote.
+    """
+    cursor.execute(create_query)
+    cursor.execute(truncate_query)
+    stream = CopyStream(rows)
+    cursor.copy_expert(copy_query, stream)
+    cursor.execute(merge_query)
+    return stream.rows, cursor.rowcount
+
+
+def player_values(players: Iterable[Player]) -> list[tuple]:
+    """Converts players to rows in the order of ``PLAYER_KEYS``.
+
+    Args:
+        players (Iterable[Player]): The players.
+
+    Returns:
+        list[tuple]: The rows.
+    """
+    return [
+        (
+            player["id"],
+            player["name"],
+            player["name_id"],
+            player["rank"],
+            player["x_power"],
+            player["weapon_id"],
+            player["nameplate_id"],
+            player["byname"],
+            player["text_color"],
+            player.get("badge_left_id"),
+            player.get("badge_center_id"),
+            player.get("badge_right_id"),
+            player["timestamp"],
+            player["mode"],
+            player["region"],
+            player["rotation_start"],
+            player["season_number"],
+            player["updated"],
+        )
+        for player in players
+    ]
+
+
+def latest_values(rows: Iterable[tuple]) -> list[tuple]:
+    """Converts player rows to ``players_latest`` rows, keeping only the
+    newest row of each player, mode and region.
+
+    Args:
+        rows (Iterable[tuple]): The rows, in the column order of
+            ``INSERT_PLAYER_QUERY``.
+
+    Returns:
+        list[tuple]: The rows, in the column order of
+            ``UPSERT_PLAYERS_LATEST_QUERY``.
+    """
+    latest: dict[tuple, tuple] = {}
+    for row in rows:
+        key = (row[0], row[6], row[7])
+        previous = latest.get(key)
+        if previous is None or previous[6] <= row[5]:
+            latest[key] = (
+                row[0],
+                row[6],
+                row[7],
+                row[2],
+                row[3],
+                row[4],
+                row[5],
+            )
+    return list(latest.values())
+
+
+def snapshot_values(rows: Iterable[tuple]) -> list[tuple]:
+    """Groups player rows into ``leaderboard_snapshots`` rows, one for each
+    timestamp, mode and region, listing each player once in rank order.
+
+    Args:
+        rows (Iterable[tuple]): The rows, in the column order of
+            ``INSERT_PLAYER_QUERY``.
+
+    Returns:
+        list[tuple]: The rows, in the column order of
+            ``UPSERT_LEADERBOARD_SNAPSHOT_QUERY``.
+    """
+    snapshots: dict[tuple, tuple] = {}
+    seen: dict[tuple, set[str]] = {}
+    for row in sorted(rows, key=itemgetter(2)):
+        key = (row[5], row[6], row[7])
+        snapshot = snapshots.get(key)
+        if snapshot is None:
+            snapshot = snapshots[key] = (*key, row[8], row[9], [], [])
+            seen[key] = set()
+        # A player listed twice, as the rankings moved during the crawl,
+        # keeps their best rank
+        if row[0] in seen[key]:
+            continue
+        seen[key].add(row[0])
+        snapshot[5].append(row[0])
+        snapshot[6].append(row[2])
+    return list(snapshots.values())
+
+
+def write_player_rows(
+    conn: Connection, rows: Iterable[tuple], count: int, commit: bool
+) -> None:
+    """Writes player rows with the ingest method set by ``INGEST_METHOD``,
+    keeping the ``ON CONFLICT DO NOTHING`` semantics either way. The
+    ``players_latest`` and ``leaderboard_snapshots`` tables are upserted in
+    the same transaction. The profile fields of each row are replaced with
+    the ID of its ``player_profiles`` row, looked up in ``player_profiles``.
+
+    When ``STORAGE_MODE`` is "changes", only the rows whose ``updated`` flag
+    is set are written to the players table. The others are still recorded in
+    the leaderboard snapshot, which is enough for ``xscraper.players_as_of``
+    to rebuild the full leaderboard.
 
     Args:
         conn (Connection): The database connection to use.
-        players (list[Player]): The list of players to insert into the database.
+        rows (Iterable[tuple]): The rows, in the order of ``PLAYER_KEYS``.
+        count (int): The number of rows.
+        commit (bool): Whether to commit the transaction after inserting. If
+            False, the caller must call ``commit`` or ``rollback`` on
+            ``player_profiles`` along with the transaction.
     """
+    changes_only = xv.STORAGE_MODE == "changes"
     with conn.cursor() as cursor:
-        values = [
+        logger.info("Inserting %d players into the database", count)
+        try:
+            with metrics.time("profiles"):
+                rows = player_profiles.resolve(cursor, rows)
+            with metrics.time("insert"):
+                write_fact_rows(cursor, rows, changes_only)
+        except BaseException:
+            if commit:
+                player_profiles.rollback()
+            raise
+        if commit:
+            logger.info("Committing the transaction to the database")
+            conn.commit()
+            player_profiles.commit()
+
+
+def write_fact_rows(
+    cursor: Cursor, rows: list[tuple], changes_only: bool
+) -> None:
+    """Writes player rows whose profiles were resolved, along with their
+    ``players_latest`` and ``leaderboard_snapshots`` rows.
+
+    Args:
+        cursor (Cursor): The cursor to use.
+        rows (list[tuple]): The rows, in the column order of
+            ``INSERT_PLAYER_QUERY``.
+        changes_only (bool): Whether to skip the rows that did not change.
+    """
+    count = len(rows)
+    if xv.INGEST_METHOD == "copy":
+        count, inserted = copy_merge(
+            cursor,
+            CREATE_PLAYER_STAGING_QUERY,
+            TRUNCATE_PLAYER_STAGING_QUERY,
+            COPY_PLAYER_STAGING_QUERY,
             (
-                player["id"],
-                player["name"],
-                player["name_id"],
-                player["rank"],
-                player["x_power"],
-                player["weapon_id"],
-                player["nameplate_id"],
-                player["byname"],
-                player["text_color"],
-                player.get("badge_left_id"),
-                player.get("badge_center_id"),
-                player.get("badge_right_id"),
-                player["timestamp"],
-                player["mode"],
-                player["region"],
-                player["rotation_start"],
-                player["season_number"],
-                player["updated"],
+                MERGE_CHANGED_PLAYER_STAGING_QUERY
+                if changes_only
+                else MERGE_PLAYER_STAGING_QUERY
+            ),
+            rows,
+        )
+        unchanged = 0
+        if changes_only:
+            cursor.execute(COUNT_UNCHANGED_PLAYER_STAGING_QUERY)
+            unchanged = cursor.fetchone()[0]
+        cursor.execute(MERGE_PLAYERS_LATEST_STAGING_QUERY)
+        cursor.execute(MERGE_LEADERBOARD_SNAPSHOT_STAGING_QUERY)
+    else:
+        changed = (
+            [row for row in rows if row[10] is not False]
+            if changes_only
+            else rows
+        )
+        unchanged = len(rows) - len(changed)
+        inserted = 0
+        if changed:
+            execute_values(
+                cursor,
+                INSERT_PLAYER_QUERY,
+                changed,
+                page_size=len(changed),
             )
-            for player in players
-        ]
-        logger.info("Inserting %d players into the database", len(values))
-        execute_values(cursor, INSERT_PLAYER_QUERY, values)
-        logger.info("Committing the transaction to the database")
-        conn.commit()
+            inserted = cursor.rowcount
+        execute_values(cursor, UPSERT_PLAYERS_LATEST_QUERY, latest_values(rows))
+        execute_values(
+            cursor,
+            UPSERT_LEADERBOARD_SNAPSHOT_QUERY,
+            snapshot_values(rows),
+        )
+    record_insert(count - unchanged, inserted)
+    if unchanged:
+        metrics.inc("rows_unchanged", unchanged)
+
+
+def insert_players(
+    conn: Connection, players: list[Player], commit: bool = True
+) -> None:
+    """Insert the given players into the database.
+
+    Args:
+        conn (Connection): The database connection to use.
+        players (list[Player]): The list of players to insert into the database.
+        commit (bool): Whether to commit the transaction after inserting. Set
+            this to False to insert several batches in a single transaction.
+            Defaults to True.
+    """
+    values = player_values(players)
+    write_player_rows(conn, values, len(values), commit)
+
+
+def insert_player_batches(
+    conn: Connection, batches: Sequence[PlayerBatch], commit: bool = True
+) -> None:
+    """Insert the players in the given enriched batches into the database. The
+    rows are streamed straight from the batch columns, without building a
+    Player dict for each of them.
+
+    Args:
+        conn (Connection): The database connection to use.
+        batches (Sequence[PlayerBatch]): The batches to insert.
+        commit (bool): Whether to commit the transaction after inserting. Set
+            this to False to insert several batches in a single transaction.
+            Defaults to True.
+    """
+    write_player_rows(
+        conn,
+        chain.from_iterable(batch.rows() for batch in batches),
+        sum(len(batch) for batch in batches),
+        commit,
+    )
 
 
 def insert_schedule(conn: Connection, schedules: list[Schedule]) -> None:
@@ -129,7 +525,17 @@ def insert_schedule(conn: Connection, schedules: list[Schedule]) -> None:
             for schedule in schedules
         ]
         logger.info("Inserting %d schedules into the database", len(values))
-        execute_values(cursor, INSERT_SCHEDULE_QUERY, values)
+        if xv.INGEST_METHOD == "copy":
+            copy_merge(
+                cursor,
+                CREATE_SCHEDULE_STAGING_QUERY,
+                TRUNCATE_SCHEDULE_STAGING_QUERY,
+                COPY_SCHEDULE_STAGING_QUERY,
+                MERGE_SCHEDULE_STAGING_QUERY,
+                values,
+            )
+        else:
+            execute_values(cursor, INSERT_SCHEDULE_QUERY, values)
         logger.info("Committing the transaction to the database")
         conn.commit()
 
@@ -189,7 +595,8 @@ def select_latest_timestamp(conn: Connection) -> str:
 
 
 def select_latest_players(conn: Connection, mode: str) -> list[Player]:
-    """Select the latest players from the database.
+    """Select the players in the latest snapshot of a mode from the
+    ``players_latest`` table, so the cost does not grow with the history.
 
     Args:
         conn (Connection): The database connection to use.
@@ -204,49 +611,50 @@ def select_latest_players(conn: Connection, mode: str) -> list[Player]:
         return cursor.fetchall()
 
 
-def ensure_schema_exists(conn: Connection) -> None:
-    """Ensure that the database schema exists.
+def select_latest_timestamp_for_mode(
+    conn: Connection, mode: str
+) -> dt.datetime | None:
+    """Select the timestamp of the latest stored snapshot of a mode.
 
     Args:
         conn (Connection): The database connection to use.
-    """
-    logger.debug("Ensuring that the database schema exists")
-    with conn.cursor() as cursor:
-        cursor.execute(ENSURE_SCHEMA_QUERY)
-        cursor.execute(CREATE_MODE_ENUM_QUERY)
-        cursor.execute(ENSURE_TRGM_EXTENSION_QUERY)
-        conn.commit()
-
+        mode (str): The mode to select the latest timestamp for.
 
-def ensure_players_table_exists(conn: Connection) -> None:
-    """Ensure that the players table exists in the database.
-
-    Args:
-        conn (Connection): The database connection to use.
+    Returns:
+        dt.datetime | None: The latest timestamp, or None if the mode has no
+            players yet.
     """
-    logger.debug("Ensuring that the players table exists in the database")
+    logger.debug("Selecting the latest timestamp for mode %s", mode)
     with conn.cursor() as cursor:
-        cursor.execute(ENSURE_PLAYER_TABLE_QUERY)
-        cursor.execute(FUNCTION_SPLASHTAG_QUERY)
-        conn.commit()
-        try:
-            cursor.execute(TRIGGER_SPLASHTAG_QUERY)
-        except psycopg2.errors.DuplicateObject:
-            conn.rollback()
-        for query in ENSURE_PLAYER_INDEX_QUERIES:
-            cursor.execute(query)
-        conn.commit()
+        cursor.execute(SELECT_LATEST_TIMESTAMP_FOR_MODE_QUERY, (mode,))
+        return cursor.fetchone()[0]
 
 
-def ensure_schedule_table_exists(conn: Connection) -> None:
-    """Ensure that the schedule table exists in the database.
+def select_players_as_of(
+    conn: Connection, mode: str, region: bool, timestamp: dt.datetime
+) -> list[Player]:
+    """Select the leaderboard of a mode and region as it was at the given
+    time. This works the same whether the rows were stored in full or as
+    changes only.
 
     Args:
         conn (Connection): The database connection to use.
+        mode (str): The mode to select the leaderboard for.
+        region (bool): The region to select the leaderboard for, as stored in
+            the database.
+        timestamp (dt.datetime): The point in time. The leaderboard is the
+            latest one scraped at or before it.
+
+    Returns:
+        list[Player]: The players on the leaderboard, in rank order. This is
+            empty if no leaderboard was scraped before the given time.
     """
-    logger.debug("Ensuring that the schedule table exists in the database")
+    logger.debug(
+        "Selecting the %s leaderboard as of %s for region %s",
+        mode,
+        timestamp,
+        region,
+    )
     with conn.cursor() as cursor:
-        cursor.execute(ENSURE_SCHEDULE_TABLE_QUERY)
-        for query in ENSURE_PLAYER_INDEX_QUERIES:
-            cursor.execute(query)
-        conn.commit()
+        cursor.execute(SELECT_PLAYERS_AS_OF_QUERY, (mode, region, timestamp))
+        return [dict(zip(PLAYER_KEYS, row)) for row in cursor.fetchall()]
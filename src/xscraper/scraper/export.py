@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+import logging
+import os
+import pathlib
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import xscraper.variables as xv
+from xscraper.scraper.batch import ARROW_SCHEMA
+from xscraper.scraper.metrics import metrics
+from xscraper.sql.query import (
+    SELECT_CYCLE_PLAYERS_QUERY,
+    SELECT_NEXT_CYCLES_QUERY,
+)
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COLUMNS = ("season_number", "mode", "region")
+STATE_FILE = "_xscraper_export.json"
+
+
+def rows_to_arrow(rows: list[tuple]) -> pa.Table:
+    """Converts player rows to a pyarrow Table.
+
+    Args:
+        rows (list[tuple]): The rows, in the order of ``PLAYER_KEYS``.
+
+    Returns:
+        pa.Table: The rows, with the schema of ``PlayerBatch.to_arrow``.
+    """
+    if not rows:
+        return ARROW_SCHEMA.empty_table()
+    arrays = [
+        pa.array(column, type=field.type)
+        for column, field in zip(zip(*rows), ARROW_SCHEMA)
+    ]
+    return pa.Table.from_arrays(arrays, schema=ARROW_SCHEMA)
+
+
+class ParquetExporter:
+    """Appends the ingested cycles to a Parquet dataset, Hive partitioned by
+    season number, mode and region, for analytics that should not run
+    against the database the scraper writes into.
+
+    The timestamp of the last exported cycle is kept in a state file at the
+    root of the dataset, and each run only exports the cycles after it. Cycles
+    are exported in groups, each written as one file per partition, named
+    after the first cycle of the group. A run that dies before saving the
+    state starts its next group at the same cycle, so the files it wrote are
+    overwritten by the same cycles and any that arrived since, instead of
+    being duplicated. Once a partition holds ``EXPORT_COMPACT_MIN_FILES``
+    files they are merged into one.
+    """
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        cycles_per_file: int | None = None,
+        compact_min_files: int | None = None,
+    ) -> None:
+        """Initializes the exporter.
+
+        Args:
+            path (str | pathlib.Path): The root directory of the dataset. It is
+                created if it does not exist.
+            cycles_per_file (int | None): The number of cycles exported in
+                each group. If None, ``EXPORT_CYCLES_PER_FILE`` is used.
+                Defaults to None.
+            compact_min_files (int | None): The number of files a partition
+                may hold before they are compacted. If None,
+                ``EXPORT_COMPACT_MIN_FILES`` is used. Defaults to None.
+        """
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.cycles_per_file = cycles_per_file or xv.EXPORT_CYCLES_PER_FILE
+        self.compact_min_files = (
+            compact_min_files or xv.EXPORT_COMPACT_MIN_FILES
+        )
+
+    @property
+    def state_path(self) -> pathlib.Path:
+        """The path of the state file."""
+        return self.path / STATE_FILE
+
+    def high_water_mark(self) -> dt.datetime | None:
+        """Reads the timestamp of the last exported cycle.
+
+        Returns:
+            dt.datetime | None: The timestamp, or None if nothing was exported
+                yet.
+        """
+        if not self.state_path.exists():
+            return None
+        state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        return dt.datetime.fromisoformat(state["high_water_mark"])
+
+    def save_high_water_mark(self, timestamp: dt.datetime) -> None:
+        """Records the timestamp of the last exported cycle. The state file is
+        replaced atomically.
+
+        Args:
+            timestamp (dt.datetime): The timestamp.
+        """
+        tmp_path = self.state_path.with_name(STATE_FILE + ".tmp")
+        tmp_path.write_text(
+            json.dumps({"high_water_mark": timestamp.isoformat()}),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, self.state_path)
+
+    def export(self, conn: Connection, max_cycles: int | None = None) -> int:
+        """Exports the cycles ingested since the last run.
+
+        Args:
+            conn (Connection): The database connection to read from.
+            max_cycles (int | None): The maximum number of cycles to export in
+                this run. If None, every new cycle is exported. Defaults to
+                None.
+
+        Returns:
+            int: The number of rows exported.
+        """
+        high_water_mark = self.high_water_mark()
+        logger.info("Exporting the cycles after %s", high_water_mark)
+        exported = 0
+        cycles = 0
+        touched: set[pathlib.Path] = set()
+        while max_cycles is None or cycles < max_cycles:
+            limit = self.cycles_per_file
+            if max_cycles is not None:
+                limit = min(limit, max_cycles - cycles)
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    SELECT_NEXT_CYCLES_QUERY,
+                    (high_water_mark, high_water_mark, limit),
+                )
+                timestamps = [row[0] for row in cursor.fetchall()]
+                if not timestamps:
+                    break
+                cursor.execute(
+                    SELECT_CYCLE_PLAYERS_QUERY, (timestamps[0], timestamps[-1])
+                )
+                rows = cursor.fetchall()
+            # Do not hold a snapshot open, and so back vacuum, for the whole
+            # run
+            conn.rollback()
+
+            with metrics.time("export_write"):
+                touched.update(self.write(rows_to_arrow(rows), timestamps[0]))
+            high_water_mark = timestamps[-1]
+            self.save_high_water_mark(high_water_mark)
+            exported += len(rows)
+            cycles += len(timestamps)
+            logger.info(
+                "Exported %d cycles up to %s, %d rows",
+                len(timestamps),
+                high_water_mark,
+                len(rows),
+            )
+
+        for directory in touched:
+            if len(self.data_files(directory)) >= self.compact_min_files:
+                self.compact(directory)
+        metrics.inc("rows_exported", exported)
+        return exported
+
+    def write(
+        self, table: pa.Table, first_cycle: dt.datetime
+    ) -> set[pathlib.Path]:
+        """Writes a group of cycles to the dataset.
+
+        Args:
+            table (pa.Table): The rows of the cycles.
+            first_cycle (dt.datetime): The timestamp of the first cycle, used
+                to name the files.
+
+        Returns:
+            set[pathlib.Path]: The partition directories written to.
+        """
+        if table.num_rows == 0:
+            return set()
+        written: set[pathlib.Path] = set()
+        ds.write_dataset(
+            table,
+            self.path,
+            format="parquet",
+            partitioning=list(PARTITION_COLUMNS),
+            partitioning_flavor="hive",
+            basename_template=f"part-{first_cycle:%Y%m%dT%H%M%S}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_visitor=lambda file: written.add(
+                pathlib.Path(file.path).parent
+            ),
+        )
+        return written
+
+    @staticmethod
+    def data_files(directory: pathlib.Path) -> list[pathlib.Path]:
+        """Lists the data files of a partition.
+
+        Args:
+            directory (pathlib.Path): The partition directory.
+
+        Returns:
+            list[pathlib.Path]: The Parquet files, in name order.
+        """
+        return sorted(directory.glob("*.parquet"))
+
+    def compact(self, directory: pathlib.Path) -> None:
+        """Merges the files of a partition into a single file, sorted by
+        timestamp and rank.
+
+        The merged file is written under a hidden name, which dataset readers
+        skip, and renamed into place before the old files are removed. A crash
+        between the two steps leaves rows duplicated until the partition is
+        compacted again.
+
+        Args:
+            directory (pathlib.Path): The partition directory.
+        """
+        files = self.data_files(directory)
+        if len(files) < 2:
+            return
+        logger.info("Compacting %d files in %s", len(files), directory)
+        with metrics.time("export_compact"):
+            table = pa.concat_tables([pq.read_table(file) for file in files])
+            table = table.sort_by(
+                [("timestamp", "ascending"), ("rank", "ascending")]
+            )
+            # Named after the newest file, so the name stays unique
+            target = directory / files[-1].name.replace("part-", "compact-", 1)
+            tmp_path = directory / f".{target.name}.tmp"
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, target)
+            for file in files:
+                if file != target:
+                    file.unlink()
+        metrics.inc("export_compactions")
@@ -0,0 +1,254 @@
+import datetime as dt
+import hashlib
+import logging
+import statistics
+import threading
+from functools import partial
+from typing import Iterable, NamedTuple, Sequence
+
+from splatnet3_scraper.query import QueryHandler, QueryResponse
+
+import xscraper.variables as xv
+from xscraper import constants as xc
+from xscraper.scraper.accounts import AccountPool, max_workers_for
+from xscraper.scraper.cache import season_cache
+from xscraper.scraper.crawl import run_concurrently
+from xscraper.scraper.scrape import (
+    PrefetchedPage,
+    StaleSeasonError,
+    get_current_season,
+    pull_page_chunks,
+)
+from xscraper.types import Mode, Region
+
+logger = logging.getLogger(__name__)
+
+FingerprintKey = tuple[Mode, Region]
+
+
+class RefreshObservation(NamedTuple):
+    timestamp: dt.datetime
+    resolution: dt.timedelta
+
+
+def fingerprint_chunks(subresponses: Iterable[QueryResponse]) -> str:
+    """Computes a fingerprint of a leaderboard page from the rank, ID and
+    x_power of every player in each of its chunks, without parsing the
+    players.
+
+    Args:
+        subresponses (Iterable[QueryResponse]): The ``xRanking{mode}`` part of
+            each chunk of the page, in cursor order.
+
+    Returns:
+        str: The fingerprint.
+    """
+    digest = hashlib.sha1()
+    for subresponse in subresponses:
+        for edge in subresponse.data["edges"]:
+            node = edge["node"]
+            digest.update(
+                f"{node['rank']}:{node['id']}:{node['xPower']};".encode()
+            )
+    return digest.hexdigest()
+
+
+def fetch_first_page(
+    scraper: QueryHandler | AccountPool, region: Region, mode: Mode
+) -> PrefetchedPage:
+    """Pulls every chunk of the first page of a leaderboard to fingerprint it.
+    This costs one request for each chunk of the page, so a change anywhere
+    in the top of the leaderboard is seen, not only in its first chunk. The
+    chunks are archived as probes, and are handed to the crawl if the mode
+    changed so that the page is not pulled twice.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        region (Region): The region of the leaderboard.
+        mode (Mode): The mode of the leaderboard.
+
+    Returns:
+        PrefetchedPage: The chunks of the first page.
+    """
+    season_id = get_current_season(scraper, region)
+    try:
+        chunks = list(
+            pull_page_chunks(scraper, season_id, mode, 1, region, probe=True)
+        )
+    except StaleSeasonError:
+        season_cache.invalidate(region, season_id)
+        season_id = get_current_season(scraper, region)
+        chunks = list(
+            pull_page_chunks(scraper, season_id, mode, 1, region, probe=True)
+        )
+    return PrefetchedPage(season_id, chunks)
+
+
+def probe_first_pages(
+    scraper: QueryHandler | AccountPool,
+    modes: Sequence[Mode],
+    max_workers: int | None = None,
+) -> dict[FingerprintKey, PrefetchedPage]:
+    """Pulls the first page of every region in the given modes.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        modes (Sequence[Mode]): The modes to probe.
+        max_workers (int | None): The maximum number of requests to have in
+            flight at the same time. If None, the limit of the scraper is used.
+            Defaults to None.
+
+    Returns:
+        dict[FingerprintKey, PrefetchedPage]: The first page of each (mode,
+            region).
+    """
+    keys = [(mode, region) for mode in modes for region in xc.regions]
+    pages = run_concurrently(
+        (
+            partial(fetch_first_page, scraper, region, mode)
+            for mode, region in keys
+        ),
+        max_workers=max_workers_for(scraper, max_workers),
+    )
+    return dict(zip(keys, pages))
+
+
+def fingerprint_pages(
+    pages: dict[FingerprintKey, PrefetchedPage],
+) -> dict[FingerprintKey, str]:
+    """Computes the fingerprint of every probed first page.
+
+    Args:
+        pages (dict[FingerprintKey, PrefetchedPage]): The first page of each
+            (mode, region).
+
+    Returns:
+        dict[FingerprintKey, str]: The fingerprint of each (mode, region).
+    """
+    return {
+        key: fingerprint_chunks(chunk.subresponse for chunk in page.chunks)
+        for key, page in pages.items()
+    }
+
+
+class RefreshTracker:
+    """Remembers the last stored fingerprint of every leaderboard and when the
+    fingerprints changed, to learn when upstream refreshes the rankings.
+
+    A change is only recorded once the new data has been written, so that a
+    failed cycle is never mistaken for one that had nothing new. Each change is
+    stored with the time since the previous probe of the same leaderboard,
+    which bounds how precisely the refresh moment is known.
+    """
+
+    def __init__(self, history_size: int | None = None) -> None:
+        """Initializes the tracker.
+
+        Args:
+            history_size (int | None): The number of refresh observations to
+                keep. If None, ``FINGERPRINT_HISTORY_SIZE`` is used. Defaults to
+                None.
+        """
+        self.history_size = history_size or xv.FINGERPRINT_HISTORY_SIZE
+        self.fingerprints: dict[FingerprintKey, str] = {}
+        self.probed_at: dict[FingerprintKey, dt.datetime] = {}
+        self.observations: list[RefreshObservation] = []
+        self._lock = threading.Lock()
+
+    def changed_modes(
+        self, fingerprints: dict[FingerprintKey, str]
+    ) -> list[Mode]:
+        """Finds the modes in which any region has a new fingerprint.
+
+        Args:
+            fingerprints (dict[FingerprintKey, str]): The probed fingerprints.
+
+        Returns:
+            list[Mode]: The modes that changed, in the order they were probed.
+        """
+        out: list[Mode] = []
+        with self._lock:
+            for (mode, region), fingerprint in fingerprints.items():
+                if mode in out:
+                    continue
+                if self.fingerprints.get((mode, region)) != fingerprint:
+                    out.append(mode)
+        return out
+
+    def record(
+        self,
+        fingerprints: dict[FingerprintKey, str],
+        timestamp: dt.datetime,
+    ) -> None:
+        """Stores the probed fingerprints, recording a refresh observation if
+        any leaderboard's fingerprint changed since it was last probed.
+
+        Args:
+            fingerprints (dict[FingerprintKey, str]): The probed fingerprints.
+            timestamp (dt.datetime): When the fingerprints were probed.
+        """
+        with self._lock:
+            resolutions = []
+            for key, fingerprint in fingerprints.items():
+                previous = self.fingerprints.get(key)
+                probed_at = self.probed_at.get(key)
+                if (
+                    previous is not None
+                    and previous != fingerprint
+                    and probed_at is not None
+                ):
+                    logger.info("Leaderboard %s refreshed upstream", key)
+                    resolutions.append(timestamp - probed_at)
+                self.fingerprints[key] = fingerprint
+                self.probed_at[key] = timestamp
+            if resolutions:
+                self.observations.append(
+                    RefreshObservation(timestamp, min(resolutions))
+                )
+                self.observations = self.observations[-self.history_size :]
+
+    def touch(
+        self,
+        fingerprints: dict[FingerprintKey, str],
+        timestamp: dt.datetime,
+    ) -> None:
+        """Marks unchanged leaderboards as probed, without storing anything
+        new, so that the resolution of the next observation is tight.
+
+        Args:
+            fingerprints (dict[FingerprintKey, str]): The probed fingerprints.
+            timestamp (dt.datetime): When the fingerprints were probed.
+        """
+        with self._lock:
+            for key, fingerprint in fingerprints.items():
+                if self.fingerprints.get(key) == fingerprint:
+                    self.probed_at[key] = timestamp
+
+    def learned_offset(self, cadence: dt.timedelta) -> dt.timedelta | None:
+        """Estimates the offset within the scrape cadence at which upstream
+        refreshes, from the observations made within about a minute of the
+        refresh.
+
+        Args:
+            cadence (dt.timedelta): The scrape cadence.
+
+        Returns:
+            dt.timedelta | None: The offset within the cadence just after which
+                to scrape, or None if there are not enough precise
+                observations yet.
+        """
+        cadence_minutes = int(cadence.total_seconds() // 60)
+        with self._lock:
+            minutes = [
+                observation.timestamp.minute % cadence_minutes
+                for observation in self.observations
+                if observation.resolution <= dt.timedelta(minutes=2)
+            ]
+        if len(minutes) < xv.FINGERPRINT_MIN_SAMPLES:
+            return None
+        return dt.timedelta(minutes=int(statistics.median_low(minutes)))
+
+
+refresh_tracker = RefreshTracker()
@@ -0,0 +1,86 @@
+import sys
+from functools import lru_cache
+
+import xscraper.variables as xv
+from xscraper.scraper.utils import base64_decode, color_floats_to_hex
+
+
+@lru_cache(maxsize=xv.DECODE_CACHE_SIZE)
+def decode_id_number(string: str) -> int:
+    """Decodes a base64 ID such as ``Weapon-123`` and returns its number. There
+    are only a few hundred distinct weapon, nameplate and badge IDs, so the
+    results are kept in a bounded LRU cache keyed by the raw ID.
+
+    Args:
+        string (str): The base64 encoded ID.
+
+    Returns:
+        int: The number at the end of the decoded ID.
+    """
+    return int(base64_decode(string).rpartition("-")[2])
+
+
+@lru_cache(maxsize=xv.INTERN_CACHE_SIZE)
+def intern_string(string: str | None) -> str | None:
+    """Returns a single shared copy of a frequently repeated string, such as a
+    byname or a weapon name, so that every row holding it points at the same
+    object. None is returned as is.
+
+    Args:
+        string (str | None): The string to intern.
+
+    Returns:
+        str | None: The interned string.
+    """
+    if string is None:
+        return None
+    return sys.intern(string)
+
+
+@lru_cache(maxsize=xv.INTERN_CACHE_SIZE)
+def text_color_hex(r: float, g: float, b: float) -> str:
+    """Converts a nameplate text color to a hex string. The same handful of
+    colors repeats on most rows, so the results are cached.
+
+    Args:
+        r (float): red value
+        g (float): green value
+        b (float): blue value
+
+    Returns:
+        str: The hex color string, formatted as "#RRGGBB".
+    """
+    return sys.intern(color_floats_to_hex(r=r, g=g, b=b))
+
+
+_caches = {
+    "decode_id_number": decode_id_number,
+    "intern_string": intern_string,
+    "text_color_hex": text_color_hex,
+}
+
+
+def cache_stats() -> dict[str, dict[str, float]]:
+    """Gets the hits, misses, size and hit rate of every decode and intern
+    cache.
+
+    Returns:
+        dict[str, dict[str, float]]: The statistics of each cache, by name.
+    """
+    out = {}
+    for name, cached in _caches.items():
+        info = cached.cache_info()
+        lookups = info.hits + info.misses
+        out[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "hit_rate": info.hits / lookups if lookups else 0.0,
+        }
+    return out
+
+
+def clear_caches() -> None:
+    """Empties every decode and intern cache and resets their statistics."""
+    for cached in _caches.values():
+        cached.cache_clear()
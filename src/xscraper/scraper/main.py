@@ -2,26 +2,30 @@ from __future__ import annotations
 
 import datetime as dt
 import logging
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Sequence
 
+import psycopg2
 import pytz
 from splatnet3_scraper.query import QueryHandler
 
+import xscraper.variables as xv
 from xscraper import constants as xc
-from xscraper.scraper.db import (
-    get_db_connection,
-    insert_players,
-    insert_schedule,
-    select_latest_players,
-    select_schedule,
+from xscraper.scraper.accounts import AccountPool
+from xscraper.scraper.archive import begin_capture_cycle
+from xscraper.scraper.db import ensure_player_partitions, select_schedule
+from xscraper.scraper.fingerprint import (
+    fingerprint_pages,
+    probe_first_pages,
+    refresh_tracker,
 )
-from xscraper.scraper.scrape import get_schedule, scrape_all_players_in_mode
-from xscraper.scraper.utils import (
-    calculate_season_number,
-    get_current_rotation_start,
-    pull_previous_schedule,
-)
-from xscraper.types import Player, Schedule
+from xscraper.scraper.metrics import metrics
+from xscraper.scraper.pipeline import run_scrape_pipeline
+from xscraper.scraper.pool import PoolTimeout, get_pool
+from xscraper.scraper.rotations import rotation_calendar
+from xscraper.scraper.snapshot import latest_snapshots
+from xscraper.scraper.spool import get_spool
+from xscraper.scraper.utils import pull_previous_schedule
+from xscraper.types import Mode, Schedule
 
 if TYPE_CHECKING:
     from psycopg2.extensions import connection as Connection
@@ -29,15 +33,48 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+def select_previous_schedule(conn: Connection | None) -> Schedule | None:
+    """Reads the previous rotation from the database, for when the rotation
+    calendar does not hold it. A database that cannot be read is logged and
+    treated as holding no previous rotation.
+
+    Args:
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool.
+
+    Returns:
+        Schedule | None: The previous rotation, or None if it is unknown.
+    """
+    try:
+        if conn is None:
+            with get_pool().connection() as pool_conn:
+                previous = select_schedule(pool_conn, True)
+        else:
+            previous = select_schedule(conn, True)
+    except (psycopg2.Error, PoolTimeout) as e:
+        logger.warning("Failed to read the previous schedule: %s", e)
+        if conn is not None:
+            conn.rollback()
+        return None
+    if previous is not None:
+        rotation_calendar.load([previous])
+    return previous
+
+
 def calculate_modes_to_update(
-    timestamp: dt.datetime, connection: Connection
+    timestamp: dt.datetime, connection: Connection | None
 ) -> list[Schedule]:
     """Calculates the modes to update based on the current time and the
-    schedules in the database.
+    rotation calendar.
+
+    The previous rotation is not part of the upstream schedule, so right after
+    a restart it is read from the database instead.
 
     Args:
         timestamp (dt.datetime): The current timestamp.
-        connection (Connection): The database connection to use.
+        connection (Connection | None): The database connection to use. If
+            None, a connection is checked out of the connection pool when the
+            previous rotation has to be read.
 
     Returns:
         list[Schedule]: The list of schedules to update. Usually just one, but
@@ -45,41 +82,97 @@ def calculate_modes_to_update(
             rotation.
     """
     logger.info("Calculating modes to update")
-    out = [select_schedule(connection)]
+    out = [rotation_calendar.current(timestamp)]
     if pull_previous_schedule(timestamp):
         logger.info("Pulling previous schedule")
-        out.append(select_schedule(connection, True))
+        previous = rotation_calendar.previous(timestamp)
+        if previous is None:
+            previous = select_previous_schedule(connection)
+        out.append(previous)
     return out
 
 
-def scrape_schedule(scraper: QueryHandler, conn: Connection) -> None:
-    """Scrape the schedule and insert it into the database.
+def scrape_schedule(
+    scraper: QueryHandler | AccountPool, conn: Connection | None
+) -> None:
+    """Scrape the schedule into the rotation calendar and insert it into the
+    database.
 
     Args:
-        scraper (QueryHandler): The query handler to use for scraping.
-        conn (Connection): The database connection to use.
+        scraper (QueryHandler | AccountPool): The query handler to use for
+            scraping.
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool.
     """
     logger.info("Scraping the schedule")
-    schedules = get_schedule(scraper)
-    logger.info("Inserting the schedule into the database")
-    insert_schedule(conn, schedules)
+    rotation_calendar.fetch(scraper, conn)
+
 
+def load_missing_snapshots(
+    conn: Connection | None, modes: Sequence[Mode]
+) -> None:
+    """Loads the latest snapshots of the given modes that are not cached yet,
+    for a spooled cycle. If the database cannot be read, those modes start
+    from an empty snapshot, so every player of the cycle is marked as updated.
 
-def scrape(scraper: QueryHandler, conn: Connection | None = None) -> None:
+    Args:
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool.
+        modes (Sequence[Mode]): The modes of the cycle.
+    """
+    try:
+        with metrics.time("select_latest"):
+            if conn is None:
+                with get_pool().connection() as pool_conn:
+                    latest_snapshots.load_missing(pool_conn, modes)
+            else:
+                latest_snapshots.load_missing(conn, modes)
+    except (psycopg2.Error, PoolTimeout) as e:
+        logger.warning("Failed to load the latest snapshots: %s", e)
+        if conn is not None:
+            conn.rollback()
+
+
+def scrape(
+    scraper: QueryHandler | AccountPool, conn: Connection | None = None
+) -> int:
     """Scrape the players and insert them into the database.
 
+    The players are streamed from the crawler into the database as they
+    arrive, and committed in a single transaction at the end of the cycle. If
+    ``FINGERPRINT_ENABLED`` is set, the first page of every leaderboard is
+    probed first, and modes whose leaderboards have not changed upstream since
+    the last stored cycle are skipped. The first pages of the other modes are
+    reused by the crawl.
+
+    If a spool is enabled, the cycle is written to the spool instead and the
+    database is only read from when a snapshot is not cached yet. A database
+    that is slow or down then no longer fails the cycle.
+
     Args:
-        scraper (QueryHandler): The query handler to use for scraping.
-        conn (Connection | None): The database connection to use. If None, a new
-            connection will be created. Defaults to None.
+        scraper (QueryHandler | AccountPool): The query handler to use for
+            scraping. If an ``AccountPool`` is given, the cycle is spread over
+            every account in the pool.
+        conn (Connection | None): The database connection to use. If None, a
+            connection is checked out of the connection pool for the cycle,
+            or only when it is needed if a spool is enabled. Defaults to None.
+
+    Returns:
+        int: The number of players inserted or spooled. This is 0 if every
+            mode was skipped.
     """
+    spool = get_spool()
+    if conn is None and spool is None:
+        logger.debug("No database connection provided, using the pool")
+        with get_pool().connection() as conn:
+            return scrape(scraper, conn)
+
     logger.info("Scraping the players")
     utc_tz = pytz.timezone("UTC")
     timestamp = utc_tz.localize(dt.datetime.now())
-    players: list[Player] = []
-    if conn is None:
-        logger.debug("No database connection provided, creating a new one")
-        conn = get_db_connection()
+    begin_capture_cycle(timestamp)
+    metrics.begin_cycle()
+    metrics.set_gauge("last_cycle_timestamp_seconds", timestamp.timestamp())
     modes_to_update = calculate_modes_to_update(timestamp, conn)
 
     if modes_to_update[0] is None:
@@ -89,36 +182,60 @@ def scrape(scraper: QueryHandler, conn: Connection | None = None) -> None:
         )
         scrape_schedule(scraper, conn)
         modes_to_update = calculate_modes_to_update(timestamp, conn)
+    else:
+        rotation_calendar.refresh_in_background(scraper, timestamp)
 
+    modes: list[Mode] = []
     for schedule in modes_to_update:
-        if schedule["mode"] is None:
+        if schedule is None:
+            continue
+        if schedule.get("mode") is None:
             logger.info(
                 "No mode found in schedule, likely a Splatfest. Skipping."
             )
             continue
-        logger.info("Scraping players for mode %s", schedule["mode"])
-        mode = xc.mode_reverse_map[schedule["mode"]]
-        players_in_mode = scrape_all_players_in_mode(scraper, mode, timestamp)
-        logger.info("Selecting the latest players from the database")
-        latest_players = select_latest_players(conn, schedule["mode"])
-        player_dict = {player[0]: player for player in latest_players}
-
-        logger.info("Appending rotation start and season number to player data")
-        for player in players_in_mode:
-            player["rotation_start"] = get_current_rotation_start()
-            player["season_number"] = calculate_season_number(timestamp)
-            if player["id"] not in player_dict:
-                player["updated"] = True
-            else:
-                player["updated"] = (
-                    player["x_power"] != player_dict[player["id"]][1]
-                )
-
-        players.extend(players_in_mode)
-    
-    if not players:
-        logger.info("No players found, skipping insertion")
-        return
-
-    logger.info("Inserting players into the database")
-    insert_players(conn, players)
+        modes.append(xc.mode_reverse_map[schedule["mode"]])
+
+    fingerprints = {}
+    first_pages = {}
+    if modes and xv.FINGERPRINT_ENABLED:
+        logger.info("Probing the leaderboard fingerprints")
+        with metrics.time("fingerprint_probe"):
+            first_pages = probe_first_pages(scraper, modes)
+        fingerprints = fingerprint_pages(first_pages)
+        changed_modes = refresh_tracker.changed_modes(fingerprints)
+        if len(changed_modes) < len(modes):
+            logger.info(
+                "Leaderboards unchanged upstream for modes %s, skipping them",
+                [mode for mode in modes if mode not in changed_modes],
+            )
+        modes = changed_modes
+
+    if not modes:
+        logger.info("No modes to scrape, skipping insertion")
+        refresh_tracker.touch(fingerprints, timestamp)
+        return 0
+
+    if spool is not None:
+        load_missing_snapshots(conn, modes)
+    else:
+        logger.info("Validating the latest snapshots for modes %s", modes)
+        with metrics.time("select_latest"):
+            latest_snapshots.validate(conn, modes)
+        ensure_player_partitions(conn, timestamp)
+
+    logger.info("Scraping and inserting players for modes %s", modes)
+    with metrics.time("pipeline"):
+        rows = run_scrape_pipeline(
+            scraper,
+            conn,
+            modes,
+            timestamp,
+            latest_snapshots,
+            spool=spool,
+            prefetched=first_pages,
+        )
+    refresh_tracker.record(fingerprints, timestamp)
+    if not rows:
+        logger.info("No players found, nothing was inserted")
+    return rows
@@ -0,0 +1,238 @@
+import logging
+import os
+import pathlib
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Sequence
+
+import xscraper.variables as xv
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """A cumulative latency histogram with fixed bucket bounds, in seconds."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        """Initializes an empty histogram.
+
+        Args:
+            buckets (Sequence[float]): The upper bounds of the buckets, in
+                increasing order. An implicit ``+Inf`` bucket is added.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Records a value.
+
+        Args:
+            value (float): The value to record.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list[int]:
+        """Gets the number of values at or below each bucket bound, ending with
+        the ``+Inf`` bucket.
+
+        Returns:
+            list[int]: The cumulative counts.
+        """
+        out = []
+        total = 0
+        for count in self.counts:
+            total += count
+            out.append(total)
+        return out
+
+
+class MetricsRegistry:
+    """Collects per-stage latency histograms and counters for the scrape
+    cycles, and renders them in the Prometheus text exposition format.
+
+    Counters are kept both as totals since the process started and for the
+    current cycle only, so that a regression in a single cycle is visible
+    without having to take rates.
+    """
+
+    def __init__(
+        self,
+        prefix: str = "xscraper",
+        buckets: Sequence[float] | None = None,
+    ) -> None:
+        """Initializes an empty registry.
+
+        Args:
+            prefix (str): The prefix of every metric name. Defaults to
+                "xscraper".
+            buckets (Sequence[float] | None): The bucket bounds of the stage
+                histograms, in seconds. If None, ``METRICS_BUCKETS`` is used.
+                Defaults to None.
+        """
+        self.prefix = prefix
+        self.buckets = tuple(buckets or xv.METRICS_BUCKETS)
+        self.histograms: dict[str, Histogram] = {}
+        self.totals: dict[str, float] = {}
+        self.cycle_counts: dict[str, float] = {}
+        self.gauges: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Records the duration of a stage.
+
+        Args:
+            stage (str): The name of the stage.
+            seconds (float): How long the stage took.
+        """
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Times the body of a ``with`` block as the given stage. The duration
+        is recorded even if the block raises.
+
+        Args:
+            stage (str): The name of the stage.
+
+        Yields:
+            None: Control to the timed block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name: str, amount: float = 1) -> None:
+        """Increments a counter.
+
+        Args:
+            name (str): The name of the counter.
+            amount (float): The amount to add. Defaults to 1.
+        """
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0) + amount
+            self.cycle_counts[name] = self.cycle_counts.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Sets a gauge.
+
+        Args:
+            name (str): The name of the gauge.
+            value (float): The value of the gauge.
+        """
+        with self._lock:
+            self.gauges[name] = value
+
+    def begin_cycle(self) -> None:
+        """Resets the counters of the current cycle."""
+        with self._lock:
+            self.cycle_counts = {name: 0 for name in self.cycle_counts}
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The rendered metrics.
+        """
+        p = self.prefix
+        lines = []
+        with self._lock:
+            if self.histograms:
+                name = f"{p}_stage_duration_seconds"
+                lines.append(f"# HELP {name} Time spent in each scrape stage.")
+                lines.append(f"# TYPE {name} histogram")
+                for stage, histogram in sorted(self.histograms.items()):
+                    bounds = [f"{bound:g}" for bound in histogram.buckets]
+                    for bound, count in zip(
+                        bounds + ["+Inf"], histogram.cumulative_counts()
+                    ):
+                        lines.append(
+                            f'{name}_bucket{{stage="{stage}",le="{bound}"}} '
+                            f"{count}"
+                        )
+                    lines.append(
+                        f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}'
+                    )
+                    lines.append(
+                        f'{name}_count{{stage="{stage}"}} {histogram.count}'
+                    )
+            for counter, value in sorted(self.totals.items()):
+                name = f"{p}_{counter}_total"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value:g}")
+            for counter, value in sorted(self.cycle_counts.items()):
+                name = f"{p}_last_cycle_{counter}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value:g}")
+            for gauge, value in sorted(self.gauges.items()):
+                name = f"{p}_{gauge}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str | pathlib.Path) -> None:
+        """Writes the metrics to a file, for the node_exporter textfile
+        collector. The file is replaced atomically, so a scrape never sees a
+        partial file.
+
+        Args:
+            path (str | pathlib.Path): The path to write to.
+        """
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+metrics = MetricsRegistry()
+
+
+def serve_metrics(
+    port: int, registry: MetricsRegistry = metrics, host: str = ""
+) -> ThreadingHTTPServer:
+    """Serves the metrics over HTTP from a background thread.
+
+    Args:
+        port (int): The port to listen on.
+        registry (MetricsRegistry): The registry to serve. Defaults to the
+            module registry.
+        host (str): The address to bind to. Defaults to every interface.
+
+    Returns:
+        ThreadingHTTPServer: The running server. Call ``shutdown`` on it to
+            stop serving.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            logger.debug(format, *args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(
+        target=server.serve_forever, name="xscraper-metrics", daemon=True
+    )
+    thread.start()
+    logger.info("Serving metrics on port %d", port)
+    return server
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import logging
+import re
+from typing import TYPE_CHECKING
+
+import psycopg2
+from psycopg2 import sql
+
+from xscraper.sql.ensure import ENSURE_SCHEMA_QUERY
+from xscraper.sql.migrations import (
+    DISABLE_STATEMENT_TIMEOUT_QUERY,
+    DROP_INDEX_CONCURRENTLY_QUERY,
+    ENSURE_MIGRATIONS_TABLE_QUERY,
+    INSERT_SCHEMA_VERSION_QUERY,
+    LATEST_VERSION,
+    LOCK_MIGRATIONS_QUERY,
+    MIGRATION_LOCK_ID,
+    MIGRATIONS,
+    RESET_STATEMENT_TIMEOUT_QUERY,
+    SELECT_INVALID_INDEX_QUERY,
+    SELECT_SCHEMA_VERSION_QUERY,
+    UNLOCK_MIGRATIONS_QUERY,
+    Migration,
+)
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+    from psycopg2.extensions import cursor as Cursor
+
+logger = logging.getLogger(__name__)
+
+_CONCURRENT_INDEX_PATTERN = re.compile(
+    r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY (?:IF NOT EXISTS )?(\w+)",
+    re.IGNORECASE,
+)
+
+
+def select_schema_version(conn: Connection) -> int:
+    """Select the version of the last migration applied to the database.
+
+    Args:
+        conn (Connection): The database connection to use.
+
+    Returns:
+        int: The schema version, or 0 if no migration was ever applied.
+    """
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute(SELECT_SCHEMA_VERSION_QUERY)
+            version = cursor.fetchone()[0]
+        except psycopg2.errors.UndefinedTable:
+            version = 0
+    conn.rollback()
+    return version
+
+
+def drop_invalid_index(cursor: Cursor, statement: str) -> None:
+    """Drops the index a ``CREATE INDEX CONCURRENTLY`` statement builds if it
+    was left invalid by an earlier, interrupted build.
+
+    Args:
+        cursor (Cursor): The cursor to use, in autocommit mode.
+        statement (str): The statement about to be run.
+    """
+    match = _CONCURRENT_INDEX_PATTERN.match(statement)
+    if match is None:
+        return
+    name = match.group(1)
+    cursor.execute(SELECT_INVALID_INDEX_QUERY, (name,))
+    if cursor.fetchone() is None:
+        return
+    logger.warning("Dropping the invalid index %s before rebuilding it", name)
+    cursor.execute(
+        sql.SQL(DROP_INDEX_CONCURRENTLY_QUERY).format(sql.Identifier(name))
+    )
+
+
+def apply_migration(conn: Connection, migration: Migration) -> None:
+    """Applies a single migration and records its version.
+
+    A regular migration runs in a single transaction together with the version
+    record, so it is applied entirely or not at all. A concurrent migration
+    runs in autocommit mode, one statement at a time. Its statements must be
+    safe to run again, since a failure part way leaves the earlier ones
+    applied. An index that an interrupted concurrent build left invalid is
+    dropped before the build runs again.
+
+    Args:
+        conn (Connection): The database connection to use.
+        migration (Migration): The migration to apply.
+    """
+    logger.info(
+        "Applying migration %d: %s", migration.version, migration.description
+    )
+    if migration.concurrent:
+        conn.commit()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                for statement in migration.statements:
+                    drop_invalid_index(cursor, statement)
+                    cursor.execute(statement)
+                cursor.execute(
+                    INSERT_SCHEMA_VERSION_QUERY,
+                    (migration.version, migration.description),
+                )
+        finally:
+            conn.autocommit = False
+        return
+
+    try:
+        with conn.cursor() as cursor:
+            for statement in migration.statements:
+                cursor.execute(statement)
+            cursor.execute(
+                INSERT_SCHEMA_VERSION_QUERY,
+                (migration.version, migration.description),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def migrate(conn: Connection, target: int | None = None) -> int:
+    """Brings the database schema up to date.
+
+    When the schema is already current this costs a single query. Otherwise an
+    advisory lock is taken, so that several processes starting at once apply
+    each migration only once, and the pending migrations are applied in order.
+    The statement timeout of the connection is lifted while migrating, since
+    the lock wait, table rewrites and index builds can all outlast it.
+
+    Args:
+        conn (Connection): The database connection to use.
+        target (int | None): The version to migrate to. If None, every
+            migration is applied. Defaults to None.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    target = LATEST_VERSION if target is None else target
+    version = select_schema_version(conn)
+    if version >= target:
+        logger.debug("Database schema is at version %d", version)
+        return version
+
+    with conn.cursor() as cursor:
+        cursor.execute(DISABLE_STATEMENT_TIMEOUT_QUERY)
+        cursor.execute(LOCK_MIGRATIONS_QUERY, (MIGRATION_LOCK_ID,))
+        conn.commit()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(ENSURE_SCHEMA_QUERY)
+            cursor.execute(ENSURE_MIGRATIONS_TABLE_QUERY)
+        conn.commit()
+        # Another process may have migrated while we waited for the lock
+        version = select_schema_version(conn)
+        for migration in MIGRATIONS:
+            if version < migration.version <= target:
+                apply_migration(conn, migration)
+                version = migration.version
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute(UNLOCK_MIGRATIONS_QUERY, (MIGRATION_LOCK_ID,))
+            cursor.execute(RESET_STATEMENT_TIMEOUT_QUERY)
+        conn.commit()
+    logger.info("Database schema migrated to version %d", version)
+    return version
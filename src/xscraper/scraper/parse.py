@@ -1,15 +1,30 @@
 import datetime as dt
 import logging
+from operator import itemgetter
+from typing import Any
 
 import pytz
 from splatnet3_scraper.query import QueryResponse
 
 from xscraper import constants as xc
-from xscraper.scraper.utils import base64_decode, color_floats_to_hex
-from xscraper.types import Player, Schedule
+from xscraper.scraper.batch import PLAYER_COLUMNS, PlayerBatch
+from xscraper.scraper.interning import (
+    decode_id_number,
+    intern_string,
+    text_color_hex,
+)
+from xscraper.scraper.utils import base64_decode
+from xscraper.types import Mode, Player, Schedule
 
 logger = logging.getLogger(__name__)
 
+_node_fields = itemgetter(
+    "id", "name", "nameId", "rank", "xPower", "byname", "weapon", "nameplate"
+)
+_nameplate_fields = itemgetter("badges", "background")
+_background_fields = itemgetter("id", "textColor")
+_color_fields = itemgetter("r", "g", "b")
+
 
 def parse_player_data(data: QueryResponse) -> Player:
     """Parses the player data from the given QueryResponse object and returns a
@@ -23,7 +38,7 @@ def parse_player_data(data: QueryResponse) -> Player:
         Player: The parsed Player object.
     """
     badges = [
-        int(base64_decode(badge["id"]).split("-")[-1]) if badge else None
+        decode_id_number(badge["id"]) if badge else None
         for badge in data["nameplate", "badges"]
     ]
     # If badges is less than 3, fill the rest with None
@@ -34,27 +49,90 @@ def parse_player_data(data: QueryResponse) -> Player:
         name_id=data["nameId"],
         rank=data["rank"],
         x_power=data["xPower"],
-        weapon_id=int(base64_decode(data["weapon", "id"]).split("-")[-1]),
-        nameplate_id=int(
-            base64_decode(data["nameplate", "background", "id"]).split("-")[-1]
-        ),
+        weapon_id=decode_id_number(data["weapon", "id"]),
+        nameplate_id=decode_id_number(data["nameplate", "background", "id"]),
         badge_left_id=badges[0],
         badge_center_id=badges[1],
         badge_right_id=badges[2],
-        byname=data["byname"],
-        text_color=color_floats_to_hex(
-            r=data["nameplate", "background", "textColor", "r"],
-            g=data["nameplate", "background", "textColor", "g"],
-            b=data["nameplate", "background", "textColor", "b"],
+        byname=intern_string(data["byname"]),
+        text_color=text_color_hex(
+            data["nameplate", "background", "textColor", "r"],
+            data["nameplate", "background", "textColor", "g"],
+            data["nameplate", "background", "textColor", "b"],
         ),
     )
 
 
-def parse_players_in_mode(data: QueryResponse, mode: str) -> list[Player]:
+def parse_player_row(node: dict[str, Any]) -> tuple:
+    """Parses a raw player node into a row of values. This is the fast path
+    behind ``parse_players_in_mode`` and ``parse_player_batch``: it unpacks the
+    nested dicts once with precompiled getters instead of walking them again
+    for every field through ``QueryResponse`` indexing, and decodes the low
+    cardinality IDs and strings through the caches in
+    ``xscraper.scraper.interning``.
+
+    Args:
+        node (dict[str, Any]): The raw player node.
+
+    Returns:
+        tuple: The values of the row, in the order of ``PLAYER_COLUMNS``.
+    """
+    (
+        player_id,
+        name,
+        name_id,
+        rank,
+        x_power,
+        byname,
+        weapon,
+        nameplate,
+    ) = _node_fields(node)
+    badges, background = _nameplate_fields(nameplate)
+    nameplate_id, text_color = _background_fields(background)
+    r, g, b = _color_fields(text_color)
+    badge_ids = [
+        decode_id_number(badge["id"]) if badge else None for badge in badges
+    ]
+    # If badges is less than 3, fill the rest with None
+    badge_ids.extend([None] * (3 - len(badge_ids)))
+    return (
+        base64_decode(player_id).rpartition(":")[2],
+        name,
+        name_id,
+        rank,
+        x_power,
+        decode_id_number(weapon["id"]),
+        decode_id_number(nameplate_id),
+        intern_string(byname),
+        text_color_hex(r, g, b),
+        badge_ids[0],
+        badge_ids[1],
+        badge_ids[2],
+    )
+
+
+def parse_player_node(node: dict[str, Any]) -> Player:
+    """Parses a raw player node into a Player object. Gives the same output as
+    ``parse_player_data``.
+
+    Args:
+        node (dict[str, Any]): The raw player node.
+
+    Returns:
+        Player: The parsed Player object.
+    """
+    return dict(zip(PLAYER_COLUMNS, parse_player_row(node)))
+
+
+def parse_players_in_mode(
+    data: QueryResponse | dict[str, Any], mode: str
+) -> list[Player]:
     """Parses the player data in a specific game mode.
 
     Args:
-        data (QueryResponse): The response data containing player information.
+        data (QueryResponse | dict[str, Any]): The response data containing
+            player information, either wrapped in a QueryResponse or as the
+            raw decoded dict.
         mode (str): The game mode for which the players are being parsed.
 
     Returns:
@@ -62,14 +140,41 @@ def parse_players_in_mode(data: QueryResponse, mode: str) -> list[Player]:
             data.
     """
     logger.info("Parsing players for mode %s", mode)
+    if isinstance(data, QueryResponse):
+        data = data.data
     players = []
     for player_node in data["edges"]:
-        player_data = parse_player_data(player_node["node"])
+        player_data = parse_player_node(player_node["node"])
         player_data["mode"] = mode
         players.append(player_data)
     return players
 
 
+def parse_player_batch(
+    data: QueryResponse | dict[str, Any], mode: Mode
+) -> PlayerBatch:
+    """Parses the player data in a specific game mode into a columnar batch,
+    without building a dict per player.
+
+    Args:
+        data (QueryResponse | dict[str, Any]): The response data containing
+            player information, either wrapped in a QueryResponse or as the
+            raw decoded dict.
+        mode (Mode): The game mode for which the players are being parsed.
+
+    Returns:
+        PlayerBatch: The parsed players.
+    """
+    logger.info("Parsing a player batch for mode %s", mode)
+    if isinstance(data, QueryResponse):
+        data = data.data
+    batch = PlayerBatch(mode)
+    append_row = batch.append_row
+    for player_node in data["edges"]:
+        append_row(parse_player_row(player_node["node"]))
+    return batch
+
+
 def parse_time(time: str) -> dt.datetime:
     """Parses the given time string and returns a datetime object.
 
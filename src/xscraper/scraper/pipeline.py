@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import queue
+import threading
+from typing import TYPE_CHECKING, Sequence
+
+from splatnet3_scraper.query import QueryHandler, QueryResponse
+
+import xscraper.variables as xv
+from xscraper.scraper.accounts import AccountPool
+from xscraper.scraper.batch import PlayerBatch
+from xscraper.scraper.db import insert_player_batches
+from xscraper.scraper.metrics import metrics
+from xscraper.scraper.parse import parse_player_batch
+from xscraper.scraper.profiles import player_profiles
+from xscraper.scraper.scrape import (
+    PrefetchedPage,
+    stream_all_players_in_modes,
+)
+from xscraper.scraper.snapshot import LatestSnapshotCache
+from xscraper.scraper.spool import PlayerSpool, notify_flusher
+from xscraper.scraper.utils import (
+    calculate_season_number,
+    get_current_rotation_start,
+)
+from xscraper.types import Mode, Region
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class PipelineCancelled(Exception):
+    """Raised inside the crawler once another stage of the pipeline has failed,
+    so that the remaining pages are not pulled for nothing.
+    """
+
+
+def run_scrape_pipeline(
+    scraper: QueryHandler | AccountPool,
+    conn: Connection | None,
+    modes: Sequence[Mode],
+    timestamp: dt.datetime,
+    snapshots: LatestSnapshotCache,
+    max_workers: int | None = None,
+    queue_size: int | None = None,
+    batch_size: int | None = None,
+    spool: PlayerSpool | None = None,
+    prefetched: dict[tuple[Mode, Region], PrefetchedPage] | None = None,
+) -> int:
+    """Scrapes the given modes and writes the players to the database as a
+    streaming pipeline.
+
+    The crawler threads push every chunk onto a bounded queue as soon as it
+    arrives. The calling thread parses each chunk into a columnar
+    ``PlayerBatch``, enriches it and groups the batches into inserts of about
+    ``batch_size`` players, which a writer thread runs while the crawl is
+    still running. When a queue is full the stage in front of it blocks, so
+    memory stays flat however many pages there are. Every batch goes into the
+    same transaction, which is committed once at the end of the cycle, or
+    rolled back if any stage fails. Once the transaction is committed, the
+    players that were written become the cached latest snapshot of their mode.
+
+    If a spool is given, the batches are written to a spool segment instead
+    of the database, and the segment is committed at the end of the cycle.
+    The database is then only written to by the spool flusher.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The query handler to use for
+            scraping.
+        conn (Connection | None): The database connection to use. It is not
+            used if a spool is given.
+        modes (Sequence[Mode]): The modes to scrape.
+        timestamp (dt.datetime): The timestamp of the cycle.
+        snapshots (LatestSnapshotCache): The cache of the latest stored
+            snapshots, used to compute ``updated``. It must have been
+            validated for the given modes.
+        max_workers (int | None): The maximum number of requests to have in
+            flight at the same time. If None, the limit of the scraper is used.
+            Defaults to None.
+        queue_size (int | None): The number of chunks that can wait to be
+            parsed. If None, ``PIPELINE_QUEUE_SIZE`` is used. Defaults to None.
+        batch_size (int | None): The number of players per insert. If None,
+            ``PIPELINE_BATCH_SIZE`` is used. Defaults to None.
+        spool (PlayerSpool | None): The spool to write to instead of the
+            database. Defaults to None.
+        prefetched (dict[tuple[Mode, Region], PrefetchedPage] | None): The
+            first pages already pulled by the fingerprint probe, which are
+            not pulled again. Defaults to None.
+
+    Raises:
+        BaseException: The first error raised by any stage of the pipeline.
+
+    Returns:
+        int: The number of players scraped and written.
+    """
+    queue_size = queue_size or xv.PIPELINE_QUEUE_SIZE
+    batch_size = batch_size or xv.PIPELINE_BATCH_SIZE
+    chunks: queue.Queue = queue.Queue(maxsize=queue_size)
+    batches: queue.Queue = queue.Queue(maxsize=2)
+    cancelled = threading.Event()
+    errors: list[BaseException] = []
+    segment = spool.begin(timestamp) if spool is not None else None
+
+    def fail(error: BaseException) -> None:
+        if not isinstance(error, PipelineCancelled):
+            errors.append(error)
+        cancelled.set()
+
+    def emit(region: Region, mode: Mode, subresponse: QueryResponse) -> None:
+        if cancelled.is_set():
+            raise PipelineCancelled()
+        chunks.put((region, mode, subresponse))
+
+    def crawl() -> None:
+        try:
+            stream_all_players_in_modes(
+                scraper, modes, emit, max_workers, prefetched
+            )
+        except BaseException as e:
+            fail(e)
+        finally:
+            chunks.put(_DONE)
+
+    def write() -> None:
+        while True:
+            batch = batches.get()
+            if batch is _DONE:
+                return
+            if cancelled.is_set():
+                continue
+            try:
+                if segment is not None:
+                    segment.write(batch)
+                else:
+                    insert_player_batches(conn, batch, commit=False)
+            except BaseException as e:
+                fail(e)
+
+    crawler = threading.Thread(target=crawl, name="xscraper-crawler")
+    writer = threading.Thread(target=write, name="xscraper-writer")
+    crawler.start()
+    writer.start()
+
+    rotation_start = get_current_rotation_start()
+    season_number = calculate_season_number(timestamp)
+    batch: list[PlayerBatch] = []
+    batch_rows = 0
+    rows = 0
+    written: dict[Mode, dict[Region, dict[str, float]]] = {
+        mode: {} for mode in modes
+    }
+    try:
+        while True:
+            item = chunks.get()
+            if item is _DONE:
+                break
+            if cancelled.is_set():
+                # Keep draining so the crawler never blocks on a full queue
+                continue
+            try:
+                region, mode, subresponse = item
+                with metrics.time("parse"):
+                    players = parse_player_batch(subresponse, mode)
+                with metrics.time("enrich"):
+                    players.enrich(
+                        timestamp,
+                        region,
+                        rotation_start,
+                        season_number,
+                        snapshots.get(mode, region),
+                    )
+                written[mode].setdefault(region, {}).update(players.x_powers())
+                batch.append(players)
+                batch_rows += len(players)
+                rows += len(players)
+                if batch_rows >= batch_size:
+                    batches.put(batch)
+                    batch = []
+                    batch_rows = 0
+            except BaseException as e:
+                fail(e)
+        if batch and not cancelled.is_set():
+            batches.put(batch)
+    finally:
+        batches.put(_DONE)
+        crawler.join()
+        writer.join()
+
+    if errors:
+        if segment is not None:
+            logger.error("Scrape pipeline failed, discarding the spool segment")
+            segment.abort()
+        else:
+            logger.error("Scrape pipeline failed, rolling back the transaction")
+            conn.rollback()
+            player_profiles.rollback()
+        raise errors[0]
+
+    if segment is not None:
+        logger.info("Committing %d players to the spool", rows)
+        try:
+            with metrics.time("commit"):
+                segment.commit()
+        except BaseException:
+            segment.abort()
+            raise
+        notify_flusher()
+    else:
+        logger.info("Committing %d players to the database", rows)
+        with metrics.time("commit"):
+            conn.commit()
+        player_profiles.commit()
+    for mode, snapshot in written.items():
+        snapshots.replace(mode, timestamp, snapshot)
+    return rows
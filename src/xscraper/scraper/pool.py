@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
+
+import psycopg2
+from psycopg2 import extensions
+
+import xscraper.variables as xv
+from xscraper.scraper.db import get_db_credentials
+from xscraper.scraper.metrics import metrics
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """A thread-safe pool of PostgreSQL connections.
+
+    Connections are opened lazily up to ``max_size`` and at least ``min_size``
+    of them are kept open. A connection that has been idle for longer than the
+    health check interval is pinged before it is handed out, and a dead one is
+    replaced with a fresh connection, so the pool recovers on its own after a
+    server restart. Every connection is opened with a statement timeout. When
+    every connection is checked out, ``connection`` blocks until one is
+    returned.
+    """
+
+    def __init__(
+        self,
+        min_size: int | None = None,
+        max_size: int | None = None,
+        timeout: float | None = None,
+        health_check_after: float | None = None,
+        statement_timeout: float | None = None,
+        **kwargs,
+    ) -> None:
+        """Initializes the pool. Any argument left as None falls back to the
+        corresponding ``DB_POOL_*`` variable.
+
+        Args:
+            min_size (int | None): The number of connections to keep open.
+                Defaults to None.
+            max_size (int | None): The maximum number of open connections.
+                Defaults to None.
+            timeout (float | None): How long to wait for a free connection, in
+                seconds. Defaults to None.
+            health_check_after (float | None): How long a connection may sit
+                idle before it is pinged on checkout, in seconds. Defaults to
+                None.
+            statement_timeout (float | None): The statement timeout set on
+                every connection, in seconds. Defaults to None.
+            **kwargs: Additional keyword arguments to pass to the
+                psycopg2.connect function.
+        """
+        self.min_size = min_size or xv.DB_POOL_MIN_SIZE
+        self.max_size = max_size or xv.DB_POOL_MAX_SIZE
+        self.timeout = timeout or xv.DB_POOL_TIMEOUT.total_seconds()
+        self.health_check_after = (
+            health_check_after
+            if health_check_after is not None
+            else xv.DB_POOL_HEALTH_CHECK_AFTER.total_seconds()
+        )
+        self.statement_timeout = (
+            statement_timeout or xv.DB_STATEMENT_TIMEOUT.total_seconds()
+        )
+        self.kwargs = kwargs
+        self._idle: list[tuple[Connection, float]] = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __repr__(self) -> str:
+        return (
+            f"ConnectionPool(size={self._size}, idle={len(self._idle)}, "
+            f"max_size={self.max_size})"
+        )
+
+    @property
+    def size(self) -> int:
+        """The number of open connections, idle or checked out."""
+        return self._size
+
+    def _connect(self) -> Connection:
+        options = "-c statement_timeout=%d" % (self.statement_timeout * 1000)
+        attempt = 0
+        while True:
+            try:
+                conn = psycopg2.connect(
+                    **get_db_credentials(),
+                    options=options,
+                    keepalives=1,
+                    keepalives_idle=30,
+                    **self.kwargs,
+                )
+                metrics.inc("db_connections_opened")
+                return conn
+            except psycopg2.OperationalError as e:
+                if attempt >= xv.DB_CONNECT_RETRIES:
+                    raise
+                delay = 2**attempt
+                attempt += 1
+                logger.warning(
+                    "Failed to connect to the database (%s), retrying in %d "
+                    "seconds",
+                    e,
+                    delay,
+                )
+                time.sleep(delay)
+
+    @staticmethod
+    def _is_alive(conn: Connection) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _discard(conn: Connection) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self) -> Connection:
+        """Checks out a live connection, opening a new one if none is idle and
+        the pool is not full.
+
+        Raises:
+            PoolTimeout: If no connection became free within the timeout.
+            RuntimeError: If the pool has been closed.
+
+        Returns:
+            Connection: The connection. It must be given back with ``putconn``.
+        """
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, idle_since = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        "No database connection became free in "
+                        f"{self.timeout:.0f} seconds"
+                    )
+                self._condition.wait(remaining)
+
+        try:
+            if conn is not None and (
+                conn.closed
+                or (
+                    time.monotonic() - idle_since >= self.health_check_after
+                    and not self._is_alive(conn)
+                )
+            ):
+                logger.warning("Dropping a dead database connection")
+                metrics.inc("db_connections_dropped")
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        return conn
+
+    def putconn(self, conn: Connection, discard: bool = False) -> None:
+        """Gives a connection back to the pool. A connection left inside a
+        transaction is rolled back first, and a broken one is closed.
+
+        Args:
+            conn (Connection): The connection to give back.
+            discard (bool): Whether to close the connection instead of keeping
+                it. Defaults to False.
+        """
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        discard = discard or bool(conn.closed)
+        with self._condition:
+            if discard or self._closed:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """Checks out a connection for the body of a ``with`` block. If the
+        block fails with a connection level error, the connection is closed
+        instead of being given back.
+
+        Yields:
+            Connection: The connection.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def fill(self) -> None:
+        """Opens connections until ``min_size`` of them are open."""
+        conns = []
+        try:
+            while self._size < self.min_size:
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+
+    def close(self) -> None:
+        """Closes every idle connection and stops handing out new ones.
+        Connections still checked out are closed when they are given back.
+        """
+        with self._condition:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._condition.notify_all()
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Gets the process wide connection pool, creating it on first use. The
+    credentials are read from the environment when the first connection is
+    opened.
+
+    Returns:
+        ConnectionPool: The connection pool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def close_pool() -> None:
+    """Closes the process wide connection pool, if it was created."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Iterable
+
+from psycopg2.extras import execute_values
+
+import xscraper.variables as xv
+from xscraper.scraper.metrics import metrics
+from xscraper.sql.insert import UPSERT_PLAYER_PROFILES_QUERY
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import cursor as Cursor
+
+logger = logging.getLogger(__name__)
+
+ProfileKey = tuple
+
+
+def profile_key(row: tuple) -> ProfileKey:
+    """Gets the profile fields of a player row, in the column order of
+    ``PLAYER_PROFILE_COLUMNS``.
+
+    Args:
+        row (tuple): The row, in the order of ``PLAYER_KEYS``.
+
+    Returns:
+        ProfileKey: The profile fields.
+    """
+    return (
+        row[0],
+        row[1],
+        row[2],
+        row[7],
+        row[8],
+        row[6],
+        row[9],
+        row[10],
+        row[11],
+    )
+
+
+def fact_row(row: tuple, profile_id: int) -> tuple:
+    """Replaces the profile fields of a player row with the profile ID.
+
+    Args:
+        row (tuple): The row, in the order of ``PLAYER_KEYS``.
+        profile_id (int): The ID of the row's profile.
+
+    Returns:
+        tuple: The row, in the column order of ``INSERT_PLAYER_QUERY``.
+    """
+    return (row[0], profile_id, *row[3:6], *row[12:])
+
+
+class PlayerProfileCache:
+    """Maps the profile fields of players, their name, byname, nameplate and
+    badges, to their row in ``xscraper.player_profiles``.
+
+    These fields almost never change, so after the first cycle nearly every
+    player is a cache hit and ingest writes no profile at all. Profiles that
+    are missing are upserted in a single statement in the caller's
+    transaction. Their IDs are held as pending until that transaction is
+    committed, and dropped if it is rolled back, so the cache never points at
+    a profile that was never stored.
+    """
+
+    def __init__(self, max_size: int | None = None) -> None:
+        """Initializes an empty cache.
+
+        Args:
+            max_size (int | None): The number of profiles to keep. When it is
+                exceeded the cache is emptied. If None, ``PROFILE_CACHE_SIZE``
+                is used. Defaults to None.
+        """
+        self.max_size = max_size or xv.PROFILE_CACHE_SIZE
+        self.profiles: dict[ProfileKey, int] = {}
+        self.pending: dict[ProfileKey, int] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, cursor: Cursor, rows: Iterable[tuple]) -> list[tuple]:
+        """Replaces the profile fields of each row with its profile ID,
+        storing the profiles that are not known yet.
+
+        Args:
+            cursor (Cursor): The cursor to store missing profiles with.
+            rows (Iterable[tuple]): The rows, in the order of ``PLAYER_KEYS``.
+
+        Returns:
+            list[tuple]: The rows, in the column order of
+                ``INSERT_PLAYER_QUERY``.
+        """
+        rows = list(rows)
+        keys = [profile_key(row) for row in rows]
+        with self._lock:
+            ids = {
+                key: self.profiles.get(key) or self.pending.get(key)
+                for key in keys
+            }
+        missing = [key for key, profile_id in ids.items() if profile_id is None]
+        metrics.inc("profile_cache_hits", len(ids) - len(missing))
+        if missing:
+            metrics.inc("profile_cache_misses", len(missing))
+            logger.debug("Storing %d player profiles", len(missing))
+            stored = execute_values(
+                cursor,
+                UPSERT_PLAYER_PROFILES_QUERY,
+                missing,
+                page_size=len(missing),
+                fetch=True,
+            )
+            new = {tuple(fields): profile_id for profile_id, *fields in stored}
+            ids.update(new)
+            with self._lock:
+                self.pending.update(new)
+        return [fact_row(row, ids[key]) for row, key in zip(rows, keys)]
+
+    def commit(self) -> None:
+        """Keeps the profiles stored since the last commit or rollback. Call
+        this once their transaction is committed.
+        """
+        with self._lock:
+            if len(self.profiles) + len(self.pending) > self.max_size:
+                self.profiles = {}
+            self.profiles.update(self.pending)
+            self.pending = {}
+
+    def rollback(self) -> None:
+        """Forgets the profiles stored since the last commit or rollback. Call
+        this when their transaction is rolled back.
+        """
+        with self._lock:
+            self.pending = {}
+
+    def clear(self) -> None:
+        """Empties the cache."""
+        with self._lock:
+            self.profiles = {}
+            self.pending = {}
+
+
+player_profiles = PlayerProfileCache()
@@ -0,0 +1,345 @@
+import logging
+import re
+import threading
+import time
+
+import requests
+from splatnet3_scraper.query import QueryHandler, QueryResponse
+
+import xscraper.variables as xv
+from xscraper.scraper.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+THROTTLED = "throttled"
+SERVER_ERROR = "server_error"
+TIMEOUT = "timeout"
+OTHER = "other"
+
+RETRYABLE_ERRORS = (THROTTLED, SERVER_ERROR, TIMEOUT)
+
+status_pattern = re.compile(r"status(?: code)?:? (\d{3})")
+
+
+def classify_error(error: Exception) -> str:
+    """Classifies an exception raised by a query into one of the error kinds
+    the rate limiter reacts to.
+
+    Args:
+        error (Exception): The exception raised by the query.
+
+    Returns:
+        str: One of ``THROTTLED``, ``SERVER_ERROR``, ``TIMEOUT`` or ``OTHER``.
+    """
+    if isinstance(
+        error, (requests.Timeout, requests.ConnectionError, TimeoutError)
+    ):
+        return TIMEOUT
+    if type(error).__name__ == "RateLimitException":
+        return THROTTLED
+
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is None:
+        match = status_pattern.search(str(error))
+        if match is not None:
+            status_code = int(match.group(1))
+    if status_code == 429:
+        return THROTTLED
+    if status_code is not None and status_code >= 500:
+        return SERVER_ERROR
+    if isinstance(error, requests.exceptions.JSONDecodeError):
+        # Older versions of splatnet3_scraper try to decode the body of a
+        # failed request, so a non-JSON error page surfaces as a decode error.
+        return SERVER_ERROR
+    return OTHER
+
+
+class TokenBucket:
+    """A thread-safe token bucket that paces requests to a steady rate while
+    allowing short bursts.
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        """Initializes the bucket full.
+
+        Args:
+            rate (float): The number of tokens added per second.
+            capacity (int): The maximum number of tokens the bucket holds.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        """The number of tokens currently available."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def acquire(self) -> float:
+        """Takes a token from the bucket, sleeping until one is available.
+
+        Returns:
+            float: The number of seconds spent waiting for the token.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class AIMDLimiter:
+    """An additive-increase, multiplicative-decrease limit on the number of
+    requests in flight.
+
+    Every healthy response grows the limit by ``1 / limit``, so the limit grows
+    by roughly one per round trip's worth of responses. A throttled, failed or
+    slow response shrinks it by ``decrease_factor``, at most once per
+    ``latency_target`` so that a burst of failures from the same window only
+    counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        decrease_factor: float,
+        latency_target: float,
+    ) -> None:
+        """Initializes the limiter.
+
+        Args:
+            initial (int): The starting limit.
+            minimum (int): The lowest the limit can go.
+            maximum (int): The highest the limit can go.
+            decrease_factor (float): The factor the limit is multiplied by on
+                a congestion signal.
+            latency_target (float): The latency in seconds above which a
+                response counts as a congestion signal.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.latency_target = latency_target
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """The current number of requests allowed in flight."""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """The number of requests currently in flight."""
+        return self._in_flight
+
+    def acquire(self) -> None:
+        """Takes a slot, blocking until the number of requests in flight is
+        below the current limit.
+        """
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self) -> None:
+        """Gives back a slot taken with ``acquire``."""
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        """Records a successful response.
+
+        Args:
+            latency (float): The latency of the response in seconds.
+        """
+        if latency > self.latency_target:
+            self.on_congestion()
+            return
+        with self._condition:
+            self._limit = min(self.maximum, self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    def on_congestion(self) -> None:
+        """Records a throttled, failed or slow response."""
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease < self.latency_target:
+                return
+            self._last_decrease = now
+            self._limit = max(self.minimum, self._limit * self.decrease_factor)
+            logger.info("Lowering the concurrency limit to %d", self.limit)
+
+
+class RateLimitedQueryHandler:
+    """Wraps a ``QueryHandler`` with a token bucket, an adaptive concurrency
+    limit and retries with exponential backoff.
+
+    Throttled responses, server errors and timeouts shrink the concurrency
+    limit and are retried up to ``max_retries`` times. Any other error is
+    raised straight away.
+    """
+
+    def __init__(
+        self,
+        scraper: QueryHandler,
+        requests_per_second: float | None = None,
+        burst: int | None = None,
+        max_retries: int | None = None,
+    ) -> None:
+        """Initializes the wrapper. Any argument left as None falls back to the
+        corresponding ``RATE_LIMIT_*`` or ``CONCURRENCY_*`` variable.
+
+        Args:
+            scraper (QueryHandler): The query handler to wrap.
+            requests_per_second (float | None): The steady request rate.
+                Defaults to None.
+            burst (int | None): The number of requests allowed in a burst.
+                Defaults to None.
+            max_retries (int | None): The number of times a retryable error is
+                retried. Defaults to None.
+        """
+        self.scraper = scraper
+        self.bucket = TokenBucket(
+            requests_per_second or xv.RATE_LIMIT_REQUESTS_PER_SECOND,
+            burst or xv.RATE_LIMIT_BURST,
+        )
+        self.concurrency = AIMDLimiter(
+            initial=xv.CONCURRENCY_INITIAL,
+            minimum=xv.CONCURRENCY_MIN,
+            maximum=xv.CONCURRENCY_MAX,
+            decrease_factor=xv.CONCURRENCY_DECREASE_FACTOR,
+            latency_target=xv.CONCURRENCY_LATENCY_TARGET.total_seconds(),
+        )
+        self.max_retries = (
+            max_retries
+            if max_retries is not None
+            else xv.RATE_LIMIT_MAX_RETRIES
+        )
+        self.backoff = xv.RATE_LIMIT_BACKOFF.total_seconds()
+        self._counts = {
+            "requests": 0,
+            "successes": 0,
+            "retries": 0,
+            "failures": 0,
+            THROTTLED: 0,
+            SERVER_ERROR: 0,
+            TIMEOUT: 0,
+            OTHER: 0,
+        }
+        self._wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"RateLimitedQueryHandler({self.scraper!r})"
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._counts[key] += 1
+
+    @property
+    def concurrency_limit(self) -> int:
+        """The current number of requests allowed in flight."""
+        return self.concurrency.limit
+
+    @property
+    def counters(self) -> dict[str, float]:
+        """A snapshot of the request counters and the current limits."""
+        with self._lock:
+            out: dict[str, float] = dict(self._counts)
+            out["rate_limit_wait_seconds"] = self._wait_seconds
+        out["concurrency_limit"] = self.concurrency.limit
+        out["in_flight"] = self.concurrency.in_flight
+        out["requests_per_second"] = self.bucket.rate
+        out["tokens"] = self.bucket.tokens
+        return out
+
+    def _single_query(self, query_name: str, variables: dict) -> QueryResponse:
+        waited = self.bucket.acquire()
+        with self._lock:
+            self._wait_seconds += waited
+        self.concurrency.acquire()
+        try:
+            self._count("requests")
+            start = time.monotonic()
+            response = self.scraper.query(query_name, variables=variables)
+            self.concurrency.on_success(time.monotonic() - start)
+            self._count("successes")
+            return response
+        finally:
+            self.concurrency.release()
+
+    def query(
+        self, query_name: str, variables: dict | None = None
+    ) -> QueryResponse:
+        """Runs a query once a token and a concurrency slot are available,
+        retrying throttled, failed and timed out requests with exponential
+        backoff.
+
+        Args:
+            query_name (str): The name of the query to run.
+            variables (dict | None): The variables to use in the query. If
+                None, the query is run without variables. Defaults to None.
+
+        Raises:
+            Exception: The last error raised by the query, if it could not be
+                completed within the allowed number of retries.
+
+        Returns:
+            QueryResponse: The response from the query.
+        """
+        if variables is None:
+            variables = {}
+        attempt = 0
+        while True:
+            try:
+                return self._single_query(query_name, variables)
+            except Exception as e:
+                kind = classify_error(e)
+                self._count(kind)
+                metrics.inc(f"request_errors_{kind}")
+                if kind not in RETRYABLE_ERRORS:
+                    self._count("failures")
+                    raise
+                self.concurrency.on_congestion()
+                if attempt >= self.max_retries:
+                    logger.error(
+                        "Query %s failed after %d retries: %s",
+                        query_name,
+                        attempt,
+                        e,
+                    )
+                    self._count("failures")
+                    raise
+                delay = self.backoff * 2**attempt
+                attempt += 1
+                self._count("retries")
+                metrics.inc("retries")
+                logger.warning(
+                    "Query %s failed (%s), retrying in %.1f seconds",
+                    query_name,
+                    kind,
+                    delay,
+                )
+                time.sleep(delay)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import pathlib
+from typing import TYPE_CHECKING, Any, Iterable
+
+from splatnet3_scraper.query import QueryResponse
+
+from xscraper import constants as xc
+from xscraper.scraper.archive import read_segments
+from xscraper.scraper.batch import PlayerBatch
+from xscraper.scraper.db import (
+    ensure_player_partitions,
+    insert_player_batches,
+    insert_schedule,
+)
+from xscraper.scraper.parse import parse_player_batch, parse_schedule
+from xscraper.scraper.utils import (
+    calculate_season_number,
+    round_down_nearest_rotation,
+)
+from xscraper.types import ModeName, Region
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+detailed_x_query_prefix = xc.detailed_x_query.split("%s")[0]
+
+
+class Replayer:
+    """Feeds archived responses through the parser and the database writer.
+
+    Records are replayed in the order they were archived. Detailed records
+    pulled only to probe a leaderboard for changes are skipped, since the live
+    run stored nothing from them and a mode it left unchanged must not be
+    replayed as a cycle of its first page only. The region of each detailed
+    record is read from the record itself, or, in archives written
+    before it was recorded, recovered by mapping the season ID back to its
+    region using the archived ``XRankingQuery`` responses. The players of
+    each cycle are enriched the same way ``scrape`` enriches them, with the
+    ``updated`` flag computed against the previous replayed cycle of the same
+    mode.
+    """
+
+    def __init__(self, conn: Connection | None = None) -> None:
+        """Initializes the replayer.
+
+        Args:
+            conn (Connection | None): The database connection to write to. If
+                None, the records are parsed but nothing is written, which is
+                useful for benchmarking the parser. Defaults to None.
+        """
+        self.conn = conn
+        self.season_regions: dict[str, Region] = {}
+        self.previous: dict[ModeName, dict[str, float]] = {}
+        self.current: dict[ModeName, dict[str, float]] = {}
+        self.batches: list[PlayerBatch] = []
+        self.cycle: dt.datetime | None = None
+        self.counts = {
+            "records": 0,
+            "cycles": 0,
+            "players": 0,
+            "schedules": 0,
+            "probes": 0,
+            "skipped": 0,
+        }
+
+    def handle_season(self, record: dict[str, Any]) -> None:
+        """Maps the season ID in an ``XRankingQuery`` record to its region.
+
+        Args:
+            record (dict[str, Any]): The archived record.
+        """
+        response = QueryResponse(record["data"])
+        season_id = response[xc.current_season_path]
+        self.season_regions[season_id] = record["variables"]["region"]
+
+    def handle_schedule(self, record: dict[str, Any]) -> None:
+        """Parses a schedule record and writes it to the database.
+
+        Args:
+            record (dict[str, Any]): The archived record.
+        """
+        schedules = parse_schedule(QueryResponse(record["data"]))
+        self.counts["schedules"] += len(schedules)
+        if self.conn is not None:
+            insert_schedule(self.conn, schedules)
+
+    def handle_players(
+        self, record: dict[str, Any], cycle: dt.datetime
+    ) -> None:
+        """Parses and enriches the players in a detailed query record.
+
+        Args:
+            record (dict[str, Any]): The archived record.
+            cycle (dt.datetime): The timestamp of the cycle the record belongs
+                to.
+        """
+        variables = record["variables"]
+        mode = variables["mode"]
+        region = record.get("region") or self.season_regions.get(
+            variables["id"]
+        )
+        if region is None:
+            logger.warning(
+                "Unknown region for season %s, skipping record",
+                variables["id"],
+            )
+            self.counts["skipped"] += 1
+            return
+
+        batch = parse_player_batch(
+            record["data"]["node"][f"xRanking{mode}"], mode
+        )
+        mode_name = xc.mode_map[mode]
+        batch.enrich(
+            cycle,
+            region,
+            round_down_nearest_rotation(cycle),
+            calculate_season_number(cycle),
+            self.previous.get(mode_name, {}),
+        )
+        self.current.setdefault(mode_name, {}).update(batch.x_powers())
+        self.batches.append(batch)
+
+    def flush(self) -> None:
+        """Writes the players of the current cycle to the database and makes
+        the cycle the baseline for the ``updated`` flag.
+        """
+        if self.cycle is None:
+            return
+        players = sum(len(batch) for batch in self.batches)
+        logger.info("Replayed cycle %s with %d players", self.cycle, players)
+        if players and self.conn is not None:
+            ensure_player_partitions(self.conn, self.cycle)
+            insert_player_batches(self.conn, self.batches)
+        self.counts["cycles"] += 1
+        self.counts["players"] += players
+        self.previous.update(self.current)
+        self.current = {}
+        self.batches = []
+
+    def replay(self, records: Iterable[dict[str, Any]]) -> dict[str, int]:
+        """Replays the given records.
+
+        Args:
+            records (Iterable[dict[str, Any]]): The archived records.
+
+        Returns:
+            dict[str, int]: The number of records, cycles, players and
+                schedules replayed, and the number of probe records and other
+                records skipped.
+        """
+        for record in records:
+            self.counts["records"] += 1
+            query_name = record["query"]
+            if query_name == xc.query:
+                self.handle_season(record)
+                continue
+            if query_name == xc.schedule_query:
+                self.handle_schedule(record)
+                continue
+            if not query_name.startswith(detailed_x_query_prefix):
+                self.counts["skipped"] += 1
+                continue
+            if record.get("probe"):
+                self.counts["probes"] += 1
+                continue
+            if record.get("cycle") is None:
+                logger.warning("Record without a cycle, skipping")
+                self.counts["skipped"] += 1
+                continue
+
+            cycle = dt.datetime.fromisoformat(record["cycle"])
+            if cycle != self.cycle:
+                self.flush()
+                self.cycle = cycle
+            self.handle_players(record, cycle)
+
+        self.flush()
+        return self.counts
+
+
+def replay_segments(
+    paths: Iterable[str | pathlib.Path], conn: Connection | None = None
+) -> dict[str, int]:
+    """Replays the given archive segments into the database.
+
+    Args:
+        paths (Iterable[str | pathlib.Path]): The segments to replay, in the
+            order they were written.
+        conn (Connection | None): The database connection to write to. If None,
+            the records are only parsed. Defaults to None.
+
+    Returns:
+        dict[str, int]: The number of records, cycles, players and schedules
+            replayed, and the number of probe records and other records
+            skipped.
+    """
+    return Replayer(conn).replay(read_segments(paths))
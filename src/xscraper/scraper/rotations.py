@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from typing import TYPE_CHECKING, Iterable
+
+from splatnet3_scraper.query import QueryHandler
+
+import xscraper.variables as xv
+from xscraper.scraper.accounts import AccountPool
+from xscraper.scraper.db import insert_schedule, select_schedule
+from xscraper.scraper.metrics import metrics
+from xscraper.scraper.pool import get_pool
+from xscraper.scraper.scrape import get_schedule
+from xscraper.types import Schedule
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+
+class RotationCalendar:
+    """Keeps the upstream rotation schedule in memory, so the current and
+    previous rotation of a cycle are found with a binary search instead of a
+    database query.
+
+    The upstream schedule lists the rotations of about the next day. Once the
+    time it still covers drops below ``ROTATION_CALENDAR_REFRESH_HORIZON``, it
+    is fetched again from a background thread while cycles keep running on
+    the rotations already known. Only an empty calendar, or one that has run
+    out, is fetched in the foreground.
+    """
+
+    def __init__(self, refresh_horizon: dt.timedelta | None = None) -> None:
+        """Initializes an empty calendar.
+
+        Args:
+            refresh_horizon (dt.timedelta | None): How much of the future the
+                calendar must still cover before it is fetched again. If None,
+                ``ROTATION_CALENDAR_REFRESH_HORIZON`` is used. Defaults to
+                None.
+        """
+        self.refresh_horizon = (
+            refresh_horizon
+            if refresh_horizon is not None
+            else xv.ROTATION_CALENDAR_REFRESH_HORIZON
+        )
+        self.schedules: list[Schedule] = []
+        self.starts: list[dt.datetime] = []
+        self.ends: list[dt.datetime] = []
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def load(self, schedules: Iterable[Schedule]) -> None:
+        """Adds schedules to the calendar. A schedule with the same start time
+        as a known one replaces it. Rotations that ended more than two days
+        before the last known one are dropped.
+
+        Args:
+            schedules (Iterable[Schedule]): The schedules to add.
+        """
+        with self._lock:
+            by_start = {
+                schedule["start_time"]: schedule for schedule in self.schedules
+            }
+            for schedule in schedules:
+                by_start[schedule["start_time"]] = schedule
+            ordered = sorted(by_start.values(), key=lambda s: s["start_time"])
+            if ordered:
+                cutoff = ordered[-1]["end_time"] - dt.timedelta(days=2)
+                ordered = [s for s in ordered if s["end_time"] >= cutoff]
+            self.schedules = ordered
+            self.starts = [schedule["start_time"] for schedule in ordered]
+            self.ends = [schedule["end_time"] for schedule in ordered]
+
+    def current(self, timestamp: dt.datetime) -> Schedule | None:
+        """Finds the rotation running at the given time.
+
+        Args:
+            timestamp (dt.datetime): The time.
+
+        Returns:
+            Schedule | None: The rotation, or None if the calendar does not
+                cover the given time.
+        """
+        with self._lock:
+            idx = bisect_right(self.starts, timestamp) - 1
+            if idx < 0 or self.ends[idx] <= timestamp:
+                return None
+            return self.schedules[idx]
+
+    def previous(self, timestamp: dt.datetime) -> Schedule | None:
+        """Finds the last rotation that ended before the given time.
+
+        Args:
+            timestamp (dt.datetime): The time.
+
+        Returns:
+            Schedule | None: The rotation, or None if the calendar holds no
+                rotation that ended before the given time.
+        """
+        with self._lock:
+            idx = bisect_left(self.ends, timestamp) - 1
+            if idx < 0:
+                return None
+            return self.schedules[idx]
+
+    def horizon(self, timestamp: dt.datetime) -> dt.timedelta:
+        """Gets how far past the given time the calendar reaches.
+
+        Args:
+            timestamp (dt.datetime): The time.
+
+        Returns:
+            dt.timedelta: The time until the end of the last known rotation,
+                zero or negative if the calendar has run out.
+        """
+        with self._lock:
+            if not self.ends:
+                return dt.timedelta(0)
+            return self.ends[-1] - timestamp
+
+    def warm(self, conn: Connection) -> None:
+        """Seeds the calendar with the current and previous rotations stored
+        in the database. The previous one is not part of the upstream
+        schedule, so it is only known this way after a restart.
+
+        Args:
+            conn (Connection): The database connection to use.
+        """
+        schedules = [
+            schedule
+            for schedule in (
+                select_schedule(conn),
+                select_schedule(conn, True),
+            )
+            if schedule is not None
+        ]
+        conn.rollback()
+        self.load(schedules)
+
+    def fetch(
+        self,
+        scraper: QueryHandler | AccountPool,
+        conn: Connection | None = None,
+    ) -> None:
+        """Fetches the upstream schedule into the calendar, and stores it in the
+        schedules table. A failure to store the schedule is only logged.
+
+        Args:
+            scraper (QueryHandler | AccountPool): The query handler to use.
+            conn (Connection | None): The database connection to store the
+                schedule with. If None, a connection is checked out of the
+                connection pool. Defaults to None.
+        """
+        schedules = get_schedule(scraper)
+        self.load(schedules)
+        metrics.inc("calendar_refreshes")
+        logger.info(
+            "Loaded %d rotations, known until %s",
+            len(schedules),
+            self.ends[-1] if self.ends else None,
+        )
+        try:
+            if conn is None:
+                with get_pool().connection() as conn:
+                    insert_schedule(conn, schedules)
+            else:
+                insert_schedule(conn, schedules)
+        except Exception as e:
+            # The calendar is loaded already, storing the schedule is best
+            # effort
+            logger.warning("Failed to store the schedule: %s", e)
+
+    def refresh_in_background(
+        self, scraper: QueryHandler | AccountPool, timestamp: dt.datetime
+    ) -> None:
+        """Starts fetching the upstream schedule from a background thread if
+        the calendar covers less than the refresh horizon past the given time.
+        At most one fetch runs at a time, and a failed fetch is retried on the
+        next call.
+
+        Args:
+            scraper (QueryHandler | AccountPool): The query handler to use.
+            timestamp (dt.datetime): The current time.
+        """
+        if self.horizon(timestamp) >= self.refresh_horizon:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh() -> None:
+            try:
+                self.fetch(scraper)
+            except Exception as e:
+                logger.warning("Failed to refresh the rotation calendar: %s", e)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        logger.info("Refreshing the rotation calendar in the background")
+        threading.Thread(
+            target=refresh, name="xscraper-calendar", daemon=True
+        ).start()
+
+    def clear(self) -> None:
+        """Empties the calendar."""
+        with self._lock:
+            self.schedules = []
+            self.starts = []
+            self.ends = []
+
+
+rotation_calendar = RotationCalendar()
@@ -1,10 +1,17 @@
 import datetime as dt
 import logging
+from functools import partial
+from typing import Any, Callable, Iterator, NamedTuple, Sequence
 
 import pytz
 from splatnet3_scraper.query import QueryHandler, QueryResponse
 
 from xscraper import constants as xc
+from xscraper.scraper.accounts import AccountPool, checkout, max_workers_for
+from xscraper.scraper.archive import capture
+from xscraper.scraper.cache import season_cache
+from xscraper.scraper.crawl import run_concurrently
+from xscraper.scraper.metrics import metrics
 from xscraper.scraper.parse import parse_players_in_mode, parse_schedule
 from xscraper.scraper.utils import calculate_season_number
 from xscraper.types import Mode, Player, Region, Schedule
@@ -12,31 +19,97 @@ from xscraper.types import Mode, Player, Region, Schedule
 logger = logging.getLogger(__name__)
 
 
-def get_current_season(scraper: QueryHandler, region: Region) -> str:
-    """Retrieves the current season for a given region using the provided
-    scraper.
+class StaleSeasonError(Exception):
+    """Raised when a detailed query returns an empty node or a node for a
+    different season than the one requested, which means the season ID used
+    for the query is no longer current.
+    """
+
+
+class PageChunk(NamedTuple):
+    """A chunk of a leaderboard page, along with the query it was pulled with,
+    so that it can be archived again if it is handed to the crawl.
+    """
+
+    query_name: str
+    variables: dict[str, Any]
+    response: QueryResponse
+
+    @property
+    def subresponse(self) -> QueryResponse:
+        """The ``xRanking{mode}`` part of the chunk."""
+        return self.response["node", f"xRanking{self.variables['mode']}"]
+
+
+class PrefetchedPage(NamedTuple):
+    """The chunks of a leaderboard page pulled ahead of the crawl, and the
+    season ID they were pulled with.
+    """
+
+    season_id: str
+    chunks: list[PageChunk]
+
+
+def fetch_current_season(
+    scraper: QueryHandler | AccountPool, region: Region
+) -> str:
+    """Queries the current season for a given region, bypassing the season
+    cache.
 
     Args:
-        scraper (QueryHandler): The scraper object used to make the query.
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
         region (Region): The region for which to retrieve the current season.
 
     Returns:
         str: The current season for the specified region.
     """
     logger.info("Retrieving current season for %s", region)
-    response = scraper.query(xc.query, variables={"region": region})
+    variables = {"region": region}
+    metrics.inc("requests")
+    with metrics.time("season_lookup"):
+        response = scraper.query(xc.query, variables=variables)
+    capture(xc.query, variables, response)
     return response[xc.current_season_path]
 
 
-def pull_detailed_data(
+def get_current_season(
+    scraper: QueryHandler | AccountPool, region: Region, use_cache: bool = True
+) -> str:
+    """Retrieves the current season for a given region using the provided
+    scraper.
+
+    The season ID is served from the season cache when possible, since it only
+    changes a few times a year.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        region (Region): The region for which to retrieve the current season.
+        use_cache (bool): Whether to use the season cache. Defaults to True.
+
+    Returns:
+        str: The current season for the specified region.
+    """
+    if not use_cache:
+        return fetch_current_season(scraper, region)
+    return season_cache.get_or_fetch(
+        region, partial(fetch_current_season, scraper)
+    )
+
+
+def pull_page_chunk(
     scraper: QueryHandler,
     season_id: str,
     mode: Mode,
     page: int,
     cursor: str,
     weapons: bool = False,
-) -> QueryResponse:
-    """Pulls detailed data for a specific season, mode, and page.
+    region: Region | None = None,
+    probe: bool = False,
+) -> PageChunk:
+    """Pulls a single chunk of detailed data for a specific season, mode, and
+    page.
 
     Args:
         scraper (QueryHandler): The scraper object used to make the query.
@@ -45,10 +118,14 @@ def pull_detailed_data(
         page (int): The page number for which to pull the data.
         cursor (str): The cursor for which to pull the data.
         weapons (bool, optional): If True, pull weapon data. Defaults to False.
+        region (Region | None): The region the season ID belongs to, recorded
+            along with the response when it is archived. Defaults to None.
+        probe (bool): Whether the response is only pulled to probe the
+            leaderboard for changes, recorded along with the response when it
+            is archived. Defaults to False.
 
     Returns:
-        QueryResponse: The response data containing the detailed player
-            information.
+        PageChunk: The response, along with the query it was pulled with.
     """
     logger.info(
         "Pulling detailed data for season %s, mode %s, page %d, cursor %s",
@@ -65,55 +142,276 @@ def pull_detailed_data(
     }
     base_query = xc.detailed_weapon_query if weapons else xc.detailed_x_query
     detailed_query = base_query % mode
-    return scraper.query(detailed_query, variables=variables)
+    metrics.inc("requests")
+    with metrics.time("page_fetch"):
+        response = scraper.query(detailed_query, variables=variables)
+    capture(detailed_query, variables, response, region=region, probe=probe)
+    return PageChunk(detailed_query, variables, response)
 
 
-def scrape_all_players_in_region_and_mode(
-    scraper: QueryHandler, season_id: str, mode: str
-) -> list[Player]:
-    """Scrapes all players in a specific region and mode for a given season.
+def pull_detailed_data(
+    scraper: QueryHandler,
+    season_id: str,
+    mode: Mode,
+    page: int,
+    cursor: str,
+    weapons: bool = False,
+    region: Region | None = None,
+    probe: bool = False,
+) -> QueryResponse:
+    """Pulls detailed data for a specific season, mode, and page.
 
     Args:
         scraper (QueryHandler): The scraper object used to make the query.
         season_id (str): The season ID for which to pull the data.
-        mode (str): The mode for which to pull the data.
+        mode (Mode): The mode for which to pull the data.
+        page (int): The page number for which to pull the data.
+        cursor (str): The cursor for which to pull the data.
+        weapons (bool, optional): If True, pull weapon data. Defaults to False.
+        region (Region | None): The region the season ID belongs to, recorded
+            along with the response when it is archived. Defaults to None.
+        probe (bool): Whether the response is only pulled to probe the
+            leaderboard for changes, recorded along with the response when it
+            is archived. Defaults to False.
 
     Returns:
-        list[Player]: A list of Player objects containing the scraped player
-            data.
+        QueryResponse: The response data containing the detailed player
+            information.
     """
-    logger.info("Scraping all players in region and mode")
-    players = []
-    for page in range(1, 6):
-        has_next_page = True
-        cursor = None
+    return pull_page_chunk(
+        scraper, season_id, mode, page, cursor, weapons, region, probe
+    ).response
+
+
+def iter_page_chunks(
+    scraper: QueryHandler | AccountPool,
+    season_id: str,
+    mode: Mode,
+    page: int,
+    region: Region | None = None,
+    probe: bool = False,
+) -> Iterator[QueryResponse]:
+    """Pulls the chunks of a single page of the leaderboard for a given season
+    and mode, yielding the ``xRanking{mode}`` part of each chunk as soon as it
+    arrives. See ``pull_page_chunks``.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        season_id (str): The season ID for which to pull the data.
+        mode (Mode): The mode for which to pull the data.
+        page (int): The page number to pull.
+        region (Region | None): The region the season ID belongs to, recorded
+            with each archived response. Defaults to None.
+        probe (bool): Whether the page is only pulled to probe the leaderboard
+            for changes, recorded with each archived response. Defaults to
+            False.
+
+    Raises:
+        StaleSeasonError: If the response does not contain the leaderboard for
+            the requested season.
+
+    Yields:
+        QueryResponse: The ``xRanking{mode}`` part of each chunk, holding the
+            player edges and the page info.
+    """
+    for chunk in pull_page_chunks(
+        scraper, season_id, mode, page, region, probe
+    ):
+        yield chunk.subresponse
+
+
+def pull_page_chunks(
+    scraper: QueryHandler | AccountPool,
+    season_id: str,
+    mode: Mode,
+    page: int,
+    region: Region | None = None,
+    probe: bool = False,
+) -> Iterator[PageChunk]:
+    """Pulls the chunks of a single page of the leaderboard for a given season
+    and mode, yielding each chunk as soon as it arrives.
+
+    Each page is split into several chunks that are linked by a cursor, so the
+    chunks within a page must be pulled one after another. If the scraper is an
+    ``AccountPool``, the whole cursor chain is pulled with a single account.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        season_id (str): The season ID for which to pull the data.
+        mode (Mode): The mode for which to pull the data.
+        page (int): The page number to pull.
+        region (Region | None): The region the season ID belongs to, recorded
+            with each archived response. Defaults to None.
+        probe (bool): Whether the page is only pulled to probe the leaderboard
+            for changes, recorded with each archived response. Defaults to
+            False.
+
+    Raises:
+        StaleSeasonError: If the response does not contain the leaderboard for
+            the requested season.
+
+    Yields:
+        PageChunk: Each chunk, along with the query it was pulled with.
+    """
+    logger.info(
+        "Scraping page %d for season %s, mode %s", page, season_id, mode
+    )
+    has_next_page = True
+    cursor = None
+    with checkout(scraper) as handler:
         while has_next_page:
-            response = pull_detailed_data(
-                scraper=scraper,
+            chunk = pull_page_chunk(
+                scraper=handler,
                 season_id=season_id,
                 mode=mode,
                 page=page,
                 cursor=cursor,
+                region=region,
+                probe=probe,
             )
-            subresponse = response["node", f"xRanking{mode}"]
-            players.extend(parse_players_in_mode(subresponse, mode))
+            node = chunk.response.data.get("node")
+            if (
+                not node
+                or not node.get(f"xRanking{mode}")
+                or node.get("id", season_id) != season_id
+            ):
+                raise StaleSeasonError(
+                    f"Empty or mismatched node for season {season_id}"
+                )
+            subresponse = chunk.subresponse
             has_next_page = subresponse["pageInfo", "hasNextPage"]
             cursor = subresponse["pageInfo", "endCursor"]
+            yield chunk
+
+
+def scrape_page(
+    scraper: QueryHandler | AccountPool,
+    season_id: str,
+    mode: Mode,
+    page: int,
+    region: Region | None = None,
+) -> list[Player]:
+    """Scrapes a single page of the leaderboard for a given season and mode.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        season_id (str): The season ID for which to pull the data.
+        mode (Mode): The mode for which to pull the data.
+        page (int): The page number to pull.
+        region (Region | None): The region the season ID belongs to, recorded
+            with each archived response. Defaults to None.
+
+    Raises:
+        StaleSeasonError: If the response does not contain the leaderboard for
+            the requested season.
+
+    Returns:
+        list[Player]: A list of Player objects containing the scraped player
+            data for the page.
+    """
+    players = []
+    for subresponse in iter_page_chunks(scraper, season_id, mode, page, region):
+        players.extend(parse_players_in_mode(subresponse, mode))
     return players
 
 
+def scrape_region_page(
+    scraper: QueryHandler | AccountPool,
+    region: Region,
+    season_id: str,
+    mode: Mode,
+    page: int,
+) -> list[Player]:
+    """Scrapes a single page of the leaderboard for a given region and mode.
+
+    If the season ID turns out to be stale, it is dropped from the season cache
+    and the page is pulled once more with a freshly queried season ID.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        region (Region): The region the season ID belongs to.
+        season_id (str): The season ID for which to pull the data.
+        mode (Mode): The mode for which to pull the data.
+        page (int): The page number to pull.
+
+    Returns:
+        list[Player]: A list of Player objects containing the scraped player
+            data for the page.
+    """
+    try:
+        return scrape_page(scraper, season_id, mode, page, region)
+    except StaleSeasonError:
+        logger.warning(
+            "Season %s for %s looks stale, refreshing the season cache",
+            season_id,
+            region,
+        )
+        season_cache.invalidate(region, season_id)
+        season_id = get_current_season(scraper, region)
+        return scrape_page(scraper, season_id, mode, page, region)
+
+
+def scrape_all_players_in_region_and_mode(
+    scraper: QueryHandler | AccountPool,
+    season_id: str,
+    mode: str,
+    max_workers: int | None = None,
+) -> list[Player]:
+    """Scrapes all players in a specific region and mode for a given season.
+
+    The pages are pulled concurrently, but the players are returned in page
+    order.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        season_id (str): The season ID for which to pull the data.
+        mode (str): The mode for which to pull the data.
+        max_workers (int | None): The maximum number of pages to pull at the
+            same time. If None, the limit of the scraper is used, see
+            ``max_workers_for``. Defaults to None.
+
+    Returns:
+        list[Player]: A list of Player objects containing the scraped player
+            data.
+    """
+    logger.info("Scraping all players in region and mode")
+    max_workers = max_workers_for(scraper, max_workers)
+    pages = run_concurrently(
+        (
+            partial(scrape_page, scraper, season_id, mode, page)
+            for page in xc.pages
+        ),
+        max_workers=max_workers,
+    )
+    return [player for page in pages for player in page]
+
+
 def scrape_all_players_in_mode(
-    scraper: QueryHandler,
+    scraper: QueryHandler | AccountPool,
     mode: Mode,
     timestamp: dt.datetime | None = None,
+    max_workers: int | None = None,
 ) -> list[Player]:
     """Scrapes all players in a given mode.
 
+    The season lookups for every region are done concurrently, and then every
+    page of every region is pulled on a single bounded pool. The players are
+    returned in region order, then page order.
+
     Args:
-        scraper (QueryHandler): The query handler object used for scraping.
+        scraper (QueryHandler | AccountPool): The query handler object used for
+            scraping.
         mode (Mode): The mode for which players need to be scraped.
         timestamp (datetime.datetime | None, optional): The timestamp to be used
             for player records. Defaults to None.
+        max_workers (int | None): The maximum number of requests to have in
+            flight at the same time. If None, the limit of the scraper is used,
+            see ``max_workers_for``. Defaults to None.
 
     Returns:
         list[Player]: A list of Player objects scraped from the given mode.
@@ -126,44 +424,170 @@ def scrape_all_players_in_mode(
         timestamp_insert = dt.datetime.now(utc_tz)
 
     season_number = calculate_season_number(timestamp_insert)
-    for region in xc.regions:
-        logger.info(
-            "Scraping all players in mode %s for region %s", mode, region
+    max_workers = max_workers_for(scraper, max_workers)
+    logger.info("Scraping all players in mode %s for all regions", mode)
+    season_ids = run_concurrently(
+        (partial(get_current_season, scraper, region) for region in xc.regions),
+        max_workers=max_workers,
+    )
+    tasks = [
+        (
+            region,
+            partial(scrape_region_page, scraper, region, season_id, mode, page),
         )
-        season_id = get_current_season(scraper, region)
+        for region, season_id in zip(xc.regions, season_ids)
+        for page in xc.pages
+    ]
+    pages = run_concurrently(
+        (task for _, task in tasks), max_workers=max_workers
+    )
 
-        players = []
-        players.extend(
-            scrape_all_players_in_region_and_mode(scraper, season_id, mode)
-        )
-        logger.info(
-            "Appending timestamp, region, mode, and season number to players"
-        )
+    logger.info(
+        "Appending timestamp, region, mode, and season number to players"
+    )
+    for (region, _), players in zip(tasks, pages):
         for player in players:
             player["timestamp"] = timestamp_insert
             player["region"] = xc.region_map_bool[region]
             player["mode"] = xc.mode_map[mode]
             player["season_number"] = season_number
-
         out.extend(players)
 
-        logger.info(
-            "Scraped all players in mode %s for region %s", mode, region
+    logger.info("Scraped all players in mode %s for all regions", mode)
+    return out
+
+
+def stream_region_page(
+    scraper: QueryHandler | AccountPool,
+    region: Region,
+    season_id: str,
+    mode: Mode,
+    page: int,
+    emit: Callable[[Region, Mode, QueryResponse], None],
+    prefetched: PrefetchedPage | None = None,
+) -> None:
+    """Pulls a single page of the leaderboard for a given region and mode,
+    handing every chunk to ``emit`` as soon as it arrives.
+
+    If the page was already pulled with the same season ID, by the
+    fingerprint probe, its chunks are archived as part of the crawl and
+    emitted without being pulled again.
+
+    If the season ID turns out to be stale before any chunk was emitted, it is
+    dropped from the season cache and the page is pulled once more with a
+    freshly queried season ID.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The scraper object used to make
+            the query.
+        region (Region): The region the season ID belongs to.
+        season_id (str): The season ID for which to pull the data.
+        mode (Mode): The mode for which to pull the data.
+        page (int): The page number to pull.
+        emit (Callable[[Region, Mode, QueryResponse], None]): Called with the
+            region, the mode and the ``xRanking{mode}`` part of each chunk.
+        prefetched (PrefetchedPage | None): The chunks of the page pulled
+            ahead of the crawl, if any. Defaults to None.
+    """
+    if prefetched is not None and prefetched.season_id == season_id:
+        metrics.inc("prefetched_chunks", len(prefetched.chunks))
+        for chunk in prefetched.chunks:
+            capture(
+                chunk.query_name, chunk.variables, chunk.response, region=region
+            )
+            emit(region, mode, chunk.subresponse)
+        return
+    emitted = False
+    try:
+        for subresponse in iter_page_chunks(
+            scraper, season_id, mode, page, region
+        ):
+            emit(region, mode, subresponse)
+            emitted = True
+        return
+    except StaleSeasonError:
+        if emitted:
+            raise
+        logger.warning(
+            "Season %s for %s looks stale, refreshing the season cache",
+            season_id,
+            region,
         )
+        season_cache.invalidate(region, season_id)
+        season_id = get_current_season(scraper, region)
+    for subresponse in iter_page_chunks(scraper, season_id, mode, page, region):
+        emit(region, mode, subresponse)
 
-    return out
+
+def stream_all_players_in_modes(
+    scraper: QueryHandler | AccountPool,
+    modes: Sequence[Mode],
+    emit: Callable[[Region, Mode, QueryResponse], None],
+    max_workers: int | None = None,
+    prefetched: dict[tuple[Mode, Region], PrefetchedPage] | None = None,
+) -> None:
+    """Pulls every page of every region in the given modes on a single bounded
+    pool, handing every chunk to ``emit`` as soon as it arrives. The first
+    pages already pulled by the fingerprint probe are not pulled again.
+
+    Chunks are emitted in the order they arrive, so ``emit`` must be safe to
+    call from several threads at once. If ``emit`` blocks, the crawler blocks
+    with it, which is how a bounded queue behind it applies backpressure.
+
+    Args:
+        scraper (QueryHandler | AccountPool): The query handler object used for
+            scraping.
+        modes (Sequence[Mode]): The modes to scrape.
+        emit (Callable[[Region, Mode, QueryResponse], None]): Called with the
+            region, the mode and the ``xRanking{mode}`` part of each chunk.
+        max_workers (int | None): The maximum number of requests to have in
+            flight at the same time. If None, the limit of the scraper is used,
+            see ``max_workers_for``. Defaults to None.
+        prefetched (dict[tuple[Mode, Region], PrefetchedPage] | None): The
+            first page of each mode and region pulled ahead of the crawl.
+            Defaults to None.
+    """
+    prefetched = prefetched or {}
+    max_workers = max_workers_for(scraper, max_workers)
+    logger.info("Streaming all players in modes %s for all regions", modes)
+    season_ids = run_concurrently(
+        (partial(get_current_season, scraper, region) for region in xc.regions),
+        max_workers=max_workers,
+    )
+    run_concurrently(
+        (
+            partial(
+                stream_region_page,
+                scraper,
+                region,
+                season_id,
+                mode,
+                page,
+                emit,
+                prefetched.get((mode, region)) if page == 1 else None,
+            )
+            for mode in modes
+            for region, season_id in zip(xc.regions, season_ids)
+            for page in xc.pages
+        ),
+        max_workers=max_workers,
+    )
 
 
-def get_schedule(scraper: QueryHandler) -> list[Schedule]:
+def get_schedule(scraper: QueryHandler | AccountPool) -> list[Schedule]:
     """Gets the current schedule from the given query handler.
 
     Args:
-        scraper (QueryHandler): The query handler object used for scraping.
+        scraper (QueryHandler | AccountPool): The query handler object used for
+            scraping.
 
     Returns:
         list[Schedule]: A list of Schedule objects containing the current
             schedule.
     """
     logger.info("Getting the current schedule")
-    response = scraper.query(xc.schedule_query)
+    metrics.inc("requests")
+    with metrics.time("schedule_fetch"):
+        response = scraper.query(xc.schedule_query)
+    capture(xc.schedule_query, {}, response)
     return parse_schedule(response)
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import threading
+from typing import TYPE_CHECKING, Iterable
+
+import xscraper.variables as xv
+from xscraper import constants as xc
+from xscraper.scraper.db import (
+    select_latest_players,
+    select_latest_timestamp_for_mode,
+)
+from xscraper.scraper.metrics import metrics
+from xscraper.types import Mode, Region
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+SnapshotKey = tuple[Mode, Region]
+
+region_from_bool: dict[bool, Region] = {
+    value: region for region, value in xc.region_map_bool.items()
+}
+
+
+class LatestSnapshotCache:
+    """Keeps the x_power of every player in the latest stored snapshot of each
+    mode and region, for computing the ``updated`` flag without reading the
+    snapshot back from the database every cycle.
+
+    Each mode carries a generation marker, the timestamp of the snapshot the
+    cache holds. After a successful insert the cache is replaced with the rows
+    that were just written, and the generation moves to the cycle timestamp.
+    Before a cycle, the marker is compared with the latest timestamp in the
+    database, a single index lookup, and the snapshot is only read back when
+    another writer has moved it.
+    """
+
+    def __init__(self) -> None:
+        """Initializes an empty cache."""
+        self.snapshots: dict[SnapshotKey, dict[str, float]] = {}
+        self.generations: dict[Mode, dt.datetime | None] = {}
+        self._lock = threading.Lock()
+
+    def get(self, mode: Mode, region: Region) -> dict[str, float]:
+        """Gets the x_power of each player in the cached snapshot.
+
+        Args:
+            mode (Mode): The mode.
+            region (Region): The region.
+
+        Returns:
+            dict[str, float]: The x_power of each player, by player ID.
+        """
+        with self._lock:
+            return self.snapshots.get((mode, region), {})
+
+    def load(self, conn: Connection, mode: Mode) -> None:
+        """Reads the latest snapshot of a mode from the database.
+
+        Args:
+            conn (Connection): The database connection to use.
+            mode (Mode): The mode to load.
+        """
+        mode_name = xc.mode_map[mode]
+        logger.info("Loading the latest snapshot for mode %s", mode)
+        # The marker is read first, so a snapshot written in between makes the
+        # marker stale instead of being missed
+        generation = select_latest_timestamp_for_mode(conn, mode_name)
+        snapshots: dict[Region, dict[str, float]] = {
+            region: {} for region in xc.regions
+        }
+        for player_id, x_power, _, region in select_latest_players(
+            conn, mode_name
+        ):
+            snapshots[region_from_bool[region]][player_id] = x_power
+        metrics.inc("snapshot_loads")
+        self.replace(mode, generation, snapshots)
+
+    def replace(
+        self,
+        mode: Mode,
+        generation: dt.datetime | None,
+        snapshots: dict[Region, dict[str, float]],
+    ) -> None:
+        """Replaces the cached snapshot of a mode.
+
+        Args:
+            mode (Mode): The mode.
+            generation (dt.datetime | None): The timestamp of the snapshot.
+            snapshots (dict[Region, dict[str, float]]): For each region, the
+                x_power of each player in the snapshot. Regions that are left
+                out are emptied.
+        """
+        with self._lock:
+            for region in xc.regions:
+                self.snapshots[(mode, region)] = snapshots.get(region, {})
+            self.generations[mode] = generation
+
+    def validate(self, conn: Connection, modes: Iterable[Mode]) -> None:
+        """Makes sure the cached snapshots of the given modes are the latest
+        ones in the database, reloading those whose generation is stale.
+
+        Args:
+            conn (Connection): The database connection to use.
+            modes (Iterable[Mode]): The modes to validate.
+        """
+        for mode in modes:
+            if xv.SNAPSHOT_CACHE_ENABLED and mode in self.generations:
+                generation = select_latest_timestamp_for_mode(
+                    conn, xc.mode_map[mode]
+                )
+                if generation == self.generations[mode]:
+                    metrics.inc("snapshot_hits")
+                    continue
+                logger.info("Cached snapshot for mode %s is stale", mode)
+            self.load(conn, mode)
+
+    def load_missing(self, conn: Connection, modes: Iterable[Mode]) -> None:
+        """Loads the snapshots of the given modes that are not cached yet,
+        trusting the cached ones without a database round trip.
+
+        This is used when cycles are spooled. The spool is then the only
+        writer and the database lags behind it, so comparing generations
+        would reload an older snapshot than the cached one.
+
+        Args:
+            conn (Connection): The database connection to use.
+            modes (Iterable[Mode]): The modes to load.
+        """
+        with self._lock:
+            missing = [mode for mode in modes if mode not in self.generations]
+        for mode in missing:
+            self.load(conn, mode)
+
+    def warm(self, conn: Connection, modes: Iterable[Mode] = xc.modes) -> None:
+        """Loads the latest snapshot of every given mode.
+
+        Args:
+            conn (Connection): The database connection to use.
+            modes (Iterable[Mode]): The modes to load. Defaults to every mode.
+        """
+        for mode in modes:
+            self.load(conn, mode)
+
+    def clear(self) -> None:
+        """Empties the cache."""
+        with self._lock:
+            self.snapshots = {}
+            self.generations = {}
+
+
+latest_snapshots = LatestSnapshotCache()
@@ -0,0 +1,382 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import os
+import pathlib
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Iterable
+
+import psycopg2
+import pyarrow as pa
+
+import xscraper.variables as xv
+from xscraper.scraper.batch import ARROW_SCHEMA, PlayerBatch
+from xscraper.scraper.db import ensure_player_partitions, write_player_rows
+from xscraper.scraper.metrics import metrics
+from xscraper.scraper.pool import get_pool
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import connection as Connection
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "cycle-"
+SEGMENT_SUFFIX = ".arrow"
+QUARANTINE_DIRECTORY = "quarantine"
+
+
+def _fsync_directory(directory: pathlib.Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SpoolSegment:
+    """The players of one cycle, written to a hidden temporary file as an
+    Arrow IPC file while the cycle runs. ``commit`` makes the segment durable
+    and visible to the flusher in one atomic rename.
+    """
+
+    def __init__(self, directory: pathlib.Path, timestamp: dt.datetime) -> None:
+        """Opens the temporary file of a segment.
+
+        Args:
+            directory (pathlib.Path): The spool directory.
+            timestamp (dt.datetime): The timestamp of the cycle.
+        """
+        name = SEGMENT_PREFIX + timestamp.strftime("%Y%m%dT%H%M%S%f")
+        self.directory = directory
+        self.timestamp = timestamp
+        self.path = directory / (name + SEGMENT_SUFFIX)
+        self.tmp_path = directory / f".{name}{SEGMENT_SUFFIX}.tmp"
+        self.rows = 0
+        self._file: BinaryIO = open(self.tmp_path, "wb")
+        self._writer = pa.ipc.new_file(self._file, ARROW_SCHEMA)
+
+    def write(self, batches: Iterable[PlayerBatch]) -> None:
+        """Appends enriched batches to the segment.
+
+        Args:
+            batches (Iterable[PlayerBatch]): The batches.
+        """
+        for batch in batches:
+            self._writer.write_table(batch.to_arrow())
+            self.rows += len(batch)
+
+    def commit(self) -> pathlib.Path:
+        """Closes the segment, flushes it to disk and moves it into place.
+
+        Returns:
+            pathlib.Path: The path of the committed segment.
+        """
+        self._writer.close()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        _fsync_directory(self.directory)
+        metrics.inc("spool_segments_written")
+        return self.path
+
+    def abort(self) -> None:
+        """Closes and removes the segment."""
+        try:
+            self._writer.close()
+        except (OSError, pa.ArrowException):
+            pass
+        self._file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class PlayerSpool:
+    """A local write-ahead spool between the scrape pipeline and the database.
+
+    Each cycle is written to its own segment and acknowledged once the segment
+    is on disk, so a slow or unreachable database never fails a cycle and
+    never costs a second crawl of the leaderboards. Committed segments are
+    drained into the database oldest first, each in a single transaction, and
+    removed once it is committed. The segments left in the directory are the
+    checkpoint: after a crash they are flushed again, which is harmless since
+    every insert keeps ``ON CONFLICT DO NOTHING`` semantics.
+
+    A segment that keeps failing for a reason of its own, such as a constraint
+    or a type error, would block every newer segment. After
+    ``max_flush_attempts`` failed flushes in a row it is moved to the
+    ``quarantine`` subdirectory, to be looked into by hand, and the segments
+    after it are drained. Failures to reach the database are not counted
+    against a segment.
+    """
+
+    def __init__(
+        self,
+        directory: str | pathlib.Path,
+        max_flush_attempts: int | None = None,
+    ) -> None:
+        """Initializes the spool, removing the temporary files of cycles that
+        never committed.
+
+        Args:
+            directory (str | pathlib.Path): The spool directory. It is created
+                if it does not exist.
+            max_flush_attempts (int | None): The number of failed flushes in a
+                row after which a segment is quarantined. If None,
+                ``SPOOL_MAX_FLUSH_ATTEMPTS`` is used. Defaults to None.
+        """
+        self.directory = pathlib.Path(directory)
+        self.quarantine_directory = self.directory / QUARANTINE_DIRECTORY
+        self.max_flush_attempts = (
+            max_flush_attempts or xv.SPOOL_MAX_FLUSH_ATTEMPTS
+        )
+        self.failures: dict[str, int] = {}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for tmp_path in self.directory.glob(f".{SEGMENT_PREFIX}*.tmp"):
+            logger.warning("Removing uncommitted spool segment %s", tmp_path)
+            tmp_path.unlink()
+        self._flush_lock = threading.Lock()
+
+    def begin(self, timestamp: dt.datetime) -> SpoolSegment:
+        """Starts the segment of a cycle.
+
+        Args:
+            timestamp (dt.datetime): The timestamp of the cycle.
+
+        Returns:
+            SpoolSegment: The segment.
+        """
+        return SpoolSegment(self.directory, timestamp)
+
+    def segments(self) -> list[pathlib.Path]:
+        """Lists the committed segments waiting to be flushed, oldest first.
+
+        Returns:
+            list[pathlib.Path]: The paths to the segments.
+        """
+        return sorted(
+            self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"),
+            key=lambda path: path.name,
+        )
+
+    def flush_segment(self, conn: Connection, path: pathlib.Path) -> int:
+        """Writes a segment to the database and removes it.
+
+        Args:
+            conn (Connection): The database connection to use.
+            path (pathlib.Path): The segment.
+
+        Returns:
+            int: The number of players in the segment.
+        """
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        count = table.num_rows
+        if count:
+            timestamp = table.column("timestamp")[0].as_py()
+            ensure_player_partitions(conn, timestamp)
+            rows = zip(*(column.to_pylist() for column in table.columns))
+            write_player_rows(conn, rows, count, commit=True)
+        path.unlink()
+        _fsync_directory(self.directory)
+        metrics.inc("spool_segments_flushed")
+        return count
+
+    def quarantine(self, path: pathlib.Path) -> pathlib.Path:
+        """Moves a segment out of the way of the flusher, into the quarantine
+        subdirectory.
+
+        Args:
+            path (pathlib.Path): The segment.
+
+        Returns:
+            pathlib.Path: The new path of the segment.
+        """
+        self.quarantine_directory.mkdir(exist_ok=True)
+        target = self.quarantine_directory / path.name
+        os.replace(path, target)
+        _fsync_directory(self.quarantine_directory)
+        _fsync_directory(self.directory)
+        self.failures.pop(path.name, None)
+        metrics.inc("spool_segments_quarantined")
+        return target
+
+    def record_failure(self, path: pathlib.Path, error: Exception) -> bool:
+        """Counts a failed flush of a segment, and quarantines the segment once
+        it has failed ``max_flush_attempts`` times in a row.
+
+        Args:
+            path (pathlib.Path): The segment.
+            error (Exception): The error raised by the flush.
+
+        Returns:
+            bool: Whether the segment was quarantined.
+        """
+        attempts = self.failures.get(path.name, 0) + 1
+        self.failures[path.name] = attempts
+        if attempts < self.max_flush_attempts:
+            return False
+        target = self.quarantine(path)
+        logger.error(
+            "Quarantined spool segment %s after %d failed flushes: %s",
+            target,
+            attempts,
+            error,
+        )
+        return True
+
+    def flush(self, conn: Connection, max_segments: int | None = None) -> int:
+        """Drains the committed segments into the database, oldest first. It
+        stops at the first segment that fails, which is left for the next
+        flush, unless the segment has now failed ``max_flush_attempts`` times
+        in a row, in which case it is quarantined and the flush goes on.
+
+        Args:
+            conn (Connection): The database connection to use.
+            max_segments (int | None): The maximum number of segments to
+                flush. If None, every segment is flushed. Defaults to None.
+
+        Raises:
+            Exception: The error raised by the failing segment.
+
+        Returns:
+            int: The number of players flushed.
+        """
+        with self._flush_lock:
+            segments = self.segments()
+            if max_segments is not None:
+                segments = segments[:max_segments]
+            flushed = 0
+            for path in segments:
+                logger.info("Flushing spool segment %s", path.name)
+                try:
+                    with metrics.time("spool_flush"):
+                        flushed += self.flush_segment(conn, path)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    # The database is unreachable, which says nothing about
+                    # the segment
+                    conn.rollback()
+                    raise
+                except Exception as e:
+                    conn.rollback()
+                    if not self.record_failure(path, e):
+                        raise
+                except BaseException:
+                    conn.rollback()
+                    raise
+                else:
+                    self.failures.pop(path.name, None)
+            metrics.set_gauge("spool_segments", len(self.segments()))
+            return flushed
+
+
+class SpoolFlusher:
+    """Drains a spool into the database from a background thread.
+
+    The thread wakes up when a segment is committed, or every
+    ``SPOOL_FLUSH_INTERVAL`` otherwise, and checks out a connection from the
+    connection pool for each flush. A failed flush is logged and retried on
+    the next wake up, while cycles keep being spooled.
+    """
+
+    def __init__(
+        self, spool: PlayerSpool, interval: dt.timedelta | None = None
+    ) -> None:
+        """Initializes the flusher.
+
+        Args:
+            spool (PlayerSpool): The spool to drain.
+            interval (dt.timedelta | None): The longest time between two
+                flushes. If None, ``SPOOL_FLUSH_INTERVAL`` is used. Defaults
+                to None.
+        """
+        self.spool = spool
+        self.interval = (interval or xv.SPOOL_FLUSH_INTERVAL).total_seconds()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def notify(self) -> None:
+        """Wakes the flusher up, after a segment was committed."""
+        self._wake.set()
+
+    def run(self) -> None:
+        """Flushes the spool until the flusher is stopped."""
+        while not self._stopped.is_set():
+            self._wake.clear()
+            if self.spool.segments():
+                try:
+                    with get_pool().connection() as conn:
+                        self.spool.flush(conn)
+                except Exception as e:
+                    metrics.inc("spool_flush_failures")
+                    logger.warning("Failed to flush the spool: %s", e)
+            self._wake.wait(self.interval)
+
+    def start(self) -> None:
+        """Starts the flusher thread."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="xscraper-spool", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the flusher thread, letting the flush in progress finish."""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+
+
+_active_spool: PlayerSpool | None = None
+_flusher: SpoolFlusher | None = None
+
+
+def enable_spool(spool: PlayerSpool) -> None:
+    """Routes every scrape cycle through the given spool and starts draining
+    it in the background, beginning with the segments left by a previous run.
+
+    Args:
+        spool (PlayerSpool): The spool to write to.
+    """
+    global _active_spool, _flusher
+    disable_spool()
+    logger.info(
+        "Spooling cycles to %s, %d segments pending",
+        spool.directory,
+        len(spool.segments()),
+    )
+    _active_spool = spool
+    _flusher = SpoolFlusher(spool)
+    _flusher.start()
+
+
+def disable_spool() -> None:
+    """Stops spooling cycles and stops the flusher. Segments that were not
+    flushed yet stay on disk for the next run.
+    """
+    global _active_spool, _flusher
+    if _flusher is not None:
+        _flusher.stop()
+    _active_spool = None
+    _flusher = None
+
+
+def get_spool() -> PlayerSpool | None:
+    """Gets the active spool.
+
+    Returns:
+        PlayerSpool | None: The spool, or None if spooling is disabled.
+    """
+    return _active_spool
+
+
+def notify_flusher() -> None:
+    """Wakes the flusher of the active spool up, if there is one."""
+    if _flusher is not None:
+        _flusher.notify()
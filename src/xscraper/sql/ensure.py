@@ -84,6 +84,37 @@ ENSURE_PLAYER_INDEX_QUERIES = [
     ENSURE_PLAYER_INDEX_MODE_TIMESTAMP_SEASON_QUERY,
 ]
 
+ENSURE_PLAYERS_LATEST_TABLE_QUERY = (
+    "CREATE TABLE IF NOT EXISTS xscraper.players_latest ("
+    "player_id TEXT NOT NULL, "
+    "mode xscraper.mode_name NOT NULL, "
+    "region BOOLEAN NOT NULL, "
+    "rank INTEGER NOT NULL, "
+    "x_power FLOAT NOT NULL, "
+    "weapon_id INTEGER NOT NULL, "
+    "timestamp TIMESTAMP WITH TIME ZONE NOT NULL, "
+    "CONSTRAINT pk_players_latest PRIMARY KEY (player_id, mode, region)"
+    ")"
+)
+
+ENSURE_PLAYERS_LATEST_INDEX_MODE_TIMESTAMP_QUERY = (
+    "CREATE INDEX IF NOT EXISTS idx_players_latest_mode_timestamp "
+    "ON xscraper.players_latest (mode, timestamp)"
+)
+
+# Fills a new players_latest table from the history, once
+BACKFILL_PLAYERS_LATEST_QUERY = (
+    "INSERT INTO xscraper.players_latest ("
+    "player_id, mode, region, rank, x_power, weapon_id, timestamp"
+    ") "
+    "SELECT DISTINCT ON (player_id, mode, region) "
+    "player_id, mode, region, rank, x_power, weapon_id, timestamp "
+    "FROM xscraper.players "
+    "WHERE NOT EXISTS (SELECT 1 FROM xscraper.players_latest) "
+    "ORDER BY player_id, mode, region, timestamp DESC "
+    "ON CONFLICT (player_id, mode, region) DO NOTHING"
+)
+
 ENSURE_SCHEDULE_TABLE_QUERY = (
     "CREATE TABLE IF NOT EXISTS xscraper.schedules ("
     "start_time TIMESTAMP WITH TIME ZONE NOT NULL PRIMARY KEY, "
@@ -112,3 +143,175 @@ ENSURE_SCHEDULE_INDEX_QUERIES = [
     ENSURE_SCHEDULE_INDEX_START_TIME_QUERY,
     ENSURE_SCHEDULE_INDEX_END_TIME_QUERY,
 ]
+
+# Creates the missing monthly partitions of xscraper.players covering the given
+# range, and returns the end of the last one. Months are taken in UTC so the
+# partition bounds do not depend on the session time zone.
+ENSURE_PLAYER_PARTITIONS_FUNCTION_QUERY = (
+    "CREATE OR REPLACE FUNCTION xscraper.ensure_player_partitions("
+    "range_start TIMESTAMP WITH TIME ZONE, "
+    "range_end TIMESTAMP WITH TIME ZONE"
+    ") RETURNS TIMESTAMP WITH TIME ZONE AS $$ "
+    "DECLARE "
+    "month_start TIMESTAMP := "
+    "date_trunc('month', range_start AT TIME ZONE 'UTC'); "
+    "BEGIN "
+    "WHILE month_start AT TIME ZONE 'UTC' <= range_end LOOP "
+    "EXECUTE format("
+    "'CREATE TABLE IF NOT EXISTS xscraper.%I PARTITION OF xscraper.players "
+    "FOR VALUES FROM (%L) TO (%L)', "
+    "'players_' || to_char(month_start, 'YYYY_MM'), "
+    "month_start AT TIME ZONE 'UTC', "
+    "(month_start + INTERVAL '1 month') AT TIME ZONE 'UTC'"
+    "); "
+    "month_start := month_start + INTERVAL '1 month'; "
+    "END LOOP; "
+    "RETURN month_start AT TIME ZONE 'UTC'; "
+    "END; "
+    "$$ LANGUAGE plpgsql"
+)
+
+ENSURE_PLAYER_PARTITIONS_QUERY = (
+    "SELECT xscraper.ensure_player_partitions(%s, %s)"
+)
+
+# One row per scraped leaderboard, listing its players in rank order. With
+# changes-only storage this is what tells which players were on a leaderboard
+# whose rows were not written again.
+ENSURE_LEADERBOARD_SNAPSHOTS_TABLE_QUERY = (
+    "CREATE TABLE IF NOT EXISTS xscraper.leaderboard_snapshots ("
+    "timestamp TIMESTAMP WITH TIME ZONE NOT NULL, "
+    "mode xscraper.mode_name NOT NULL, "
+    "region BOOLEAN NOT NULL, "
+    "rotation_start TIMESTAMP WITH TIME ZONE, "
+    "season_number INTEGER, "
+    "player_ids TEXT[] NOT NULL, "
+    "ranks INTEGER[] NOT NULL, "
+    "CONSTRAINT pk_leaderboard_snapshots PRIMARY KEY (mode, region, timestamp)"
+    ")"
+)
+
+BACKFILL_LEADERBOARD_SNAPSHOTS_QUERY = (
+    "INSERT INTO xscraper.leaderboard_snapshots ("
+    "timestamp, mode, region, rotation_start, season_number, player_ids, ranks"
+    ") "
+    "SELECT timestamp, mode, region, MIN(rotation_start), "
+    "MIN(season_number), "
+    "array_agg(player_id ORDER BY rank), array_agg(rank ORDER BY rank) "
+    "FROM xscraper.players "
+    "WHERE mode IS NOT NULL "
+    "GROUP BY timestamp, mode, region "
+    "ON CONFLICT (mode, region, timestamp) DO NOTHING"
+)
+
+# Rebuilds the leaderboard of a mode and region as it was at a point in time,
+# from the latest snapshot at or before it. Each player on it is filled in from
+# their newest stored row at or before the snapshot, and ``updated`` is true
+# for the players whose row was written by that snapshot.
+ENSURE_PLAYERS_AS_OF_FUNCTION_QUERY = (
+    "CREATE OR REPLACE FUNCTION xscraper.players_as_of("
+    "as_of_mode xscraper.mode_name, "
+    "as_of_region BOOLEAN, "
+    "as_of TIMESTAMP WITH TIME ZONE"
+    ") RETURNS TABLE ("
+    "player_id TEXT, "
+    "name TEXT, "
+    "name_id TEXT, "
+    "splashtag TEXT, "
+    "rank INTEGER, "
+    "x_power FLOAT, "
+    "weapon_id INTEGER, "
+    "nameplate_id INTEGER, "
+    "byname TEXT, "
+    "text_color TEXT, "
+    "badge_left_id INTEGER, "
+    "badge_center_id INTEGER, "
+    "badge_right_id INTEGER, "
+    "timestamp TIMESTAMP WITH TIME ZONE, "
+    "mode xscraper.mode_name, "
+    "region BOOLEAN, "
+    "rotation_start TIMESTAMP WITH TIME ZONE, "
+    "season_number INTEGER, "
+    "updated BOOLEAN"
+    ") AS $$ "
+    "SELECT p.player_id, p.name, p.name_id, p.splashtag, e.rank, p.x_power, "
+    "p.weapon_id, p.nameplate_id, p.byname, p.text_color, p.badge_left_id, "
+    "p.badge_center_id, p.badge_right_id, s.timestamp, s.mode, s.region, "
+    "s.rotation_start, s.season_number, p.timestamp = s.timestamp "
+    "FROM ("
+    "SELECT * FROM xscraper.leaderboard_snapshots "
+    "WHERE mode = as_of_mode AND region = as_of_region AND timestamp <= as_of "
+    "ORDER BY timestamp DESC LIMIT 1"
+    ") s "
+    "CROSS JOIN LATERAL unnest(s.player_ids, s.ranks) AS e (player_id, rank) "
+    "CROSS JOIN LATERAL ("
+    "SELECT * FROM xscraper.players h "
+    "WHERE h.player_id = e.player_id AND h.mode = s.mode "
+    "AND h.region = s.region AND h.timestamp <= s.timestamp "
+    "ORDER BY h.timestamp DESC LIMIT 1"
+    ") p "
+    "ORDER BY e.rank, p.player_id "
+    "$$ LANGUAGE sql STABLE"
+)
+
+# Identifies a distinct profile. quote_nullable keeps NULL apart from the
+# string 'NULL' and from an empty string.
+ENSURE_PLAYER_PROFILE_KEY_FUNCTION_QUERY = (
+    "CREATE OR REPLACE FUNCTION xscraper.player_profile_key("
+    "player_id TEXT, name TEXT, name_id TEXT, byname TEXT, text_color TEXT, "
+    "nameplate_id INTEGER, badge_left_id INTEGER, badge_center_id INTEGER, "
+    "badge_right_id INTEGER"
+    ") RETURNS TEXT AS $$ "
+    "SELECT md5("
+    "quote_nullable(player_id) || ',' || quote_nullable(name) || ',' || "
+    "quote_nullable(name_id) || ',' || quote_nullable(byname) || ',' || "
+    "quote_nullable(text_color) || ',' || "
+    "quote_nullable(nameplate_id::TEXT) || ',' || "
+    "quote_nullable(badge_left_id::TEXT) || ',' || "
+    "quote_nullable(badge_center_id::TEXT) || ',' || "
+    "quote_nullable(badge_right_id::TEXT)"
+    ") "
+    "$$ LANGUAGE sql IMMUTABLE"
+)
+
+ENSURE_PLAYER_PROFILES_TABLE_QUERY = (
+    "CREATE TABLE IF NOT EXISTS xscraper.player_profiles ("
+    "profile_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY, "
+    "player_id TEXT NOT NULL, "
+    "name TEXT NOT NULL, "
+    "name_id TEXT NOT NULL, "
+    "splashtag TEXT GENERATED ALWAYS AS (name || '#' || name_id) STORED, "
+    "byname TEXT, "
+    "text_color TEXT, "
+    "nameplate_id INTEGER, "
+    "badge_left_id INTEGER, "
+    "badge_center_id INTEGER, "
+    "badge_right_id INTEGER, "
+    "profile_key TEXT GENERATED ALWAYS AS (xscraper.player_profile_key("
+    "player_id, name, name_id, byname, text_color, nameplate_id, "
+    "badge_left_id, badge_center_id, badge_right_id"
+    ")) STORED, "
+    "CONSTRAINT uq_player_profiles_key UNIQUE (profile_key)"
+    ")"
+)
+
+ENSURE_PLAYER_PROFILES_INDEX_PLAYER_ID_QUERY = (
+    "CREATE INDEX IF NOT EXISTS idx_player_profiles_player_id "
+    "ON xscraper.player_profiles (player_id)"
+)
+
+ENSURE_PLAYER_PROFILES_INDEX_SPLASHTAG_QUERY = (
+    "CREATE INDEX IF NOT EXISTS idx_player_profiles_splashtag_gin "
+    "ON xscraper.player_profiles USING GIN (splashtag gin_trgm_ops)"
+)
+
+BACKFILL_PLAYER_PROFILES_QUERY = (
+    "INSERT INTO xscraper.player_profiles ("
+    "player_id, name, name_id, byname, text_color, nameplate_id, "
+    "badge_left_id, badge_center_id, badge_right_id"
+    ") "
+    "SELECT DISTINCT player_id, name, name_id, byname, text_color, "
+    "nameplate_id, badge_left_id, badge_center_id, badge_right_id "
+    "FROM xscraper.players "
+    "ON CONFLICT (profile_key) DO NOTHING"
+)
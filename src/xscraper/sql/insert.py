@@ -1,8 +1,7 @@
 INSERT_PLAYER_QUERY = (
     "INSERT INTO xscraper.players ("
-    "player_id, name, name_id, rank, x_power, weapon_id, nameplate_id, byname, "
-    "text_color, badge_left_id, badge_center_id, badge_right_id, timestamp, "
-    "mode, region, rotation_start, season_number, updated"
+    "player_id, profile_id, rank, x_power, weapon_id, timestamp, mode, region, "
+    "rotation_start, season_number, updated"
     ") "
     "VALUES %s "
     "ON CONFLICT (player_id, timestamp, mode) DO NOTHING"
@@ -16,3 +15,172 @@ INSERT_SCHEDULE_QUERY = (
     "VALUES %s "
     "ON CONFLICT (start_time, end_time) DO NOTHING"
 )
+
+PLAYER_COLUMNS = (
+    "player_id, profile_id, rank, x_power, weapon_id, timestamp, mode, region, "
+    "rotation_start, season_number, updated"
+)
+
+PLAYER_PROFILE_COLUMNS = (
+    "player_id, name, name_id, byname, text_color, nameplate_id, "
+    "badge_left_id, badge_center_id, badge_right_id"
+)
+
+# The no-op update makes RETURNING include the profiles that already existed
+UPSERT_PLAYER_PROFILES_QUERY = (
+    f"INSERT INTO xscraper.player_profiles ({PLAYER_PROFILE_COLUMNS}) "
+    "VALUES %s "
+    "ON CONFLICT (profile_key) DO UPDATE SET player_id = EXCLUDED.player_id "
+    f"RETURNING profile_id, {PLAYER_PROFILE_COLUMNS}"
+)
+
+# Temporary tables are never written to the WAL, like unlogged tables, and are
+# private to the session, so concurrent writers never see each other's rows
+CREATE_PLAYER_STAGING_QUERY = (
+    "CREATE TEMPORARY TABLE IF NOT EXISTS players_staging ("
+    "player_id TEXT, "
+    "profile_id BIGINT, "
+    "rank INTEGER, "
+    "x_power FLOAT, "
+    "weapon_id INTEGER, "
+    "timestamp TIMESTAMP WITH TIME ZONE, "
+    "mode xscraper.mode_name, "
+    "region BOOLEAN, "
+    "rotation_start TIMESTAMP WITH TIME ZONE, "
+    "season_number INTEGER, "
+    "updated BOOLEAN"
+    ")"
+)
+
+TRUNCATE_PLAYER_STAGING_QUERY = "TRUNCATE players_staging"
+
+COPY_PLAYER_STAGING_QUERY = (
+    f"COPY players_staging ({PLAYER_COLUMNS}) FROM STDIN"
+)
+
+MERGE_PLAYER_STAGING_QUERY = (
+    f"INSERT INTO xscraper.players ({PLAYER_COLUMNS}) "
+    f"SELECT {PLAYER_COLUMNS} FROM players_staging "
+    "ON CONFLICT (player_id, timestamp, mode) DO NOTHING"
+)
+
+# With changes-only storage, a player is only written again when the x_power
+# moved or they are new to the leaderboard
+MERGE_CHANGED_PLAYER_STAGING_QUERY = (
+    f"INSERT INTO xscraper.players ({PLAYER_COLUMNS}) "
+    f"SELECT {PLAYER_COLUMNS} FROM players_staging "
+    "WHERE updated IS NOT FALSE "
+    "ON CONFLICT (player_id, timestamp, mode) DO NOTHING"
+)
+
+COUNT_UNCHANGED_PLAYER_STAGING_QUERY = (
+    "SELECT COUNT(*) FROM players_staging WHERE updated IS FALSE"
+)
+
+PLAYERS_LATEST_COLUMNS = (
+    "player_id, mode, region, rank, x_power, weapon_id, timestamp"
+)
+
+# Older rows, as written by a replay of old segments, never overwrite newer ones
+UPSERT_PLAYERS_LATEST_CONFLICT = (
+    "ON CONFLICT (player_id, mode, region) DO UPDATE SET "
+    "rank = EXCLUDED.rank, "
+    "x_power = EXCLUDED.x_power, "
+    "weapon_id = EXCLUDED.weapon_id, "
+    "timestamp = EXCLUDED.timestamp "
+    "WHERE xscraper.players_latest.timestamp <= EXCLUDED.timestamp"
+)
+
+UPSERT_PLAYERS_LATEST_QUERY = (
+    f"INSERT INTO xscraper.players_latest ({PLAYERS_LATEST_COLUMNS}) "
+    "VALUES %s "
+    f"{UPSERT_PLAYERS_LATEST_CONFLICT}"
+)
+
+MERGE_PLAYERS_LATEST_STAGING_QUERY = (
+    f"INSERT INTO xscraper.players_latest ({PLAYERS_LATEST_COLUMNS}) "
+    f"SELECT DISTINCT ON (player_id, mode, region) {PLAYERS_LATEST_COLUMNS} "
+    "FROM players_staging "
+    "ORDER BY player_id, mode, region, timestamp DESC "
+    f"{UPSERT_PLAYERS_LATEST_CONFLICT}"
+)
+
+LEADERBOARD_SNAPSHOT_COLUMNS = (
+    "timestamp, mode, region, rotation_start, season_number, player_ids, ranks"
+)
+
+# The entries of an insert whose player is not in the snapshot yet, in the
+# order they were inserted
+_NEW_SNAPSHOT_ENTRIES = (
+    "FROM unnest(EXCLUDED.player_ids, EXCLUDED.ranks) WITH ORDINALITY "
+    "AS e (player_id, rank, position) "
+    "WHERE e.player_id <> ALL (xscraper.leaderboard_snapshots.player_ids) "
+    "ORDER BY e.position"
+)
+
+# A leaderboard written over several inserts is appended to, keeping only the
+# players it does not hold yet. A player seen twice because the rankings moved
+# during the crawl keeps their first entry, and a replay appends nothing.
+UPSERT_LEADERBOARD_SNAPSHOT_CONFLICT = (
+    "ON CONFLICT (mode, region, timestamp) DO UPDATE SET "
+    "player_ids = xscraper.leaderboard_snapshots.player_ids || ARRAY("
+    f"SELECT e.player_id {_NEW_SNAPSHOT_ENTRIES}"
+    "), "
+    "ranks = xscraper.leaderboard_snapshots.ranks || ARRAY("
+    f"SELECT e.rank {_NEW_SNAPSHOT_ENTRIES}"
+    ") "
+    "WHERE NOT (xscraper.leaderboard_snapshots.player_ids "
+    "@> EXCLUDED.player_ids)"
+)
+
+UPSERT_LEADERBOARD_SNAPSHOT_QUERY = (
+    f"INSERT INTO xscraper.leaderboard_snapshots "
+    f"({LEADERBOARD_SNAPSHOT_COLUMNS}) "
+    "VALUES %s "
+    f"{UPSERT_LEADERBOARD_SNAPSHOT_CONFLICT}"
+)
+
+MERGE_LEADERBOARD_SNAPSHOT_STAGING_QUERY = (
+    f"INSERT INTO xscraper.leaderboard_snapshots "
+    f"({LEADERBOARD_SNAPSHOT_COLUMNS}) "
+    "SELECT timestamp, mode, region, MIN(rotation_start), "
+    "MIN(season_number), "
+    "array_agg(player_id ORDER BY rank), array_agg(rank ORDER BY rank) "
+    "FROM ("
+    "SELECT DISTINCT ON (timestamp, mode, region, player_id) * "
+    "FROM players_staging "
+    "ORDER BY timestamp, mode, region, player_id, rank"
+    ") s "
+    "GROUP BY timestamp, mode, region "
+    f"{UPSERT_LEADERBOARD_SNAPSHOT_CONFLICT}"
+)
+
+SCHEDULE_COLUMNS = (
+    "start_time, end_time, splatfest, mode, stage_1_id, stage_1_name, "
+    "stage_2_id, stage_2_name"
+)
+
+CREATE_SCHEDULE_STAGING_QUERY = (
+    "CREATE TEMPORARY TABLE IF NOT EXISTS schedules_staging ("
+    "start_time TIMESTAMP WITH TIME ZONE, "
+    "end_time TIMESTAMP WITH TIME ZONE, "
+    "splatfest BOOLEAN, "
+    "mode xscraper.mode_name, "
+    "stage_1_id INTEGER, "
+    "stage_1_name TEXT, "
+    "stage_2_id INTEGER, "
+    "stage_2_name TEXT"
+    ")"
+)
+
+TRUNCATE_SCHEDULE_STAGING_QUERY = "TRUNCATE schedules_staging"
+
+COPY_SCHEDULE_STAGING_QUERY = (
+    f"COPY schedules_staging ({SCHEDULE_COLUMNS}) FROM STDIN"
+)
+
+MERGE_SCHEDULE_STAGING_QUERY = (
+    f"INSERT INTO xscraper.schedules ({SCHEDULE_COLUMNS}) "
+    f"SELECT {SCHEDULE_COLUMNS} FROM schedules_staging "
+    "ON CONFLICT (start_time, end_time) DO NOTHING"
+)
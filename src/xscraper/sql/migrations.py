@@ -0,0 +1,354 @@
+from typing import NamedTuple
+
+from xscraper.sql.ensure import (
+    BACKFILL_LEADERBOARD_SNAPSHOTS_QUERY,
+    BACKFILL_PLAYER_PROFILES_QUERY,
+    BACKFILL_PLAYERS_LATEST_QUERY,
+    CREATE_MODE_ENUM_QUERY,
+    ENSURE_LEADERBOARD_SNAPSHOTS_TABLE_QUERY,
+    ENSURE_PLAYER_INDEX_MODE_QUERY,
+    ENSURE_PLAYER_INDEX_MODE_TIMESTAMP_SEASON_QUERY,
+    ENSURE_PLAYER_INDEX_REGION_QUERY,
+    ENSURE_PLAYER_INDEX_ROTATION_START_QUERY,
+    ENSURE_PLAYER_INDEX_SEASON_NUMBER_QUERY,
+    ENSURE_PLAYER_INDEX_SPLASHTAG_QUERY,
+    ENSURE_PLAYER_INDEX_TIMESTAMP_QUERY,
+    ENSURE_PLAYER_PARTITIONS_FUNCTION_QUERY,
+    ENSURE_PLAYER_PROFILE_KEY_FUNCTION_QUERY,
+    ENSURE_PLAYER_PROFILES_INDEX_PLAYER_ID_QUERY,
+    ENSURE_PLAYER_PROFILES_INDEX_SPLASHTAG_QUERY,
+    ENSURE_PLAYER_PROFILES_TABLE_QUERY,
+    ENSURE_PLAYER_TABLE_QUERY,
+    ENSURE_PLAYERS_AS_OF_FUNCTION_QUERY,
+    ENSURE_PLAYERS_LATEST_INDEX_MODE_TIMESTAMP_QUERY,
+    ENSURE_PLAYERS_LATEST_TABLE_QUERY,
+    ENSURE_SCHEDULE_TABLE_QUERY,
+    ENSURE_SCHEMA_QUERY,
+    ENSURE_TRGM_EXTENSION_QUERY,
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: tuple[str, ...]
+    # Concurrent migrations run outside of a transaction, one statement at a
+    # time, which CREATE INDEX CONCURRENTLY requires
+    concurrent: bool = False
+
+
+ENSURE_MIGRATIONS_TABLE_QUERY = (
+    "CREATE TABLE IF NOT EXISTS xscraper.schema_migrations ("
+    "version INTEGER PRIMARY KEY, "
+    "description TEXT NOT NULL, "
+    "applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()"
+    ")"
+)
+
+SELECT_SCHEMA_VERSION_QUERY = (
+    "SELECT COALESCE(MAX(version), 0) FROM xscraper.schema_migrations"
+)
+
+INSERT_SCHEMA_VERSION_QUERY = (
+    "INSERT INTO xscraper.schema_migrations (version, description) "
+    "VALUES (%s, %s)"
+)
+
+# Any constant works, it only has to be the same for every migrator
+MIGRATION_LOCK_ID = 0x78736372
+
+LOCK_MIGRATIONS_QUERY = "SELECT pg_advisory_lock(%s)"
+
+UNLOCK_MIGRATIONS_QUERY = "SELECT pg_advisory_unlock(%s)"
+
+# Migrations rewrite whole tables and build indexes, which takes longer than
+# the statement timeout of the pooled connections
+DISABLE_STATEMENT_TIMEOUT_QUERY = "SET statement_timeout = 0"
+
+RESET_STATEMENT_TIMEOUT_QUERY = "RESET statement_timeout"
+
+# An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index behind,
+# which IF NOT EXISTS would then keep forever
+SELECT_INVALID_INDEX_QUERY = (
+    "SELECT 1 FROM pg_index i "
+    "JOIN pg_class c ON c.oid = i.indexrelid "
+    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "WHERE n.nspname = 'xscraper' AND c.relname = %s AND NOT i.indisvalid"
+)
+
+DROP_INDEX_CONCURRENTLY_QUERY = "DROP INDEX CONCURRENTLY IF EXISTS xscraper.{}"
+
+CREATE_PARTITIONED_PLAYER_TABLE_QUERY = (
+    "CREATE TABLE xscraper.players ("
+    "player_id TEXT NOT NULL, "
+    "name TEXT NOT NULL, "
+    "name_id TEXT NOT NULL, "
+    "splashtag TEXT GENERATED ALWAYS AS (name || '#' || name_id) STORED, "
+    "rank INTEGER NOT NULL, "
+    "x_power FLOAT NOT NULL, "
+    "weapon_id INTEGER NOT NULL, "
+    "nameplate_id INTEGER, "
+    "byname TEXT, "
+    "text_color TEXT, "
+    "badge_left_id INTEGER, "
+    "badge_center_id INTEGER, "
+    "badge_right_id INTEGER, "
+    "timestamp TIMESTAMP WITH TIME ZONE NOT NULL, "
+    "mode xscraper.mode_name, "
+    "region BOOLEAN NOT NULL, "
+    "rotation_start TIMESTAMP WITH TIME ZONE, "
+    "season_number INTEGER, "
+    "updated BOOLEAN"
+    ") PARTITION BY RANGE (timestamp)"
+)
+
+# The columns of xscraper.players before profiles were split out of it
+WIDE_PLAYER_COLUMNS = (
+    "player_id, name, name_id, rank, x_power, weapon_id, nameplate_id, byname, "
+    "text_color, badge_left_id, badge_center_id, badge_right_id, timestamp, "
+    "mode, region, rotation_start, season_number, updated"
+)
+
+# Partitions for every month of the existing history and two months ahead
+CREATE_INITIAL_PLAYER_PARTITIONS_QUERY = (
+    "SELECT xscraper.ensure_player_partitions("
+    "COALESCE("
+    "(SELECT MIN(timestamp) FROM xscraper.players_unpartitioned), NOW()"
+    "), "
+    "NOW() + INTERVAL '2 months'"
+    ")"
+)
+
+LINK_PLAYER_PROFILES_QUERY = (
+    "UPDATE xscraper.players p SET profile_id = pp.profile_id "
+    "FROM xscraper.player_profiles pp "
+    "WHERE pp.profile_key = xscraper.player_profile_key("
+    "p.player_id, p.name, p.name_id, p.byname, p.text_color, p.nameplate_id, "
+    "p.badge_left_id, p.badge_center_id, p.badge_right_id"
+    ")"
+)
+
+# The as of function of migration 6, reading the profile fields from
+# xscraper.player_profiles
+PLAYERS_AS_OF_WITH_PROFILES_FUNCTION_QUERY = (
+    "CREATE OR REPLACE FUNCTION xscraper.players_as_of("
+    "as_of_mode xscraper.mode_name, "
+    "as_of_region BOOLEAN, "
+    "as_of TIMESTAMP WITH TIME ZONE"
+    ") RETURNS TABLE ("
+    "player_id TEXT, "
+    "name TEXT, "
+    "name_id TEXT, "
+    "splashtag TEXT, "
+    "rank INTEGER, "
+    "x_power FLOAT, "
+    "weapon_id INTEGER, "
+    "nameplate_id INTEGER, "
+    "byname TEXT, "
+    "text_color TEXT, "
+    "badge_left_id INTEGER, "
+    "badge_center_id INTEGER, "
+    "badge_right_id INTEGER, "
+    "timestamp TIMESTAMP WITH TIME ZONE, "
+    "mode xscraper.mode_name, "
+    "region BOOLEAN, "
+    "rotation_start TIMESTAMP WITH TIME ZONE, "
+    "season_number INTEGER, "
+    "updated BOOLEAN"
+    ") AS $$ "
+    "SELECT p.player_id, pp.name, pp.name_id, pp.splashtag, e.rank, "
+    "p.x_power, p.weapon_id, pp.nameplate_id, pp.byname, pp.text_color, "
+    "pp.badge_left_id, pp.badge_center_id, pp.badge_right_id, s.timestamp, "
+    "s.mode, s.region, s.rotation_start, s.season_number, "
+    "p.timestamp = s.timestamp "
+    "FROM ("
+    "SELECT * FROM xscraper.leaderboard_snapshots "
+    "WHERE mode = as_of_mode AND region = as_of_region AND timestamp <= as_of "
+    "ORDER BY timestamp DESC LIMIT 1"
+    ") s "
+    "CROSS JOIN LATERAL unnest(s.player_ids, s.ranks) AS e (player_id, rank) "
+    "CROSS JOIN LATERAL ("
+    "SELECT * FROM xscraper.players h "
+    "WHERE h.player_id = e.player_id AND h.mode = s.mode "
+    "AND h.region = s.region AND h.timestamp <= s.timestamp "
+    "ORDER BY h.timestamp DESC LIMIT 1"
+    ") p "
+    "JOIN xscraper.player_profiles pp ON pp.profile_id = p.profile_id "
+    "ORDER BY e.rank, p.player_id "
+    "$$ LANGUAGE sql STABLE"
+)
+
+# The as of function of migration 7, keeping the stored ``updated`` flag. With
+# full storage every player has a row at every snapshot, so the row being
+# written by the snapshot alone does not mean it changed.
+PLAYERS_AS_OF_STORED_UPDATED_FUNCTION_QUERY = (
+    "CREATE OR REPLACE FUNCTION xscraper.players_as_of("
+    "as_of_mode xscraper.mode_name, "
+    "as_of_region BOOLEAN, "
+    "as_of TIMESTAMP WITH TIME ZONE"
+    ") RETURNS TABLE ("
+    "player_id TEXT, "
+    "name TEXT, "
+    "name_id TEXT, "
+    "splashtag TEXT, "
+    "rank INTEGER, "
+    "x_power FLOAT, "
+    "weapon_id INTEGER, "
+    "nameplate_id INTEGER, "
+    "byname TEXT, "
+    "text_color TEXT, "
+    "badge_left_id INTEGER, "
+    "badge_center_id INTEGER, "
+    "badge_right_id INTEGER, "
+    "timestamp TIMESTAMP WITH TIME ZONE, "
+    "mode xscraper.mode_name, "
+    "region BOOLEAN, "
+    "rotation_start TIMESTAMP WITH TIME ZONE, "
+    "season_number INTEGER, "
+    "updated BOOLEAN"
+    ") AS $$ "
+    "SELECT p.player_id, pp.name, pp.name_id, pp.splashtag, e.rank, "
+    "p.x_power, p.weapon_id, pp.nameplate_id, pp.byname, pp.text_color, "
+    "pp.badge_left_id, pp.badge_center_id, pp.badge_right_id, s.timestamp, "
+    "s.mode, s.region, s.rotation_start, s.season_number, "
+    "p.timestamp = s.timestamp AND p.updated IS NOT FALSE "
+    "FROM ("
+    "SELECT * FROM xscraper.leaderboard_snapshots "
+    "WHERE mode = as_of_mode AND region = as_of_region AND timestamp <= as_of "
+    "ORDER BY timestamp DESC LIMIT 1"
+    ") s "
+    "CROSS JOIN LATERAL unnest(s.player_ids, s.ranks) AS e (player_id, rank) "
+    "CROSS JOIN LATERAL ("
+    "SELECT * FROM xscraper.players h "
+    "WHERE h.player_id = e.player_id AND h.mode = s.mode "
+    "AND h.region = s.region AND h.timestamp <= s.timestamp "
+    "ORDER BY h.timestamp DESC LIMIT 1"
+    ") p "
+    "JOIN xscraper.player_profiles pp ON pp.profile_id = p.profile_id "
+    "ORDER BY e.rank, p.player_id "
+    "$$ LANGUAGE sql STABLE"
+)
+
+# Migrations are append-only: once released, a migration must never change.
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(
+        1,
+        "Baseline schema",
+        (
+            ENSURE_SCHEMA_QUERY,
+            CREATE_MODE_ENUM_QUERY,
+            ENSURE_TRGM_EXTENSION_QUERY,
+            ENSURE_PLAYER_TABLE_QUERY,
+            ENSURE_PLAYER_INDEX_TIMESTAMP_QUERY,
+            ENSURE_PLAYER_INDEX_MODE_QUERY,
+            ENSURE_PLAYER_INDEX_REGION_QUERY,
+            ENSURE_PLAYER_INDEX_ROTATION_START_QUERY,
+            ENSURE_PLAYER_INDEX_SEASON_NUMBER_QUERY,
+            ENSURE_PLAYER_INDEX_MODE_TIMESTAMP_SEASON_QUERY,
+            ENSURE_PLAYERS_LATEST_TABLE_QUERY,
+            ENSURE_PLAYERS_LATEST_INDEX_MODE_TIMESTAMP_QUERY,
+            BACKFILL_PLAYERS_LATEST_QUERY,
+            ENSURE_SCHEDULE_TABLE_QUERY,
+        ),
+    ),
+    Migration(
+        2,
+        "Index the schedules table",
+        (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_schedules_start_time "
+            "ON xscraper.schedules (start_time)",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_schedules_end_time "
+            "ON xscraper.schedules (end_time)",
+        ),
+        concurrent=True,
+    ),
+    Migration(
+        3,
+        "Replace the splashtag trigger with a generated column",
+        (
+            "DROP TRIGGER IF EXISTS insert_splashtag ON xscraper.players",
+            "DROP FUNCTION IF EXISTS insert_splashtag()",
+            "DROP INDEX IF EXISTS xscraper.idx_players_splashtag_gin",
+            "ALTER TABLE xscraper.players DROP COLUMN IF EXISTS splashtag",
+            "ALTER TABLE xscraper.players ADD COLUMN splashtag TEXT "
+            "GENERATED ALWAYS AS (name || '#' || name_id) STORED",
+        ),
+    ),
+    Migration(
+        4,
+        "Index the generated splashtag column",
+        (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_players_splashtag_gin "
+            "ON xscraper.players USING GIN (splashtag gin_trgm_ops)",
+        ),
+        concurrent=True,
+    ),
+    Migration(
+        5,
+        "Partition the players table by month",
+        (
+            ENSURE_PLAYER_PARTITIONS_FUNCTION_QUERY,
+            "ALTER TABLE xscraper.players RENAME TO players_unpartitioned",
+            CREATE_PARTITIONED_PLAYER_TABLE_QUERY,
+            CREATE_INITIAL_PLAYER_PARTITIONS_QUERY,
+            f"INSERT INTO xscraper.players ({WIDE_PLAYER_COLUMNS}) "
+            f"SELECT {WIDE_PLAYER_COLUMNS} "
+            "FROM xscraper.players_unpartitioned",
+            "DROP TABLE xscraper.players_unpartitioned",
+            # Built after the copy, which is faster than maintaining them
+            "ALTER TABLE xscraper.players ADD CONSTRAINT pk_player_timestamp "
+            "PRIMARY KEY (player_id, timestamp, mode)",
+            ENSURE_PLAYER_INDEX_TIMESTAMP_QUERY,
+            ENSURE_PLAYER_INDEX_MODE_QUERY,
+            ENSURE_PLAYER_INDEX_REGION_QUERY,
+            ENSURE_PLAYER_INDEX_ROTATION_START_QUERY,
+            ENSURE_PLAYER_INDEX_SEASON_NUMBER_QUERY,
+            ENSURE_PLAYER_INDEX_MODE_TIMESTAMP_SEASON_QUERY,
+            ENSURE_PLAYER_INDEX_SPLASHTAG_QUERY,
+        ),
+    ),
+    Migration(
+        6,
+        "Record leaderboard snapshots for changes-only storage",
+        (
+            ENSURE_LEADERBOARD_SNAPSHOTS_TABLE_QUERY,
+            BACKFILL_LEADERBOARD_SNAPSHOTS_QUERY,
+            ENSURE_PLAYERS_AS_OF_FUNCTION_QUERY,
+        ),
+    ),
+    Migration(
+        7,
+        "Move the profile fields of players to a player_profiles table",
+        (
+            ENSURE_PLAYER_PROFILE_KEY_FUNCTION_QUERY,
+            ENSURE_PLAYER_PROFILES_TABLE_QUERY,
+            BACKFILL_PLAYER_PROFILES_QUERY,
+            "ALTER TABLE xscraper.players ADD COLUMN profile_id BIGINT",
+            LINK_PLAYER_PROFILES_QUERY,
+            # Takes the splashtag index along with it
+            "ALTER TABLE xscraper.players DROP COLUMN splashtag",
+            "ALTER TABLE xscraper.players "
+            "DROP COLUMN name, "
+            "DROP COLUMN name_id, "
+            "DROP COLUMN byname, "
+            "DROP COLUMN text_color, "
+            "DROP COLUMN nameplate_id, "
+            "DROP COLUMN badge_left_id, "
+            "DROP COLUMN badge_center_id, "
+            "DROP COLUMN badge_right_id, "
+            "ALTER COLUMN profile_id SET NOT NULL, "
+            "ADD CONSTRAINT fk_players_profile FOREIGN KEY (profile_id) "
+            "REFERENCES xscraper.player_profiles (profile_id)",
+            ENSURE_PLAYER_PROFILES_INDEX_PLAYER_ID_QUERY,
+            ENSURE_PLAYER_PROFILES_INDEX_SPLASHTAG_QUERY,
+            PLAYERS_AS_OF_WITH_PROFILES_FUNCTION_QUERY,
+        ),
+    ),
+    Migration(
+        8,
+        "Keep the stored updated flag in players_as_of",
+        (PLAYERS_AS_OF_STORED_UPDATED_FUNCTION_QUERY,),
+    ),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
@@ -0,0 +1,80 @@
+# The timestamp of the latest ingested cycle, one index lookup on
+# idx_players_latest_mode_timestamp per mode
+SELECT_LATEST_CYCLE_QUERY = (
+    "SELECT MAX(t.latest) "
+    "FROM unnest(enum_range(NULL::xscraper.mode_name)) AS m (mode) "
+    "CROSS JOIN LATERAL ("
+    "SELECT MAX(timestamp) AS latest FROM xscraper.players_latest l "
+    "WHERE l.mode = m.mode"
+    ") t"
+)
+
+# The snapshot is found through pk_leaderboard_snapshots and each player
+# through pk_player_timestamp
+SELECT_LEADERBOARD_QUERY = (
+    "SELECT player_id, name, name_id, rank, x_power, weapon_id, nameplate_id, "
+    "byname, text_color, badge_left_id, badge_center_id, badge_right_id, "
+    "timestamp, mode, region, rotation_start, season_number, updated "
+    "FROM xscraper.players_as_of(%s, %s, %s) "
+    "WHERE rank <= %s "
+    "ORDER BY rank, player_id"
+)
+
+# The cutoff at a rank is the lowest x_power at or above it, so ties that skip
+# the rank itself still give a value
+SELECT_CUTOFFS_QUERY = (
+    "WITH board AS ("
+    "SELECT rank, x_power FROM xscraper.players_as_of(%s, %s, %s)"
+    ") "
+    "SELECT c.rank, MIN(b.x_power) "
+    "FROM unnest(%s::INTEGER[]) AS c (rank) "
+    "JOIN board b ON b.rank <= c.rank "
+    "GROUP BY c.rank "
+    "ORDER BY c.rank"
+)
+
+# A range scan of pk_player_timestamp. With changes-only storage there is a
+# row for each change rather than for each cycle.
+SELECT_PLAYER_HISTORY_QUERY = (
+    "SELECT timestamp, mode, region, rank, x_power, weapon_id "
+    "FROM xscraper.players "
+    "WHERE player_id = %s "
+    "AND timestamp >= %s AND timestamp < %s "
+    "AND (%s IS NULL OR mode = %s) "
+    "ORDER BY timestamp, mode"
+)
+
+# Every leaderboard of the time range, rebuilt through players_as_of so the
+# players whose rows were skipped by changes-only storage are still counted
+SELECT_WEAPON_USAGE_QUERY = (
+    "SELECT b.rotation_start, b.weapon_id, COUNT(DISTINCT b.player_id) "
+    "FROM xscraper.leaderboard_snapshots s "
+    "CROSS JOIN LATERAL "
+    "xscraper.players_as_of(s.mode, s.region, s.timestamp) b "
+    "WHERE s.mode = %s AND s.region = %s "
+    "AND s.timestamp >= %s AND s.timestamp < %s "
+    "GROUP BY b.rotation_start, b.weapon_id "
+    "ORDER BY b.rotation_start, COUNT(DISTINCT b.player_id) DESC, "
+    "b.weapon_id"
+)
+
+SELECT_NEXT_CYCLES_QUERY = (
+    "SELECT DISTINCT timestamp FROM xscraper.leaderboard_snapshots "
+    "WHERE %s IS NULL OR timestamp > %s "
+    "ORDER BY timestamp "
+    "LIMIT %s"
+)
+
+# Every leaderboard of the cycles in a time range, rebuilt in full so the
+# export is the same whether rows were stored in full or as changes only
+SELECT_CYCLE_PLAYERS_QUERY = (
+    "SELECT b.player_id, b.name, b.name_id, b.rank, b.x_power, b.weapon_id, "
+    "b.nameplate_id, b.byname, b.text_color, b.badge_left_id, "
+    "b.badge_center_id, b.badge_right_id, b.timestamp, b.mode, b.region, "
+    "b.rotation_start, b.season_number, b.updated "
+    "FROM xscraper.leaderboard_snapshots s "
+    "CROSS JOIN LATERAL "
+    "xscraper.players_as_of(s.mode, s.region, s.timestamp) b "
+    "WHERE s.timestamp >= %s AND s.timestamp <= %s "
+    "ORDER BY b.timestamp, b.mode, b.region, b.rank"
+)
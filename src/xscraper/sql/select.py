@@ -20,17 +20,21 @@ SELECT_MAX_TIMESTAMP_AND_MODE_QUERY = (
 )
 
 SELECT_LATEST_PLAYER_QUERY = (
-    "WITH MaxTimestamp AS ("
-    "SELECT MAX(timestamp) AS max_timestamp "
-    "FROM xscraper.players "
+    "SELECT player_id, x_power, mode, region "
+    "FROM xscraper.players_latest "
     "WHERE mode = %s "
-    "), "
-    "FilteredByTimestamp AS ("
-    "SELECT player_id, x_power, mode "
-    "FROM xscraper.players "
-    "WHERE timestamp = (SELECT max_timestamp FROM MaxTimestamp) "
-    ") "
-    "SELECT * "
-    "FROM FilteredByTimestamp "
-    "WHERE mode = %s; "
+    "AND timestamp = ("
+    "SELECT MAX(timestamp) FROM xscraper.players_latest WHERE mode = %s"
+    ")"
+)
+
+SELECT_LATEST_TIMESTAMP_FOR_MODE_QUERY = (
+    "SELECT MAX(timestamp) FROM xscraper.players_latest WHERE mode = %s"
+)
+
+SELECT_PLAYERS_AS_OF_QUERY = (
+    "SELECT player_id, name, name_id, rank, x_power, weapon_id, nameplate_id, "
+    "byname, text_color, badge_left_id, badge_center_id, badge_right_id, "
+    "timestamp, mode, region, rotation_start, season_number, updated "
+    "FROM xscraper.players_as_of(%s, %s, %s)"
 )
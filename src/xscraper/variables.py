@@ -8,3 +8,50 @@ LOG_MAX_BYTES = 1024 * 1024  # 1MB
 LOG_BACKUP_COUNT = 5
 FAILURE_TRACKER_SIZE = 30
 FAILURE_THRESHOLD_FLOAT = 0.5
+CRAWL_MAX_WORKERS = 5
+SEASON_CACHE_TTL = dt.timedelta(hours=6)
+SHARD_ACROSS_ACCOUNTS = True
+ACCOUNT_MAX_WORKERS = 3
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_REQUESTS_PER_SECOND = 5.0
+RATE_LIMIT_BURST = 10
+RATE_LIMIT_MAX_RETRIES = 3
+RATE_LIMIT_BACKOFF = dt.timedelta(seconds=1)
+CONCURRENCY_INITIAL = 2
+CONCURRENCY_MIN = 1
+CONCURRENCY_MAX = 8
+CONCURRENCY_DECREASE_FACTOR = 0.5
+CONCURRENCY_LATENCY_TARGET = dt.timedelta(seconds=2)
+ARCHIVE_COMPRESSION = "gzip"  # "zstd" needs the zstandard package
+ARCHIVE_SEGMENT_MAX_BYTES = 64 * 1024 * 1024  # 64MB, uncompressed
+ARCHIVE_SEGMENT_MAX_AGE = dt.timedelta(hours=1)
+PIPELINE_QUEUE_SIZE = 16  # Chunks of 25 players waiting to be parsed
+PIPELINE_BATCH_SIZE = 500  # Players per insert
+FINGERPRINT_ENABLED = True
+FINGERPRINT_MAX_RECHECKS = 3  # Minutes to keep probing after an unchanged probe
+FINGERPRINT_MIN_SAMPLES = 3  # Precise refresh observations before learning
+FINGERPRINT_HISTORY_SIZE = 50
+DECODE_CACHE_SIZE = 4096
+INTERN_CACHE_SIZE = 4096
+INGEST_METHOD = "copy"  # "copy" or "values" for execute_values
+DB_POOL_MIN_SIZE = 1
+DB_POOL_MAX_SIZE = 4
+DB_POOL_TIMEOUT = dt.timedelta(seconds=30)
+DB_POOL_HEALTH_CHECK_AFTER = dt.timedelta(seconds=30)
+DB_STATEMENT_TIMEOUT = dt.timedelta(minutes=5)
+DB_CONNECT_RETRIES = 3
+SNAPSHOT_CACHE_ENABLED = True
+STORAGE_MODE = "full"  # "full" or "changes" to store only changed players
+PROFILE_CACHE_SIZE = 65536
+QUERY_CACHE_CHECK_INTERVAL = dt.timedelta(seconds=30)
+QUERY_CACHE_MAX_ENTRIES = 1024
+EXPORT_CYCLES_PER_FILE = 72  # Half a day of cycles
+EXPORT_COMPACT_MIN_FILES = 16
+PLAYER_PARTITIONS_AHEAD = 2  # Monthly partitions created ahead of time
+ROTATION_CALENDAR_REFRESH_HORIZON = dt.timedelta(hours=6)
+SPOOL_FLUSH_INTERVAL = dt.timedelta(seconds=30)
+SPOOL_MAX_FLUSH_ATTEMPTS = 3  # Before a failing segment is quarantined
+SCHEDULER_MISFIRE_POLICY = "catch_up"  # or "skip" to drop missed slots
+SCHEDULER_MISFIRE_GRACE = dt.timedelta(seconds=30)
+SCHEDULER_FOLLOWUP_DELAY = dt.timedelta(minutes=1)  # Before retries/rechecks
+METRICS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
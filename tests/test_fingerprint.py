@@ -0,0 +1,56 @@
+from collections import Counter
+
+from xscraper import constants as xc
+from xscraper.loadtest.fake import FakeQueryHandler
+from xscraper.scraper.fingerprint import fingerprint_pages, probe_first_pages
+from xscraper.scraper.scrape import stream_all_players_in_modes
+
+
+def counting_handler() -> tuple[FakeQueryHandler, Counter]:
+    scraper = FakeQueryHandler(seed=0)
+    pulls: Counter = Counter()
+    query = scraper.query
+
+    def counting_query(query_name, variables=None):
+        if query_name != xc.query:
+            pulls[variables["mode"], variables["page"]] += 1
+        return query(query_name, variables)
+
+    scraper.query = counting_query
+    return scraper, pulls
+
+
+def test_crawl_reuses_the_probed_first_pages():
+    scraper, pulls = counting_handler()
+    chunks_per_page = scraper.page_size // scraper.chunk_size
+
+    first_pages = probe_first_pages(scraper, ["Ar", "Cl"], max_workers=1)
+    assert pulls == {
+        ("Ar", 1): len(xc.regions) * chunks_per_page,
+        ("Cl", 1): len(xc.regions) * chunks_per_page,
+    }
+
+    emitted: Counter = Counter()
+    stream_all_players_in_modes(
+        scraper,
+        ["Ar"],
+        lambda region, mode, subresponse: emitted.update([(region, mode)]),
+        max_workers=1,
+        prefetched=first_pages,
+    )
+
+    # The first page of "Ar" was pulled by the probe only
+    assert pulls["Ar", 1] == len(xc.regions) * chunks_per_page
+    for page in xc.pages[1:]:
+        assert pulls["Ar", page] == len(xc.regions) * chunks_per_page
+    assert emitted == {
+        (region, "Ar"): len(xc.pages) * chunks_per_page for region in xc.regions
+    }
+
+
+def test_fingerprint_pages_is_stable():
+    scraper, _ = counting_handler()
+    first = fingerprint_pages(probe_first_pages(scraper, ["Ar"]))
+    second = fingerprint_pages(probe_first_pages(scraper, ["Ar"]))
+    assert set(first) == {("Ar", region) for region in xc.regions}
+    assert first == second
@@ -0,0 +1,45 @@
+import base64
+
+from splatnet3_scraper.query import QueryResponse
+
+from xscraper.scraper.interning import intern_string
+from xscraper.scraper.parse import parse_player_data, parse_player_node
+
+
+def encode(string: str) -> str:
+    return base64.b64encode(string.encode()).decode()
+
+
+def make_node(byname: str | None) -> dict:
+    return {
+        "id": encode("XRankingPlayer-a:7:Ar:u-qgkvm4dcrmzyaxdkvnmm"),
+        "name": "Kyo",
+        "nameId": "2916",
+        "rank": 1,
+        "xPower": 3712.4,
+        "byname": byname,
+        "weapon": {"id": encode("Weapon-2070")},
+        "nameplate": {
+            "badges": [{"id": encode("Badge-5000010")}, None, None],
+            "background": {
+                "id": encode("NameplateBackground-1"),
+                "textColor": {"r": 1.0, "g": 1.0, "b": 1.0, "a": 1.0},
+            },
+        },
+    }
+
+
+def test_intern_string_returns_shared_copy():
+    first = "".join(["Fresh ", "Squid"])
+    second = "".join(["Fresh ", "Squid"])
+    assert intern_string(first) is intern_string(second)
+
+
+def test_intern_string_keeps_none():
+    assert intern_string(None) is None
+
+
+def test_parsers_keep_none_byname():
+    node = make_node(None)
+    assert parse_player_node(node)["byname"] is None
+    assert parse_player_data(QueryResponse(make_node(None)))["byname"] is None
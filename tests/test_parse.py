@@ -0,0 +1,150 @@
+import base64
+import copy
+
+import pytest
+from splatnet3_scraper.query import QueryResponse
+
+from xscraper.scraper.parse import (
+    parse_player_batch,
+    parse_player_data,
+    parse_player_node,
+)
+
+
+def encode(string: str) -> str:
+    return base64.b64encode(string.encode()).decode()
+
+
+def make_node(**overrides) -> dict:
+    node = {
+        "id": encode("XRankingPlayer-a:7:Ar:u-qgkvm4dcrmzyaxdkvnmm"),
+        "name": "Kyo",
+        "nameId": "2916",
+        "rank": 1,
+        "xPower": 3712.4,
+        "byname": "Fresh Squid",
+        "weapon": {"id": encode("Weapon-2070"), "name": "Splat Brella"},
+        "nameplate": {
+            "badges": [
+                {"id": encode("Badge-5000010")},
+                {"id": encode("Badge-6000001")},
+                {"id": encode("Badge-1000")},
+            ],
+            "background": {
+                "id": encode("NameplateBackground-1100"),
+                "textColor": {"r": 1.0, "g": 1.0, "b": 1.0, "a": 1.0},
+            },
+        },
+    }
+    node.update(overrides)
+    return node
+
+
+def with_badges(badges: list) -> dict:
+    node = make_node()
+    node["nameplate"]["badges"] = badges
+    return node
+
+
+def with_text_color(r: float, g: float, b: float) -> dict:
+    node = make_node()
+    node["nameplate"]["background"]["textColor"] = {
+        "r": r,
+        "g": g,
+        "b": b,
+        "a": 1.0,
+    }
+    return node
+
+
+def make_player(**overrides) -> dict:
+    player = {
+        "id": "u-qgkvm4dcrmzyaxdkvnmm",
+        "name": "Kyo",
+        "name_id": "2916",
+        "rank": 1,
+        "x_power": 3712.4,
+        "weapon_id": 2070,
+        "nameplate_id": 1100,
+        "byname": "Fresh Squid",
+        "text_color": "#ffffff",
+        "badge_left_id": 5000010,
+        "badge_center_id": 6000001,
+        "badge_right_id": 1000,
+    }
+    player.update(overrides)
+    return player
+
+
+# Each node along with the player it must be parsed into, written out by hand
+# rather than taken from one of the parsers
+CASES = {
+    "full": (make_node(), make_player()),
+    "pacific": (
+        make_node(
+            id=encode("XRankingPlayer-p:7:Gl:u-a3xk7bq2mzjv4wnrdh5c"),
+            rank=500,
+            xPower=2815.0,
+        ),
+        make_player(id="u-a3xk7bq2mzjv4wnrdh5c", rank=500, x_power=2815.0),
+    ),
+    "no_badges": (
+        with_badges([]),
+        make_player(
+            badge_left_id=None, badge_center_id=None, badge_right_id=None
+        ),
+    ),
+    "one_badge": (
+        with_badges([{"id": encode("Badge-5000010")}]),
+        make_player(badge_center_id=None, badge_right_id=None),
+    ),
+    "none_badges": (
+        with_badges([None, None, None]),
+        make_player(
+            badge_left_id=None, badge_center_id=None, badge_right_id=None
+        ),
+    ),
+    "none_left_badge": (
+        with_badges([None, {"id": encode("Badge-6000001")}, None]),
+        make_player(badge_left_id=None, badge_right_id=None),
+    ),
+    "none_byname": (make_node(byname=None), make_player(byname=None)),
+    "empty_byname": (make_node(byname=""), make_player(byname="")),
+    # Each channel is truncated, not rounded, after scaling to 255
+    "color_thirds": (
+        with_text_color(1 / 3, 2 / 3, 0.0),
+        make_player(text_color="#55aa00"),
+    ),
+    "color_near_one": (
+        with_text_color(0.9999, 0.996, 0.5),
+        make_player(text_color="#fefd7f"),
+    ),
+    "color_near_zero": (
+        with_text_color(0.0039, 0.0041, 0.00001),
+        make_player(text_color="#000100"),
+    ),
+}
+
+
+@pytest.mark.parametrize(("node", "expected"), CASES.values(), ids=CASES)
+def test_parse_player_node(node, expected):
+    assert parse_player_node(node) == expected
+
+
+@pytest.mark.parametrize(("node", "expected"), CASES.values(), ids=CASES)
+def test_parse_player_data(node, expected):
+    assert parse_player_data(QueryResponse(copy.deepcopy(node))) == expected
+
+
+@pytest.mark.parametrize(("node", "expected"), CASES.values(), ids=CASES)
+def test_parse_player_batch(node, expected):
+    batch = parse_player_batch({"edges": [{"node": node}]}, "Ar")
+    assert batch.to_players() == [{**expected, "mode": "Ar"}]
+
+
+def test_none_nameplate_fails_like_parse_player_data():
+    node = make_node(nameplate=None)
+    with pytest.raises(TypeError):
+        parse_player_data(QueryResponse(copy.deepcopy(node)))
+    with pytest.raises(TypeError):
+        parse_player_node(node)
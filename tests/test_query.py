@@ -0,0 +1,76 @@
+import datetime as dt
+
+import pytest
+
+from xscraper import constants as xc
+from xscraper.query import WeaponUsage, query_cache, weapon_usage
+from xscraper.sql.query import SELECT_LATEST_CYCLE_QUERY
+
+UTC = dt.timezone.utc
+LATEST = dt.datetime(2026, 1, 1, 4, tzinfo=UTC)
+ROTATION = dt.datetime(2026, 1, 1, 2, tzinfo=UTC)
+
+
+class FakeCursor:
+    def __init__(self, conn: "FakeConnection") -> None:
+        self.conn = conn
+        self.rows: list[tuple] = []
+
+    def __enter__(self) -> "FakeCursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def execute(self, query: str, params: tuple | None = None) -> None:
+        if query == SELECT_LATEST_CYCLE_QUERY:
+            self.rows = [(LATEST,)]
+            return
+        self.conn.executed.append((query, params))
+        self.rows = self.conn.rows
+
+    def fetchone(self) -> tuple:
+        return self.rows[0]
+
+    def fetchall(self) -> list[tuple]:
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, rows: list[tuple]) -> None:
+        self.rows = rows
+        self.executed: list[tuple[str, tuple]] = []
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    query_cache.clear()
+    yield
+    query_cache.clear()
+
+
+def test_weapon_usage_reads_every_leaderboard():
+    conn = FakeConnection([(ROTATION, 40, 12), (ROTATION, 2070, 3)])
+    since = dt.datetime(2026, 1, 1, tzinfo=UTC)
+    until = dt.datetime(2026, 1, 2, tzinfo=UTC)
+
+    usage = weapon_usage(conn, "Ar", "ATLANTIC", since, until)
+
+    assert usage == (
+        WeaponUsage(ROTATION, 40, 12),
+        WeaponUsage(ROTATION, 2070, 3),
+    )
+    [(query, params)] = conn.executed
+    # Counted from the snapshots, so players without a row for the cycle
+    # under changes-only storage are included
+    assert "FROM xscraper.leaderboard_snapshots s" in query
+    assert "xscraper.players_as_of(s.mode, s.region, s.timestamp)" in query
+    assert params == (
+        xc.mode_map["Ar"],
+        xc.region_map_bool["ATLANTIC"],
+        since,
+        until,
+    )
@@ -0,0 +1,71 @@
+import datetime as dt
+
+import pytest
+
+from xscraper import constants as xc
+from xscraper.loadtest.fake import FakeQueryHandler
+from xscraper.scraper.archive import (
+    ResponseArchive,
+    begin_capture_cycle,
+    disable_capture,
+    enable_capture,
+    list_segments,
+    read_segments,
+)
+from xscraper.scraper.fingerprint import probe_first_pages
+from xscraper.scraper.replay import Replayer
+from xscraper.scraper.scrape import stream_all_players_in_modes
+
+CYCLE = dt.datetime(2026, 1, 1, 2, 5, tzinfo=dt.timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def stop_capture():
+    yield
+    disable_capture()
+
+
+def archive_cycle(directory, probed: list[str], crawled: list[str]) -> None:
+    scraper = FakeQueryHandler(seed=0)
+    enable_capture(ResponseArchive(directory, compression="gzip"))
+    begin_capture_cycle(CYCLE)
+    first_pages = probe_first_pages(scraper, probed, max_workers=1)
+    stream_all_players_in_modes(
+        scraper,
+        crawled,
+        lambda *args: None,
+        max_workers=1,
+        prefetched=first_pages,
+    )
+    disable_capture()
+
+
+def test_replay_skips_the_probes_of_an_unchanged_mode(tmp_path):
+    # Both modes are probed, but only "Ar" changed and was crawled
+    archive_cycle(tmp_path, ["Ar", "Cl"], ["Ar"])
+
+    records = list(read_segments(list_segments(tmp_path)))
+    probes = [record for record in records if record["probe"]]
+    assert {record["variables"]["mode"] for record in probes} == {"Ar", "Cl"}
+
+    replayer = Replayer()
+    counts = replayer.replay(records)
+
+    page_size = FakeQueryHandler().page_size
+    assert counts["cycles"] == 1
+    assert counts["probes"] == len(probes)
+    # Every page of both regions of "Ar", with the probed first page not
+    # counted a second time
+    assert counts["players"] == len(xc.regions) * len(xc.pages) * page_size
+    assert set(replayer.previous) == {xc.mode_map["Ar"]}
+
+
+def test_replay_skips_a_cycle_that_was_only_probed(tmp_path):
+    archive_cycle(tmp_path, ["Cl"], [])
+
+    replayer = Replayer()
+    counts = replayer.replay(read_segments(list_segments(tmp_path)))
+
+    assert counts["players"] == 0
+    assert counts["cycles"] == 0
+    assert replayer.previous == {}